@@ -1,17 +1,34 @@
-from fastapi import FastAPI, Depends, HTTPException, Query, UploadFile, File, Form, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Response, UploadFile, File, Form, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import and_, or_, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 from datetime import date, datetime, timedelta
-from typing import Optional, List
-import re, os, shutil
-from PIL import Image
+from typing import Optional, List, Union
+import re, os, json, base64, codecs, logging
 
-from database import get_db, init_db
-from models import Aluno, Turma, User, Responsavel, Nota
+from database import get_db, get_async_db, init_db, SessionLocal, AsyncSessionLocal, async_engine, fechar_sessao, retry_on_lock, retry_on_lock_async, pool_status
+from models import Aluno, Turma, User, Responsavel, Nota, TurmaLotadaError, ajustar_estatisticas
 from schemas import *
-from security import verify_password, get_password_hash, create_access_token, validate_password
-from dependencies import get_current_user, get_current_admin
+from security import verify_password_async, verify_and_update_password_async, get_password_hash_async, create_access_token, validate_password, shutdown_hash_pool, hash_queue_stats
+from dependencies import get_current_user, get_current_user_async, get_current_admin, get_read_db, get_read_db_async
+from leitura import iniciar_snapshot_leitura, parar_snapshot_leitura, fechar_leitura_async
+from instrumentacao import InstrumentacaoSQL, orcamento_consultas
+from metricas import MetricasHTTP, METRICS_TOKEN, gerar_metricas
+from consultas_lentas import listar_consultas_lentas, limpar_consultas_lentas
+from cache import user_cache, invalidar_usuario
+from search import busca_comum, consulta_busca, fts_habilitado, montar_consulta_fts
+from estatisticas import ler_totais, ler_totais_async, obter_totais, recalcular_estatisticas, reconciliar_contadores
+from importacao import importar_alunos_csv
+from matriculas import aplicar_matriculas, distribuir_alunos, MatriculaLoteError
+from miniaturas import agendar_miniaturas, shutdown_miniaturas, variantes_prontas
+from imagens import CACHE_IMUTAVEL, CORPO_UPLOAD_IMAGEM, ArquivosEstaticos, ImagemRecebida, armazenar_imagem, receber_imagem
+from redimensionamento import IMG_FORMATOS, garantir_redimensionada, largura_servida, localizar_redimensionada
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 
 # Criar aplicação FastAPI
 app = FastAPI(title="Sistema de Gestão Escolar - Thales de Tarsis", version="2.0.0")
@@ -25,14 +42,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Conta as consultas SQL de cada requisição (cabeçalho Server-Timing, N+1 e orçamento por rota)
+app.add_middleware(InstrumentacaoSQL)
+# Contagem e latência por rota para GET /metrics (mais externo: mede a requisição inteira)
+app.add_middleware(MetricasHTTP)
+
+# Estratégias de carregamento do Aluno (evitam N+1 ao serializar)
+CARREGAR_TURMA = joinedload(Aluno.turma)
+CARREGAR_DETALHES = (
+    joinedload(Aluno.turma),
+    selectinload(Aluno.responsaveis),
+    selectinload(Aluno.notas),
+)
+
+# Paginação de alunos
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 500
+
+# Notas por comando INSERT no lançamento em lote
+NOTAS_LOTE_CHUNK = 500
+
 # Servir arquivos estáticos (uploads)
 os.makedirs("uploads", exist_ok=True)
-app.mount("/static", StaticFiles(directory="uploads"), name="static")
+app.mount("/static", ArquivosEstaticos(directory="uploads"), name="static")
 
 # Evento de inicialização
 @app.on_event("startup")
 def startup_event():
     init_db()
+    iniciar_snapshot_leitura()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    shutdown_hash_pool()
+    # Espera as miniaturas agendadas terminarem: fora do event loop
+    await run_in_threadpool(shutdown_miniaturas)
+    await run_in_threadpool(parar_snapshot_leitura)
+    await fechar_leitura_async()
+    await async_engine.dispose()
 
 # Helper functions
 def calcular_idade(data_nascimento: date) -> int:
@@ -42,47 +89,91 @@ def calcular_idade(data_nascimento: date) -> int:
         idade -= 1
     return idade
 
-def save_upload_file(file: UploadFile, directory: str, filename: str) -> str:
-    """Salva arquivo de upload e retorna o caminho"""
-    os.makedirs(directory, exist_ok=True)
-    file_path = os.path.join(directory, filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    return file_path
+def aluno_para_dict(aluno: Aluno, turma_nome: Optional[str]) -> dict:
+    """Monta os campos de AlunoResponse a partir do modelo e do nome da turma"""
+    return {
+        "id": aluno.id,
+        "nome": aluno.nome,
+        "data_nascimento": aluno.data_nascimento,
+        "email": aluno.email,
+        "status": aluno.status,
+        "turma_id": aluno.turma_id,
+        "telefone": aluno.telefone,
+        "telefone_emergencia": aluno.telefone_emergencia,
+        "endereco_rua": aluno.endereco_rua,
+        "endereco_numero": aluno.endereco_numero,
+        "endereco_complemento": aluno.endereco_complemento,
+        "endereco_bairro": aluno.endereco_bairro,
+        "endereco_cidade": aluno.endereco_cidade,
+        "endereco_estado": aluno.endereco_estado,
+        "endereco_cep": aluno.endereco_cep,
+        "foto_url": aluno.foto_url,
+        "foto_variantes": aluno.foto_variantes,
+        "observacoes": aluno.observacoes,
+        "data_criacao": aluno.data_criacao,
+        "data_atualizacao": aluno.data_atualizacao,
+        "turma_nome": turma_nome,
+        "idade": calcular_idade(aluno.data_nascimento)
+    }
 
-def validate_image_file(file: UploadFile) -> bool:
-    """Valida se o arquivo é uma imagem válida"""
-    if not file.content_type or not file.content_type.startswith('image/'):
-        return False
-    
-    allowed_types = ['image/jpeg', 'image/png', 'image/jpg']
-    if file.content_type not in allowed_types:
-        return False
-    
-    # Verificar tamanho (2MB máximo)
-    file.file.seek(0, 2)  # Vai para o final do arquivo
-    file_size = file.file.tell()
-    file.file.seek(0)  # Volta para o início
-    
-    max_size = 2 * 1024 * 1024  # 2MB
-    if file_size > max_size:
-        return False
-    
-    return True
+def insert_upsert(modelo, db: Session):
+    """insert() do dialeto em uso, com suporte a ON CONFLICT DO UPDATE"""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(modelo)
+    return sqlite.insert(modelo)
+
+def codificar_cursor(*chave) -> str:
+    """Gera cursor opaco (base64 url-safe) a partir da chave de ordenação do último registro"""
+    raw = json.dumps(list(chave), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decodificar_cursor(cursor: str, tamanho: int) -> list:
+    """Lê a chave de ordenação de um cursor gerado por codificar_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        chave = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(chave, list) or len(chave) != tamanho:
+            raise ValueError("Cursor com formato inesperado")
+        *prefixo, aluno_id = chave
+        return [*prefixo, int(aluno_id)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def filtro_keyset(colunas: list, valores: list):
+    """Condição (colunas) > (valores) em ordem lexicográfica"""
+    coluna, valor = colunas[0], valores[0]
+    if len(colunas) == 1:
+        return coluna > valor
+    return or_(coluna > valor, and_(coluna == valor, filtro_keyset(colunas[1:], valores[1:])))
+
+def stream_alunos(stmt, bind):
+    """Gera uma linha JSON por aluno, lendo o resultado em lotes
+
+    Usa uma sessão própria (no mesmo banco da requisição), aberta enquanto a resposta é enviada.
+    """
+    with Session(bind, expire_on_commit=False) as db:
+        for aluno, turma_nome, *_ in db.execute(stmt.execution_options(yield_per=STREAM_BATCH_SIZE)):
+            yield AlunoResponse(**aluno_para_dict(aluno, turma_nome)).json() + "\n"
+
+async def stream_alunos_async(stmt, bind):
+    """Versão de stream_alunos para as rotas async (bind: AsyncEngine)"""
+    async with AsyncSession(bind, expire_on_commit=False) as db:
+        resultado = await db.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for aluno, turma_nome, *_ in resultado:
+            yield AlunoResponse(**aluno_para_dict(aluno, turma_nome)).json() + "\n"
 
 # ===== ROTAS DE AUTENTICAÇÃO =====
 
 @app.post("/auth/register", response_model=Token, status_code=201)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+@retry_on_lock_async
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Registra um novo usuário"""
     # Verificar se username já existe
-    if db.query(User).filter(User.username == user_data.username.lower()).first():
+    if await db.scalar(select(User.id).where(User.username == user_data.username.lower()).limit(1)):
         raise HTTPException(status_code=400, detail="Username já está em uso")
     
     # Verificar se email já existe
-    if db.query(User).filter(User.email == user_data.email).first():
+    if await db.scalar(select(User.id).where(User.email == user_data.email).limit(1)):
         raise HTTPException(status_code=400, detail="Email já está em uso")
     
     # Validar senha
@@ -90,11 +181,13 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=422, detail="Senha não atende aos critérios de segurança")
     
     # Primeiro usuário criado é admin
-    total_users = db.query(User).count()
+    total_users = await db.scalar(select(func.count(User.id)))
     role = "admin" if total_users == 0 else "user"
+    # A conexão volta ao pool enquanto o bcrypt roda (a espera na fila pode levar segundos)
+    await db.close()
     
-    # Criar usuário
-    password_hash = get_password_hash(user_data.password)
+    # Criar usuário (o bcrypt roda no pool de processos; a rota só espera o resultado)
+    password_hash = await get_password_hash_async(user_data.password)
     db_user = User(
         username=user_data.username.lower(),
         email=user_data.email,
@@ -103,8 +196,8 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     # Criar token
     access_token = create_access_token(data={"sub": str(db_user.id)})
@@ -118,19 +211,38 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
 
 @app.post("/auth/login", response_model=Token)
-def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
+@retry_on_lock_async
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Autentica usuário e retorna token"""
     # Buscar por username ou email
-    user = db.query(User).filter(
+    user = await db.scalar(select(User).where(
         (User.username == user_credentials.username_or_email.lower()) |
         (User.email == user_credentials.username_or_email)
-    ).first()
+    ).limit(1))
     
-    if not user or not verify_password(user_credentials.password, user.password_hash):
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Credenciais inválidas"
         )
+    # A conexão volta ao pool enquanto o bcrypt roda: sem isso, logins esperando a fila
+    # do bcrypt esgotam o pool assíncrono e travam as rotas de leitura em /async
+    await db.close()
+    
+    senha_valida, novo_hash = await verify_and_update_password_async(user_credentials.password, user.password_hash)
+    if not senha_valida:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Credenciais inválidas"
+        )
+    
+    # Hash gerado com outro custo do bcrypt: regrava com a configuração atual
+    if novo_hash:
+        await db.execute(
+            update(User).where(User.id == user.id).values(password_hash=novo_hash, updated_at=datetime.utcnow())
+        )
+        await db.commit()
+        invalidar_usuario(user.id)
     
     # Criar token
     access_token = create_access_token(data={"sub": str(user.id)})
@@ -144,11 +256,13 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
     )
 
 @app.get("/auth/me", response_model=UserOut)
+@orcamento_consultas(1)
 def get_current_user_info(current_user: User = Depends(get_current_user)):
     """Retorna informações do usuário atual"""
     return UserOut.from_orm(current_user)
 
 @app.put("/auth/me", response_model=UserOut)
+@retry_on_lock
 def update_profile(user_data: UserUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Atualiza perfil do usuário atual"""
     # Atualizar campos fornecidos
@@ -158,14 +272,18 @@ def update_profile(user_data: UserUpdate, current_user: User = Depends(get_curre
     current_user.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(current_user)
+    invalidar_usuario(current_user.id)
     
     return UserOut.from_orm(current_user)
 
 @app.patch("/auth/me/password")
-def change_password(password_data: UserPasswordChange, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+@retry_on_lock_async
+async def change_password(password_data: UserPasswordChange, current_user: User = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
     """Altera senha do usuário atual"""
+    # Usuário carregado sem cache segura uma conexão: devolve ao pool antes do bcrypt
+    await db.close()
     # Verificar senha atual
-    if not verify_password(password_data.current_password, current_user.password_hash):
+    if not await verify_password_async(password_data.current_password, current_user.password_hash):
         raise HTTPException(status_code=400, detail="Senha atual incorreta")
     
     # Validar nova senha
@@ -173,138 +291,166 @@ def change_password(password_data: UserPasswordChange, current_user: User = Depe
         raise HTTPException(status_code=422, detail="Nova senha não atende aos critérios de segurança")
     
     # Atualizar senha
-    current_user.password_hash = get_password_hash(password_data.new_password)
-    current_user.updated_at = datetime.utcnow()
-    db.commit()
+    # O usuário pode vir do cache (fora da sessão): grava com UPDATE direto
+    user_id = current_user.id
+    password_hash = await get_password_hash_async(password_data.new_password)
+    await db.execute(
+        update(User).where(User.id == user_id).values(password_hash=password_hash, updated_at=datetime.utcnow())
+    )
+    await db.commit()
+    invalidar_usuario(user_id)
     
     return {"message": "Senha alterada com sucesso"}
 
-@app.post("/auth/me/photo")
+@app.post("/auth/me/photo", openapi_extra=CORPO_UPLOAD_IMAGEM)
 def upload_profile_photo(
-    file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
+    imagem: ImagemRecebida = Depends(receber_imagem),
     db: Session = Depends(get_db)
 ):
-    """Upload da foto de perfil do usuário"""
-    if not validate_image_file(file):
-        raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem PNG ou JPEG de até 2MB")
+    """Upload da foto de perfil do usuário (validada durante o envio)"""
+    # Salvar arquivo pelo hash do conteúdo (foto repetida reaproveita o arquivo e as miniaturas)
+    file_path, url = armazenar_imagem(imagem)
     
-    # Determinar extensão
-    extension = file.filename.split('.')[-1].lower() if '.' in file.filename else 'jpg'
-    filename = f"user_{current_user.id}.{extension}"
-    
-    # Salvar arquivo
-    file_path = save_upload_file(file, "uploads/users", filename)
-    
-    # Redimensionar imagem
-    try:
-        with Image.open(file_path) as img:
-            img.thumbnail((300, 300), Image.Resampling.LANCZOS)
-            img.save(file_path, optimize=True, quality=85)
-    except Exception:
-        # Se falhar, manter original
-        pass
-    
-    # Atualizar usuário
-    current_user.profile_photo = f"/static/users/{filename}"
+    # Atualizar usuário; as miniaturas que faltarem são geradas em segundo plano
+    current_user.profile_photo = url
+    current_user.profile_photo_variantes = variantes_prontas(url, file_path)
     current_user.updated_at = datetime.utcnow()
     db.commit()
+    invalidar_usuario(current_user.id)
+    if current_user.profile_photo_variantes is None:
+        agendar_miniaturas("usuario", current_user.id, url, file_path)
     
     return {"message": "Foto de perfil atualizada com sucesso", "photo_url": current_user.profile_photo}
 
 # ===== ROTAS - ALUNOS (ATUALIZADAS) =====
 
-@app.get("/alunos", response_model=List[AlunoResponse])
-def listar_alunos(
-    search: str = Query("", description="Buscar por nome do aluno"),
-    turma_id: Optional[int] = Query(None, description="Filtrar por turma"),
-    status: Optional[str] = Query(None, description="Filtrar por status"),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+def consulta_fts_da_busca(search: str) -> Optional[str]:
+    """Consulta FTS5 do texto buscado (None sem busca, sem índice ou sem palavras)"""
+    return montar_consulta_fts(search) if search and fts_habilitado() else None
+
+def montar_consulta_alunos(
+    search: str, consulta_fts: Optional[str], por_relevancia: bool,
+    turma_id: Optional[int], status: Optional[str], limit: Optional[int], cursor: Optional[str], stream: bool
 ):
-    """Lista alunos com filtros opcionais"""
-    query = db.query(Aluno)
-    
-    if search:
-        query = query.filter(Aluno.nome.ilike(f"%{search}%"))
+    """SELECT da listagem de alunos (filtros, busca, ordem e cursor), comum às rotas sync e async
+
+    consulta_fts vem de consulta_fts_da_busca e por_relevancia de search.busca_comum (que
+    consulta o banco, por isso fica com a rota). Sem stream e com limit, a consulta ainda não
+    tem LIMIT: a rota pede limit + 1 linhas para saber se existe próxima página (pagina_alunos).
+    """
+    query = select(Aluno, Turma.nome).outerjoin(Turma, Aluno.turma_id == Turma.id)
+    ordem = [Aluno.nome, Aluno.id]
+    filtros = []
+    busca = None
+    
+    if consulta_fts:
+        # Busca pelo índice FTS5, mais relevantes primeiro (o id desempata)
+        busca = consulta_busca(consulta_fts, por_relevancia)
+        ordem = [busca.selected_columns.relevancia, busca.selected_columns.id]
+    elif search:
+        filtros.append(Aluno.nome.ilike(f"%{search}%"))
     
     if turma_id is not None:
-        query = query.filter(Aluno.turma_id == turma_id)
+        filtros.append(Aluno.turma_id == turma_id)
     
     if status:
         if status not in ['ativo', 'inativo']:
             raise HTTPException(status_code=400, detail="Status deve ser 'ativo' ou 'inativo'")
-        query = query.filter(Aluno.status == status)
-    
-    alunos = query.all()
-    
-    # Converter para response model
-    alunos_response = []
-    for aluno in alunos:
-        aluno_dict = {
-            "id": aluno.id,
-            "nome": aluno.nome,
-            "data_nascimento": aluno.data_nascimento,
-            "email": aluno.email,
-            "status": aluno.status,
-            "turma_id": aluno.turma_id,
-            "telefone": aluno.telefone,
-            "telefone_emergencia": aluno.telefone_emergencia,
-            "endereco_rua": aluno.endereco_rua,
-            "endereco_numero": aluno.endereco_numero,
-            "endereco_complemento": aluno.endereco_complemento,
-            "endereco_bairro": aluno.endereco_bairro,
-            "endereco_cidade": aluno.endereco_cidade,
-            "endereco_estado": aluno.endereco_estado,
-            "endereco_cep": aluno.endereco_cep,
-            "foto_url": aluno.foto_url,
-            "observacoes": aluno.observacoes,
-            "data_criacao": aluno.data_criacao,
-            "data_atualizacao": aluno.data_atualizacao,
-            "turma_nome": aluno.turma.nome if aluno.turma else None,
-            "idade": calcular_idade(aluno.data_nascimento)
-        }
-        alunos_response.append(AlunoResponse(**aluno_dict))
-    
-    return alunos_response
+        filtros.append(Aluno.status == status)
+    
+    # Keyset na ordenação: a próxima página começa logo após o último aluno entregue
+    if cursor:
+        chave = decodificar_cursor(cursor, len(ordem))
+    
+    if busca is not None:
+        # Ordem, cursor e LIMIT ficam na consulta ao índice: das milhares de linhas que
+        # casam com um sobrenome comum, só a página é juntada com turmas (e com alunos,
+        # além do necessário para os filtros)
+        if filtros:
+            busca = busca.join(Aluno, Aluno.id == ordem[1]).where(*filtros)
+        if cursor:
+            busca = busca.where(filtro_keyset(ordem, chave))
+        busca = busca.order_by(*ordem)
+        if limit is not None:
+            busca = busca.limit(limit if stream else limit + 1)
+        busca = busca.subquery("busca")
+        query = query.join(busca, busca.c.id == Aluno.id).add_columns(busca.c.relevancia)
+        ordem = [busca.c.relevancia, busca.c.id]
+    else:
+        if cursor:
+            filtros.append(filtro_keyset(ordem, chave))
+        query = query.where(*filtros)
+    
+    query = query.order_by(*ordem)
+    if stream and limit is not None:
+        query = query.limit(limit)
+    return query
+
+def pagina_alunos(rows: list, limit: int) -> AlunoPagina:
+    """Monta a página a partir de até limit + 1 linhas (a linha a mais indica a próxima página)"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        ultimo, _, *relevancia = rows[-1]
+        next_cursor = codificar_cursor(*relevancia, ultimo.id) if relevancia else codificar_cursor(ultimo.nome, ultimo.id)
+    
+    return AlunoPagina(
+        items=[AlunoResponse(**aluno_para_dict(aluno, turma_nome)) for aluno, turma_nome, *_ in rows],
+        next_cursor=next_cursor
+    )
+
+@app.get("/alunos", response_model=Union[List[AlunoResponse], AlunoPagina])
+@fechar_sessao
+@orcamento_consultas(3)
+def listar_alunos(
+    response: Response,
+    search: str = Query("", description="Buscar por nome do aluno (sem acentos, por prefixo de palavras)"),
+    turma_id: Optional[int] = Query(None, description="Filtrar por turma"),
+    status: Optional[str] = Query(None, description="Filtrar por status"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Tamanho da página (ativa a paginação por cursor)"),
+    cursor: Optional[str] = Query(None, description="Cursor retornado em next_cursor pela página anterior"),
+    stream: bool = Query(False, description="Envia os alunos em NDJSON à medida que são lidos"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Lista alunos com filtros opcionais, paginação por cursor e modo streaming"""
+    consulta_fts = consulta_fts_da_busca(search)
+    # Termos muito comuns são listados por id: relevância de milhares de linhas custa caro
+    por_relevancia = consulta_fts is not None and not busca_comum(db, consulta_fts)
+    query = montar_consulta_alunos(search, consulta_fts, por_relevancia, turma_id, status, limit, cursor, stream)
+    
+    if stream:
+        # Resposta própria: repassa os cabeçalhos X-Read-* definidos por get_read_db
+        cabecalhos = {k: v for k, v in response.headers.items() if k.startswith("x-read-")}
+        return StreamingResponse(stream_alunos(query, db.bind), media_type="application/x-ndjson", headers=cabecalhos)
+    
+    if limit is None:
+        rows = db.execute(query).all()
+        return [AlunoResponse(**aluno_para_dict(aluno, turma_nome)) for aluno, turma_nome, *_ in rows]
+    
+    # Busca um registro a mais para saber se existe próxima página
+    return pagina_alunos(db.execute(query.limit(limit + 1)).all(), limit)
 
 @app.get("/alunos/{aluno_id}", response_model=AlunoDetalhado)
-def obter_aluno_detalhado(aluno_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+@fechar_sessao
+@orcamento_consultas(4)
+def obter_aluno_detalhado(aluno_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
     """Obtém dados detalhados de um aluno incluindo responsáveis e notas"""
-    aluno = db.query(Aluno).filter(Aluno.id == aluno_id).first()
+    resultado = db.execute(select(Aluno).options(*CARREGAR_DETALHES).where(Aluno.id == aluno_id))
+    aluno = resultado.unique().scalar_one_or_none()
     if not aluno:
         raise HTTPException(status_code=404, detail="Aluno não encontrado")
     
-    # Montar dados básicos
-    aluno_dict = {
-        "id": aluno.id,
-        "nome": aluno.nome,
-        "data_nascimento": aluno.data_nascimento,
-        "email": aluno.email,
-        "status": aluno.status,
-        "turma_id": aluno.turma_id,
-        "telefone": aluno.telefone,
-        "telefone_emergencia": aluno.telefone_emergencia,
-        "endereco_rua": aluno.endereco_rua,
-        "endereco_numero": aluno.endereco_numero,
-        "endereco_complemento": aluno.endereco_complemento,
-        "endereco_bairro": aluno.endereco_bairro,
-        "endereco_cidade": aluno.endereco_cidade,
-        "endereco_estado": aluno.endereco_estado,
-        "endereco_cep": aluno.endereco_cep,
-        "foto_url": aluno.foto_url,
-        "observacoes": aluno.observacoes,
-        "data_criacao": aluno.data_criacao,
-        "data_atualizacao": aluno.data_atualizacao,
-        "turma_nome": aluno.turma.nome if aluno.turma else None,
-        "idade": calcular_idade(aluno.data_nascimento),
-        "responsaveis": [ResponsavelOut.from_orm(r) for r in aluno.responsaveis],
-        "notas": [NotaOut.from_orm(n) for n in aluno.notas]
-    }
+    aluno_dict = aluno_para_dict(aluno, aluno.turma.nome if aluno.turma else None)
+    aluno_dict["responsaveis"] = [ResponsavelOut.from_orm(r) for r in aluno.responsaveis]
+    aluno_dict["notas"] = [NotaOut.from_orm(n) for n in aluno.notas]
     
     return AlunoDetalhado(**aluno_dict)
 
 @app.post("/alunos", response_model=AlunoResponse, status_code=201)
+@retry_on_lock
+@orcamento_consultas(6)
 def criar_aluno(aluno: AlunoCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Cria um novo aluno"""
     try:
@@ -314,44 +460,27 @@ def criar_aluno(aluno: AlunoCreate, current_user: User = Depends(get_current_use
             if not turma:
                 raise HTTPException(status_code=404, detail="Turma não encontrada")
             
-            # Verificar capacidade da turma
-            alunos_na_turma = db.query(Aluno).filter(Aluno.turma_id == aluno.turma_id).count()
-            if alunos_na_turma >= turma.capacidade:
+            # Checagem rápida; a vaga é reservada de forma atômica no flush
+            if turma.alunos_count >= turma.capacidade:
                 raise HTTPException(status_code=400, detail="Turma já está na capacidade máxima")
         
         # Criar aluno
         db_aluno = Aluno(**aluno.dict())
         db.add(db_aluno)
+        db.flush()
+        novo_id = db_aluno.id
         db.commit()
-        db.refresh(db_aluno)
         
-        # Retornar response
-        aluno_dict = {
-            "id": db_aluno.id,
-            "nome": db_aluno.nome,
-            "data_nascimento": db_aluno.data_nascimento,
-            "email": db_aluno.email,
-            "status": db_aluno.status,
-            "turma_id": db_aluno.turma_id,
-            "telefone": db_aluno.telefone,
-            "telefone_emergencia": db_aluno.telefone_emergencia,
-            "endereco_rua": db_aluno.endereco_rua,
-            "endereco_numero": db_aluno.endereco_numero,
-            "endereco_complemento": db_aluno.endereco_complemento,
-            "endereco_bairro": db_aluno.endereco_bairro,
-            "endereco_cidade": db_aluno.endereco_cidade,
-            "endereco_estado": db_aluno.endereco_estado,
-            "endereco_cep": db_aluno.endereco_cep,
-            "foto_url": db_aluno.foto_url,
-            "observacoes": db_aluno.observacoes,
-            "data_criacao": db_aluno.data_criacao,
-            "data_atualizacao": db_aluno.data_atualizacao,
-            "turma_nome": db_aluno.turma.nome if db_aluno.turma else None,
-            "idade": calcular_idade(db_aluno.data_nascimento)
-        }
+        # Recarrega o aluno já com a turma (uma única consulta)
+        db_aluno = db.query(Aluno).options(CARREGAR_TURMA).filter(Aluno.id == novo_id).one()
         
-        return AlunoResponse(**aluno_dict)
+        return AlunoResponse(**aluno_para_dict(db_aluno, db_aluno.turma.nome if db_aluno.turma else None))
         
+    except TurmaLotadaError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Turma já está na capacidade máxima")
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
@@ -359,6 +488,8 @@ def criar_aluno(aluno: AlunoCreate, current_user: User = Depends(get_current_use
         raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
 
 @app.put("/alunos/{aluno_id}", response_model=AlunoResponse)
+@retry_on_lock
+@orcamento_consultas(6)
 def atualizar_aluno(aluno_id: int, aluno: AlunoUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Atualiza um aluno existente"""
     try:
@@ -372,10 +503,9 @@ def atualizar_aluno(aluno_id: int, aluno: AlunoUpdate, current_user: User = Depe
             if not turma:
                 raise HTTPException(status_code=404, detail="Turma não encontrada")
             
-            # Verificar capacidade da turma (só se mudou de turma)
+            # Checagem rápida (só se mudou de turma); a vaga é reservada de forma atômica no flush
             if db_aluno.turma_id != aluno.turma_id:
-                alunos_na_turma = db.query(Aluno).filter(Aluno.turma_id == aluno.turma_id).count()
-                if alunos_na_turma >= turma.capacidade:
+                if turma.alunos_count >= turma.capacidade:
                     raise HTTPException(status_code=400, detail="Turma já está na capacidade máxima")
         
         # Atualizar campos
@@ -384,35 +514,17 @@ def atualizar_aluno(aluno_id: int, aluno: AlunoUpdate, current_user: User = Depe
         
         db_aluno.data_atualizacao = datetime.utcnow()
         db.commit()
-        db.refresh(db_aluno)
         
-        # Retornar response
-        aluno_dict = {
-            "id": db_aluno.id,
-            "nome": db_aluno.nome,
-            "data_nascimento": db_aluno.data_nascimento,
-            "email": db_aluno.email,
-            "status": db_aluno.status,
-            "turma_id": db_aluno.turma_id,
-            "telefone": db_aluno.telefone,
-            "telefone_emergencia": db_aluno.telefone_emergencia,
-            "endereco_rua": db_aluno.endereco_rua,
-            "endereco_numero": db_aluno.endereco_numero,
-            "endereco_complemento": db_aluno.endereco_complemento,
-            "endereco_bairro": db_aluno.endereco_bairro,
-            "endereco_cidade": db_aluno.endereco_cidade,
-            "endereco_estado": db_aluno.endereco_estado,
-            "endereco_cep": db_aluno.endereco_cep,
-            "foto_url": db_aluno.foto_url,
-            "observacoes": db_aluno.observacoes,
-            "data_criacao": db_aluno.data_criacao,
-            "data_atualizacao": db_aluno.data_atualizacao,
-            "turma_nome": db_aluno.turma.nome if db_aluno.turma else None,
-            "idade": calcular_idade(db_aluno.data_nascimento)
-        }
+        # Recarrega o aluno já com a turma (uma única consulta)
+        db_aluno = db.query(Aluno).options(CARREGAR_TURMA).filter(Aluno.id == aluno_id).one()
         
-        return AlunoResponse(**aluno_dict)
+        return AlunoResponse(**aluno_para_dict(db_aluno, db_aluno.turma.nome if db_aluno.turma else None))
         
+    except TurmaLotadaError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Turma já está na capacidade máxima")
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
@@ -420,6 +532,7 @@ def atualizar_aluno(aluno_id: int, aluno: AlunoUpdate, current_user: User = Depe
         raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
 
 @app.delete("/alunos/{aluno_id}")
+@retry_on_lock
 def excluir_aluno(aluno_id: int, current_user: User = Depends(get_current_admin), db: Session = Depends(get_db)):
     """Exclui um aluno (apenas admin)"""
     db_aluno = db.query(Aluno).filter(Aluno.id == aluno_id).first()
@@ -434,47 +547,94 @@ def excluir_aluno(aluno_id: int, current_user: User = Depends(get_current_admin)
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Erro ao excluir aluno: {str(e)}")
 
-@app.post("/alunos/{aluno_id}/foto")
+@app.post("/alunos/importar")
+def importar_alunos(
+    file: UploadFile = File(...),
+    encoding: Optional[str] = Query(None, description="Codificação do CSV (ex.: utf-8, cp1252); padrão: UTF-8 ou, se inválido, cp1252"),
+    current_user: User = Depends(get_current_admin)
+):
+    """Importa alunos de um CSV em blocos (apenas admin), enviando o progresso em NDJSON"""
+    if not file.filename or not file.filename.lower().endswith(".csv"):
+        raise HTTPException(status_code=400, detail="Arquivo deve ser um CSV")
+    if encoding:
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            raise HTTPException(status_code=400, detail=f"Codificação desconhecida: {encoding}")
+    
+    def eventos():
+        # Sessão própria: a importação continua depois que a rota retorna
+        db = SessionLocal()
+        try:
+            for evento in importar_alunos_csv(file.file, db, encoding):
+                yield json.dumps(evento, ensure_ascii=False, default=str) + "\n"
+        finally:
+            db.close()
+    
+    return StreamingResponse(eventos(), media_type="application/x-ndjson")
+
+@app.post("/alunos/{aluno_id}/foto", openapi_extra=CORPO_UPLOAD_IMAGEM)
 def upload_aluno_foto(
     aluno_id: int,
-    file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
+    imagem: ImagemRecebida = Depends(receber_imagem),
     db: Session = Depends(get_db)
 ):
-    """Upload da foto do aluno"""
+    """Upload da foto do aluno (validada durante o envio)"""
     aluno = db.query(Aluno).filter(Aluno.id == aluno_id).first()
     if not aluno:
         raise HTTPException(status_code=404, detail="Aluno não encontrado")
     
-    if not validate_image_file(file):
-        raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem PNG ou JPEG de até 2MB")
-    
-    # Determinar extensão
-    extension = file.filename.split('.')[-1].lower() if '.' in file.filename else 'jpg'
-    filename = f"aluno_{aluno_id}.{extension}"
-    
-    # Salvar arquivo
-    file_path = save_upload_file(file, "uploads/alunos", filename)
+    # Salvar arquivo pelo hash do conteúdo (foto repetida reaproveita o arquivo e as miniaturas)
+    file_path, url = armazenar_imagem(imagem)
     
-    # Redimensionar imagem
-    try:
-        with Image.open(file_path) as img:
-            img.thumbnail((400, 400), Image.Resampling.LANCZOS)
-            img.save(file_path, optimize=True, quality=85)
-    except Exception:
-        # Se falhar, manter original
-        pass
-    
-    # Atualizar aluno
-    aluno.foto_url = f"/static/alunos/{filename}"
+    # Atualizar aluno; as miniaturas que faltarem são geradas em segundo plano
+    aluno.foto_url = url
+    aluno.foto_variantes = variantes_prontas(url, file_path)
     aluno.data_atualizacao = datetime.utcnow()
     db.commit()
+    if aluno.foto_variantes is None:
+        agendar_miniaturas("aluno", aluno_id, url, file_path)
     
     return {"message": "Foto do aluno atualizada com sucesso", "foto_url": aluno.foto_url}
 
+@app.get("/img/alunos/{aluno_id}")
+@orcamento_consultas(1)
+def imagem_aluno(
+    aluno_id: int,
+    w: int = Query(160, ge=1, le=4000, description="Largura em px (arredondada para a próxima largura servida)"),
+    fmt: str = Query("webp", pattern=f"^({'|'.join(IMG_FORMATOS)})$", description="Formato: webp ou jpeg"),
+    v: str = Query(..., min_length=1, max_length=64, description="Hash da foto (nome do arquivo em foto_url)"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Foto do aluno redimensionada sob demanda (avatares), servida do cache em disco
+
+    Sem login, já que o navegador a carrega direto em <img>; em troca, `v` precisa ser o
+    hash da foto atual (404 caso contrário), o que faz da URL uma capacidade como as
+    de /static/blobs. Fotos antigas, fora dos blobs, continuam servidas só por /static.
+    """
+    foto = db.query(Aluno.foto_url, Aluno.foto_variantes).filter(Aluno.id == aluno_id).first()
+    if not foto or not foto.foto_url:
+        raise HTTPException(status_code=404, detail="Foto não encontrada")
+
+    largura = largura_servida(w)
+    imagem = localizar_redimensionada(foto.foto_url, largura, fmt, v)
+    if imagem is None:
+        raise HTTPException(status_code=404, detail="Foto não encontrada")
+    # A URL leva o hash da foto: mudou a foto, muda a URL
+    cabecalhos = {"ETag": imagem.etag, "Cache-Control": CACHE_IMUTAVEL}
+    if if_none_match and (if_none_match.strip() == "*" or imagem.etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cabecalhos)
+
+    if not garantir_redimensionada(imagem, foto.foto_url, foto.foto_variantes, largura, fmt):
+        raise HTTPException(status_code=404, detail="Foto não encontrada")
+    return FileResponse(imagem.caminho, media_type=f"image/{fmt}", headers=cabecalhos)
+
 # ===== ROTAS - RESPONSÁVEIS =====
 
 @app.post("/alunos/{aluno_id}/responsaveis", response_model=ResponsavelOut, status_code=201)
+@retry_on_lock
 def criar_responsavel(aluno_id: int, responsavel: ResponsavelBase, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Adiciona um responsável ao aluno"""
     aluno = db.query(Aluno).filter(Aluno.id == aluno_id).first()
@@ -489,6 +649,7 @@ def criar_responsavel(aluno_id: int, responsavel: ResponsavelBase, current_user:
     return ResponsavelOut.from_orm(db_responsavel)
 
 @app.put("/responsaveis/{responsavel_id}", response_model=ResponsavelOut)
+@retry_on_lock
 def atualizar_responsavel(responsavel_id: int, responsavel: ResponsavelUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Atualiza dados de um responsável"""
     db_responsavel = db.query(Responsavel).filter(Responsavel.id == responsavel_id).first()
@@ -504,6 +665,7 @@ def atualizar_responsavel(responsavel_id: int, responsavel: ResponsavelUpdate, c
     return ResponsavelOut.from_orm(db_responsavel)
 
 @app.delete("/responsaveis/{responsavel_id}")
+@retry_on_lock
 def excluir_responsavel(responsavel_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Exclui um responsável"""
     db_responsavel = db.query(Responsavel).filter(Responsavel.id == responsavel_id).first()
@@ -518,6 +680,7 @@ def excluir_responsavel(responsavel_id: int, current_user: User = Depends(get_cu
 # ===== ROTAS - NOTAS =====
 
 @app.post("/alunos/{aluno_id}/notas", response_model=NotaOut, status_code=201)
+@retry_on_lock
 def criar_nota(aluno_id: int, nota: NotaBase, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Adiciona uma nota ao aluno"""
     aluno = db.query(Aluno).filter(Aluno.id == aluno_id).first()
@@ -542,6 +705,7 @@ def criar_nota(aluno_id: int, nota: NotaBase, current_user: User = Depends(get_c
     return NotaOut.from_orm(db_nota)
 
 @app.put("/notas/{nota_id}", response_model=NotaOut)
+@retry_on_lock
 def atualizar_nota(nota_id: int, nota: NotaUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Atualiza uma nota"""
     db_nota = db.query(Nota).filter(Nota.id == nota_id).first()
@@ -569,6 +733,7 @@ def atualizar_nota(nota_id: int, nota: NotaUpdate, current_user: User = Depends(
     return NotaOut.from_orm(db_nota)
 
 @app.delete("/notas/{nota_id}")
+@retry_on_lock
 def excluir_nota(nota_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Exclui uma nota (apenas admin pode excluir)"""
     if current_user.role != "admin":
@@ -584,6 +749,7 @@ def excluir_nota(nota_id: int, current_user: User = Depends(get_current_user), d
     return {"message": "Nota excluída com sucesso"}
 
 @app.get("/alunos/{aluno_id}/notas", response_model=List[NotaOut])
+@orcamento_consultas(3)
 def listar_notas_aluno(aluno_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Lista todas as notas de um aluno"""
     aluno = db.query(Aluno).filter(Aluno.id == aluno_id).first()
@@ -594,27 +760,90 @@ def listar_notas_aluno(aluno_id: int, current_user: User = Depends(get_current_u
     
     return [NotaOut.from_orm(nota) for nota in notas]
 
+@app.post("/turmas/{turma_id}/notas/lote", response_model=NotaLoteResponse)
+@retry_on_lock
+def lancar_notas_lote(turma_id: int, lote: NotaLoteRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Lança ou atualiza de uma vez as notas de uma turma (upsert em uma única transação)"""
+    turma = db.query(Turma).filter(Turma.id == turma_id).first()
+    if not turma:
+        raise HTTPException(status_code=404, detail="Turma não encontrada")
+    
+    # Todos os alunos do lote precisam pertencer à turma (uma consulta para o lote inteiro)
+    aluno_ids = {item.aluno_id for item in lote.notas}
+    alunos_da_turma = {
+        aluno_id for (aluno_id,) in
+        db.query(Aluno.id).filter(Aluno.turma_id == turma_id, Aluno.id.in_(aluno_ids))
+    }
+    fora_da_turma = sorted(aluno_ids - alunos_da_turma)
+    if fora_da_turma:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Alunos não pertencem à turma: {', '.join(str(a) for a in fora_da_turma)}"
+        )
+    
+    agora = datetime.utcnow()
+    linhas = [
+        {
+            "aluno_id": item.aluno_id,
+            "disciplina": item.disciplina,
+            "etapa": item.etapa,
+            "nota": item.nota,
+            "data_registro": agora
+        }
+        for item in lote.notas
+    ]
+    
+    try:
+        notas_antes = db.query(func.count(Nota.id)).filter(Nota.aluno_id.in_(aluno_ids)).scalar()
+        
+        for inicio in range(0, len(linhas), NOTAS_LOTE_CHUNK):
+            stmt = insert_upsert(Nota, db).values(linhas[inicio:inicio + NOTAS_LOTE_CHUNK])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Nota.aluno_id, Nota.disciplina, Nota.etapa],
+                set_={"nota": stmt.excluded.nota, "data_registro": stmt.excluded.data_registro}
+            )
+            db.execute(stmt)
+        
+        notas_depois = db.query(func.count(Nota.id)).filter(Nota.aluno_id.in_(aluno_ids)).scalar()
+        inseridas = notas_depois - notas_antes
+        
+        # O upsert não passa pelos eventos do ORM: ajusta as estatísticas manualmente
+        ajustar_estatisticas(db.connection(), {"total_notas": inseridas})
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
+    
+    return NotaLoteResponse(
+        turma_id=turma_id,
+        total=len(linhas),
+        inseridas=inseridas,
+        atualizadas=len(linhas) - inseridas
+    )
+
 # ===== ROTAS - TURMAS (ATUALIZADAS) =====
 
 @app.get("/turmas", response_model=List[TurmaResponse])
-def listar_turmas(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+@fechar_sessao
+@orcamento_consultas(2)
+def listar_turmas(current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
     """Lista todas as turmas com contagem de alunos"""
-    turmas = db.query(Turma).all()
+    turmas = db.execute(select(Turma)).scalars().all()
     
     turmas_response = []
     for turma in turmas:
-        alunos_count = db.query(Aluno).filter(Aluno.turma_id == turma.id).count()
         turma_dict = {
             "id": turma.id,
             "nome": turma.nome,
             "capacidade": turma.capacidade,
-            "alunos_count": alunos_count
+            "alunos_count": turma.alunos_count
         }
         turmas_response.append(TurmaResponse(**turma_dict))
     
     return turmas_response
 
 @app.post("/turmas", response_model=TurmaResponse, status_code=201)
+@retry_on_lock
 def criar_turma(turma: TurmaCreate, current_user: User = Depends(get_current_admin), db: Session = Depends(get_db)):
     """Cria uma nova turma (apenas admin)"""
     try:
@@ -645,6 +874,8 @@ def criar_turma(turma: TurmaCreate, current_user: User = Depends(get_current_adm
 # ===== ROTA - MATRÍCULAS (ATUALIZADO) =====
 
 @app.post("/matriculas")
+@retry_on_lock
+@orcamento_consultas(6)
 def matricular_aluno(matricula: MatriculaRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Matricula um aluno em uma turma"""
     try:
@@ -658,9 +889,8 @@ def matricular_aluno(matricula: MatriculaRequest, current_user: User = Depends(g
         if not turma:
             raise HTTPException(status_code=404, detail="Turma não encontrada")
         
-        # Verificar capacidade da turma
-        alunos_na_turma = db.query(Aluno).filter(Aluno.turma_id == matricula.turma_id).count()
-        if alunos_na_turma >= turma.capacidade:
+        # Checagem rápida; a vaga é reservada de forma atômica no flush
+        if turma.alunos_count >= turma.capacidade:
             raise HTTPException(status_code=400, detail="Turma já está na capacidade máxima")
         
         # Matricular aluno (ativar e definir turma)
@@ -677,28 +907,48 @@ def matricular_aluno(matricula: MatriculaRequest, current_user: User = Depends(g
             "status": aluno.status
         }
         
+    except TurmaLotadaError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Turma já está na capacidade máxima")
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
 
+@app.post("/matriculas/lote")
+@retry_on_lock
+def matricular_alunos_lote(lote: MatriculaLoteRequest, current_user: User = Depends(get_current_admin), db: Session = Depends(get_db)):
+    """Matricula vários alunos de uma vez, respeitando a capacidade das turmas (apenas admin)"""
+    try:
+        return aplicar_matriculas(db, [(m.aluno_id, m.turma_id) for m in lote.matriculas])
+    except MatriculaLoteError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except TurmaLotadaError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Turma lotou durante a matrícula em lote; tente novamente")
+
+@app.post("/matriculas/distribuir")
+@retry_on_lock
+def distribuir_alunos_turmas(distribuicao: DistribuicaoRequest, current_user: User = Depends(get_current_admin), db: Session = Depends(get_db)):
+    """Distribui alunos (por padrão, os sem turma) entre as turmas informadas (apenas admin)"""
+    try:
+        return distribuir_alunos(db, distribuicao.turma_ids, distribuicao.aluno_ids)
+    except MatriculaLoteError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except TurmaLotadaError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Turma lotou durante a distribuição; tente novamente")
+
 # ===== ROTA - ESTATÍSTICAS (ATUALIZADO) =====
 
-@app.get("/estatisticas")
-def obter_estatisticas(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Retorna estatísticas gerais do sistema"""
-    total_alunos = db.query(Aluno).count()
-    alunos_ativos = db.query(Aluno).filter(Aluno.status == "ativo").count()
-    alunos_inativos = db.query(Aluno).filter(Aluno.status == "inativo").count()
-    total_turmas = db.query(Turma).count()
-    total_usuarios = db.query(User).count()
-    total_responsaveis = db.query(Responsavel).count()
-    total_notas = db.query(Nota).count()
-    
-    # Estatísticas por turma
+def montar_estatisticas(totais: dict, turmas: List[Turma]) -> dict:
+    """Monta a resposta de /estatisticas a partir dos totais e dos contadores das turmas"""
     turmas_stats = []
-    turmas = db.query(Turma).all()
     for turma in turmas:
-        alunos_count = db.query(Aluno).filter(Aluno.turma_id == turma.id).count()
+        alunos_count = turma.alunos_count
         turmas_stats.append({
             "turma_id": turma.id,
             "nome": turma.nome,
@@ -708,16 +958,148 @@ def obter_estatisticas(current_user: User = Depends(get_current_user), db: Sessi
         })
     
     return {
-        "total_alunos": total_alunos,
-        "alunos_ativos": alunos_ativos,
-        "alunos_inativos": alunos_inativos,
-        "total_turmas": total_turmas,
-        "total_usuarios": total_usuarios,
-        "total_responsaveis": total_responsaveis,
-        "total_notas": total_notas,
-        "turmas": turmas_stats
+        "total_alunos": totais["total_alunos"],
+        "alunos_ativos": totais["alunos_ativos"],
+        "alunos_inativos": totais["alunos_inativos"],
+        "total_turmas": totais["total_turmas"],
+        "total_usuarios": totais["total_usuarios"],
+        "total_responsaveis": totais["total_responsaveis"],
+        "total_notas": totais["total_notas"],
+        "turmas": turmas_stats,
+        "atualizado_em": totais["atualizado_em"],
+        "recalculado_em": totais["recalculado_em"]
     }
 
+@app.get("/estatisticas")
+@fechar_sessao
+@orcamento_consultas(9)
+def obter_estatisticas(current_user: User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    """Retorna estatísticas gerais do sistema (totais mantidos pelas rotas de escrita)"""
+    totais = ler_totais(db)
+    if totais is None:
+        # Primeira leitura: a base é criada no banco principal
+        with SessionLocal() as primario:
+            totais = obter_totais(primario)
+    turmas = db.execute(select(Turma)).scalars().all()
+    return montar_estatisticas(totais, turmas)
+
+# ===== ROTAS DE LEITURA ASYNC (/async) =====
+# Mesmas respostas das rotas de leitura acima, servidas por corrotinas sobre a engine
+# assíncrona (get_read_db_async). Ficam sob /async para comparar as duas pilhas no mesmo
+# servidor e banco (bench/concorrencia.py --pilha async); os clientes usam as rotas sync.
+
+@app.get("/async/auth/me", response_model=UserOut)
+@orcamento_consultas(1)
+async def get_current_user_info_async(current_user: User = Depends(get_current_user_async)):
+    """Versão async de GET /auth/me"""
+    return UserOut.from_orm(current_user)
+
+@app.get("/async/alunos", response_model=Union[List[AlunoResponse], AlunoPagina])
+@orcamento_consultas(3)
+async def listar_alunos_async(
+    response: Response,
+    search: str = Query("", description="Buscar por nome do aluno (sem acentos, por prefixo de palavras)"),
+    turma_id: Optional[int] = Query(None, description="Filtrar por turma"),
+    status: Optional[str] = Query(None, description="Filtrar por status"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Tamanho da página (ativa a paginação por cursor)"),
+    cursor: Optional[str] = Query(None, description="Cursor retornado em next_cursor pela página anterior"),
+    stream: bool = Query(False, description="Envia os alunos em NDJSON à medida que são lidos"),
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_read_db_async)
+):
+    """Versão async de GET /alunos"""
+    consulta_fts = consulta_fts_da_busca(search)
+    por_relevancia = consulta_fts is not None and not await db.run_sync(busca_comum, consulta_fts)
+    query = montar_consulta_alunos(search, consulta_fts, por_relevancia, turma_id, status, limit, cursor, stream)
+    
+    if stream:
+        cabecalhos = {k: v for k, v in response.headers.items() if k.startswith("x-read-")}
+        return StreamingResponse(stream_alunos_async(query, db.bind), media_type="application/x-ndjson", headers=cabecalhos)
+    
+    if limit is None:
+        rows = (await db.execute(query)).all()
+        return [AlunoResponse(**aluno_para_dict(aluno, turma_nome)) for aluno, turma_nome, *_ in rows]
+    
+    return pagina_alunos((await db.execute(query.limit(limit + 1))).all(), limit)
+
+@app.get("/async/alunos/{aluno_id}", response_model=AlunoDetalhado)
+@orcamento_consultas(4)
+async def obter_aluno_detalhado_async(aluno_id: int, current_user: User = Depends(get_current_user_async), db: AsyncSession = Depends(get_read_db_async)):
+    """Versão async de GET /alunos/{aluno_id}"""
+    resultado = await db.execute(select(Aluno).options(*CARREGAR_DETALHES).where(Aluno.id == aluno_id))
+    aluno = resultado.unique().scalar_one_or_none()
+    if not aluno:
+        raise HTTPException(status_code=404, detail="Aluno não encontrado")
+    
+    aluno_dict = aluno_para_dict(aluno, aluno.turma.nome if aluno.turma else None)
+    aluno_dict["responsaveis"] = [ResponsavelOut.from_orm(r) for r in aluno.responsaveis]
+    aluno_dict["notas"] = [NotaOut.from_orm(n) for n in aluno.notas]
+    
+    return AlunoDetalhado(**aluno_dict)
+
+@app.get("/async/turmas", response_model=List[TurmaResponse])
+@orcamento_consultas(2)
+async def listar_turmas_async(current_user: User = Depends(get_current_user_async), db: AsyncSession = Depends(get_read_db_async)):
+    """Versão async de GET /turmas"""
+    turmas = (await db.execute(select(Turma))).scalars().all()
+    return [
+        TurmaResponse(id=turma.id, nome=turma.nome, capacidade=turma.capacidade, alunos_count=turma.alunos_count)
+        for turma in turmas
+    ]
+
+@app.get("/async/estatisticas")
+@orcamento_consultas(9)
+async def obter_estatisticas_async(current_user: User = Depends(get_current_user_async), db: AsyncSession = Depends(get_read_db_async)):
+    """Versão async de GET /estatisticas"""
+    totais = await ler_totais_async(db)
+    if totais is None:
+        # Primeira leitura: a base é criada no banco principal
+        async with AsyncSessionLocal() as primario:
+            totais = await primario.run_sync(obter_totais)
+    turmas = (await db.execute(select(Turma))).scalars().all()
+    return montar_estatisticas(totais, turmas)
+
+@app.get("/admin/cache")
+def obter_stats_cache(current_user: User = Depends(get_current_admin)):
+    """Retorna os contadores dos caches em memória e a ocupação do pool do bcrypt (apenas admin)"""
+    return {"usuarios": user_cache.stats(), "hash_senhas": hash_queue_stats()}
+
+@app.get("/admin/db-pool")
+def obter_status_pool(current_user: User = Depends(get_current_admin)):
+    """Retorna a ocupação do pool de conexões deste worker e os tempos de espera no checkout (apenas admin)"""
+    return pool_status()
+
+@app.get("/admin/slow-queries")
+def obter_consultas_lentas(
+    limit: Optional[int] = Query(None, ge=1, description="Quantidade máxima de entradas"),
+    varreduras: bool = Query(False, description="Somente consultas com varredura completa de tabela"),
+    current_user: User = Depends(get_current_admin)
+):
+    """Consultas lentas recentes deste worker, com plano de execução (apenas admin)"""
+    return listar_consultas_lentas(limit, varreduras)
+
+@app.delete("/admin/slow-queries")
+def limpar_log_consultas_lentas(current_user: User = Depends(get_current_admin)):
+    """Esvazia o buffer de consultas lentas deste worker (apenas admin)"""
+    limpar_consultas_lentas()
+    return {"message": "Buffer de consultas lentas esvaziado"}
+
+@app.get("/metrics", include_in_schema=False)
+def obter_metricas(authorization: Optional[str] = Header(None)):
+    """Métricas deste worker no formato do Prometheus (protegidas por METRICS_TOKEN, se definido)"""
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Token de métricas inválido")
+    return PlainTextResponse(gerar_metricas(), media_type="text/plain; version=0.0.4")
+
+@app.post("/admin/estatisticas/recalcular")
+@retry_on_lock
+def recalcular_estatisticas_admin(current_user: User = Depends(get_current_admin), db: Session = Depends(get_db)):
+    """Recalcula do zero as estatísticas e os contadores das turmas (apenas admin)"""
+    reconciliar_contadores(db)
+    recalcular_estatisticas(db)
+    turmas = db.query(Turma).all()
+    return montar_estatisticas(obter_totais(db), turmas)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""Carga concorrente nas rotas de leitura: requisições por segundo e latência (p50/p99)
+
+Uso (na pasta backend, com um banco populado pelo seed.py):
+    python bench/concorrencia.py
+    python bench/concorrencia.py --clientes 500 --duracao 20 --rota "/alunos?limit=20"
+    python bench/concorrencia.py --pilha sync                 # só as rotas sync
+    python bench/concorrencia.py --clientes-login 0           # sem o cenário misto
+    python bench/concorrencia.py --url http://servidor:8000   # servidor já em execução
+
+Cada rota é medida nas duas pilhas do mesmo servidor: a sync (a rota em si) e a async
+(a mesma rota sob /async), uma depois da outra. Sem --url, sobe um uvicorn desta pasta
+(com --workers) e o encerra no fim.
+
+No fim, o cenário misto: --clientes-login clientes repetem POST /auth/login (bcrypt no pool
+de processos, 503 quando a fila enche) enquanto --rota-misto é medida de novo em cada
+pilha. Mostra a vazão de logins aceitos, a fração de 503 e o p99 da leitura sob essa
+carga, para comparar com o da tabela principal.
+
+O gerador de carga é um processo asyncio na mesma máquina: com poucos núcleos ele disputa
+CPU com a API, então compare números medidos no mesmo host.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+import httpx
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Prefixo das rotas de leitura async (app.py)
+PILHAS = {"sync": "", "async": "/async"}
+
+ROTAS_PADRAO = [
+    "/alunos?limit=20",
+    "/alunos?limit=20&search=silva",
+    "/alunos/1",
+    "/turmas",
+    "/estatisticas",
+    "/auth/me",
+]
+
+def subir_servidor(porta: int, workers: int, limite: float) -> subprocess.Popen:
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(porta), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND,
+    )
+    inicio = time.monotonic()
+    while time.monotonic() - inicio < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"uvicorn terminou com código {processo.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{porta}/docs", timeout=1).status_code == 200:
+                return processo
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    processo.terminate()
+    raise RuntimeError(f"uvicorn não respondeu em {limite:.0f}s")
+
+async def medir(requisitar, clientes: int, duracao: float) -> dict:
+    """Cada um dos `clientes` repete `requisitar()` até o fim da `duracao`"""
+    latencias = []
+    erros = 0
+    codigos = Counter()
+    fim = time.monotonic() + duracao
+
+    async def repetir():
+        nonlocal erros
+        while time.monotonic() < fim:
+            inicio = time.perf_counter()
+            try:
+                resposta = await requisitar()
+                codigos[resposta.status_code] += 1
+                if resposta.status_code != 200:
+                    erros += 1
+            except httpx.HTTPError:
+                erros += 1
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.monotonic()
+    await asyncio.gather(*(repetir() for _ in range(clientes)))
+    decorrido = time.monotonic() - inicio
+    latencias.sort()
+    return {
+        # Só as respostas 200: erros rápidos (pool esgotado, timeout) não contam como vazão
+        "rps": (len(latencias) - erros) / decorrido,
+        "p50": statistics.median(latencias) * 1000,
+        "p99": latencias[min(int(len(latencias) * 0.99), len(latencias) - 1)] * 1000,
+        "requisicoes": len(latencias),
+        "erros": erros,
+        "codigos": codigos,
+    }
+
+async def medir_rota(cliente: httpx.AsyncClient, rota: str, clientes: int, duracao: float) -> dict:
+    return await medir(lambda: cliente.get(rota), clientes, duracao)
+
+async def medir_misto(cliente: httpx.AsyncClient, args, rota: str) -> tuple:
+    """Mede `rota` com --clientes enquanto --clientes-login repetem POST /auth/login"""
+    corpo = {"username_or_email": args.usuario, "password": args.senha}
+    return await asyncio.gather(
+        medir(lambda: cliente.post("/auth/login", json=corpo), args.clientes_login, args.duracao),
+        medir_rota(cliente, rota, args.clientes, args.duracao),
+    )
+
+async def executar(args, url: str):
+    conexoes = args.clientes + args.clientes_login
+    limites = httpx.Limits(max_connections=conexoes, max_keepalive_connections=conexoes)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limites) as cliente:
+        resposta = await cliente.post("/auth/login", json={"username_or_email": args.usuario, "password": args.senha})
+        resposta.raise_for_status()
+        cliente.headers["Authorization"] = f"Bearer {resposta.json()['access_token']}"
+
+        pilhas = list(PILHAS) if args.pilha == "ambas" else [args.pilha]
+        print(f"{args.clientes} clientes, {args.duracao:.0f}s por rota e pilha ({url})")
+        print(f"{'rota':<36} {'pilha':<6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'erros':>6}")
+        for rota in args.rota or ROTAS_PADRAO:
+            for pilha in pilhas:
+                caminho = PILHAS[pilha] + rota
+                if args.aquecimento:
+                    await medir_rota(cliente, caminho, args.clientes, args.aquecimento)
+                r = await medir_rota(cliente, caminho, args.clientes, args.duracao)
+                print(f"{rota:<36} {pilha:<6} {r['rps']:>8.1f} {r['p50']:>8.0f} {r['p99']:>8.0f} {r['erros']:>6}")
+
+        if not args.clientes_login:
+            return
+        print(f"\nMisto: {args.clientes_login} clientes em POST /auth/login + {args.clientes} em {args.rota_misto}")
+        print(f"{'pilha':<6} {'login req/s':>12} {'login 503':>10} {'login p99 ms':>13} {'leitura req/s':>14} {'leitura p99 ms':>15}")
+        for pilha in pilhas:
+            caminho = PILHAS[pilha] + args.rota_misto
+            if args.aquecimento:
+                await medir_rota(cliente, caminho, args.clientes, args.aquecimento)
+            login, leitura = await medir_misto(cliente, args, caminho)
+            taxa_503 = login["codigos"][503] / max(login["requisicoes"], 1)
+            print(
+                f"{pilha:<6} {login['rps']:>12.1f} {taxa_503:>10.1%} {login['p99']:>13.0f} "
+                f"{leitura['rps']:>14.1f} {leitura['p99']:>15.0f}"
+            )
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede requisições por segundo e latência das rotas de leitura sob carga")
+    parser.add_argument("--url", help="API já em execução (padrão: sobe um uvicorn desta pasta)")
+    parser.add_argument("--clientes", type=int, default=500, help="Clientes simultâneos (padrão: 500)")
+    parser.add_argument("--duracao", type=float, default=15, help="Segundos de medida por rota (padrão: 15)")
+    parser.add_argument("--aquecimento", type=float, default=2, help="Segundos de carga descartados antes de cada rota (padrão: 2)")
+    parser.add_argument("--rota", action="append", help="Rota a medir (repetível; padrão: as rotas de leitura principais)")
+    parser.add_argument("--pilha", choices=["ambas", *PILHAS], default="ambas", help="Rotas sync, async (/async) ou ambas (padrão: ambas)")
+    parser.add_argument("--clientes-login", type=int, default=50, help="Clientes em POST /auth/login no cenário misto (padrão: 50; 0 desliga)")
+    parser.add_argument("--rota-misto", default=ROTAS_PADRAO[0], help=f"Rota de leitura medida no cenário misto (padrão: {ROTAS_PADRAO[0]})")
+    parser.add_argument("--usuario", default="admin", help="Usuário do login (padrão: admin, criado pelo seed.py)")
+    parser.add_argument("--senha", default="Admin123!", help="Senha do login (padrão: a do seed.py)")
+    parser.add_argument("--workers", type=int, default=1, help="Workers do uvicorn iniciado pelo script (padrão: 1)")
+    parser.add_argument("--porta", type=int, default=8098, help="Porta do uvicorn iniciado pelo script (padrão: 8098)")
+    parser.add_argument("--timeout", type=float, default=60, help="Timeout de cada requisição, em segundos (padrão: 60)")
+    args = parser.parse_args()
+    if args.clientes < 1 or args.duracao <= 0:
+        parser.error("--clientes e --duracao devem ser positivos")
+    if args.clientes_login < 0:
+        parser.error("--clientes-login não pode ser negativo")
+
+    processo = None if args.url else subir_servidor(args.porta, args.workers, 60)
+    try:
+        asyncio.run(executar(args, args.url or f"http://127.0.0.1:{args.porta}"))
+    finally:
+        if processo is not None:
+            processo.terminate()
+            processo.wait()
+
+if __name__ == "__main__":
+    main()
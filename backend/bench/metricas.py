@@ -0,0 +1,82 @@
+"""Custo do middleware de métricas (MetricasHTTP) por requisição: com e sem o middleware
+
+Uso (na pasta backend):
+    python bench/metricas.py
+    python bench/metricas.py --requisicoes 50000 --repeticoes 9
+
+As requisições são chamadas ASGI diretas, sem rede nem servidor, a um app Starlette mínimo
+com uma rota parametrizada (o template entra nos rótulos, como em /alunos/{aluno_id}). O
+app é o mesmo nos dois casos; a diferença entre as medianas é o custo do middleware, que
+deve ficar abaixo de --limite microssegundos.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from metricas import MetricasHTTP
+
+async def _aluno(request):
+    return PlainTextResponse("ok")
+
+def montar_app(com_metricas: bool):
+    app = Starlette(routes=[Route("/alunos/{aluno_id}", _aluno)])
+    return MetricasHTTP(app) if com_metricas else app
+
+async def _receber():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+async def _enviar(message):
+    pass
+
+async def medir(app, requisicoes: int) -> float:
+    """Microssegundos por requisição, em média, numa sequência de chamadas ao app"""
+    inicio = time.perf_counter()
+    for i in range(requisicoes):
+        # Scope novo a cada requisição: o roteamento grava endpoint e path_params nele
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": f"/alunos/{i}", "raw_path": f"/alunos/{i}".encode(),
+            "root_path": "", "query_string": b"", "headers": [], "client": ("127.0.0.1", 0),
+            "server": ("127.0.0.1", 8000),
+        }
+        await app(scope, _receber, _enviar)
+    return (time.perf_counter() - inicio) / requisicoes * 1e6
+
+async def executar(args) -> float:
+    apps = {"sem métricas": montar_app(False), "com métricas": montar_app(True)}
+    medidas = {nome: [] for nome in apps}
+    for app in apps.values():
+        await medir(app, min(args.requisicoes, 1000))  # aquecimento
+    # Alternadas, para que variações da máquina afetem os dois lados igualmente
+    for _ in range(args.repeticoes):
+        for nome, app in apps.items():
+            medidas[nome].append(await medir(app, args.requisicoes))
+    for nome, valores in medidas.items():
+        print(f"{nome}: mediana {statistics.median(valores):.1f} µs/requisição (mín. {min(valores):.1f}, máx. {max(valores):.1f})")
+    return statistics.median(medidas["com métricas"]) - statistics.median(medidas["sem métricas"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o custo por requisição do middleware de métricas")
+    parser.add_argument("--requisicoes", type=int, default=20000, help="Requisições por medida (padrão: 20000)")
+    parser.add_argument("--repeticoes", type=int, default=7, help="Medidas de cada caso (padrão: 7)")
+    parser.add_argument("--limite", type=float, default=50, help="Custo máximo aceito, em µs por requisição (padrão: 50)")
+    args = parser.parse_args()
+    if args.requisicoes < 1 or args.repeticoes < 1:
+        parser.error("--requisicoes e --repeticoes devem ser positivos")
+
+    custo = asyncio.run(executar(args))
+    print(f"Custo do middleware: {custo:.1f} µs/requisição (limite {args.limite:.0f} µs)")
+    if custo > args.limite:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
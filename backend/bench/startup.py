@@ -0,0 +1,73 @@
+"""Tempo de partida da API: importação do app.py e tempo até a primeira resposta 200
+
+Uso (na pasta backend, com o banco do .env já migrado):
+    python bench/startup.py
+    python bench/startup.py --repeticoes 10 --url /docs
+
+Cada medida usa um processo novo. A importação é o `import app` num interpretador
+limpo; a partida vai do lançamento do uvicorn até a primeira resposta 200 em --url,
+incluindo o startup_event (verificação da versão do schema e snapshot de leitura).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executado num interpretador novo: só o custo do import, sem o do próprio Python
+CODIGO_IMPORTACAO = "import time; inicio = time.perf_counter(); import app; print(time.perf_counter() - inicio)"
+
+def medir_importacao() -> float:
+    saida = subprocess.run([sys.executable, "-c", CODIGO_IMPORTACAO], cwd=BACKEND, capture_output=True, text=True, check=True)
+    return float(saida.stdout.split()[-1])
+
+def medir_primeira_resposta(porta: int, url: str, limite: float) -> float:
+    """Segundos do lançamento do uvicorn até a primeira resposta 200 em `url`"""
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(porta), "--log-level", "warning"],
+        cwd=BACKEND,
+    )
+    try:
+        while time.perf_counter() - inicio < limite:
+            if processo.poll() is not None:
+                raise RuntimeError(f"uvicorn terminou com código {processo.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{porta}{url}", timeout=1) as resposta:
+                    if resposta.status == 200:
+                        return time.perf_counter() - inicio
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                pass
+            time.sleep(0.005)
+        raise RuntimeError(f"Sem resposta 200 em {url} após {limite:.0f}s")
+    finally:
+        processo.terminate()
+        processo.wait()
+
+def resumir(nome: str, medidas: list):
+    ms = [m * 1000 for m in medidas]
+    print(f"{nome}: mediana {statistics.median(ms):.0f} ms (mín. {min(ms):.0f}, máx. {max(ms):.0f}, {len(ms)} medidas)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o tempo de importação e de partida da API")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Medidas de cada tipo (padrão: 5)")
+    parser.add_argument("--url", default="/docs", help="Rota sem autenticação consultada até responder 200 (padrão: /docs)")
+    parser.add_argument("--porta", type=int, default=8099, help="Porta do uvicorn durante a medida (padrão: 8099)")
+    parser.add_argument("--limite", type=float, default=60, help="Segundos de espera pela primeira resposta (padrão: 60)")
+    args = parser.parse_args()
+    if args.repeticoes < 1:
+        parser.error("--repeticoes deve ser positivo")
+
+    # Uma partida descartada: migra um banco ainda sem versão e aquece o cache de disco
+    medir_primeira_resposta(args.porta, args.url, args.limite)
+
+    resumir("Importação do app", [medir_importacao() for _ in range(args.repeticoes)])
+    resumir(f"Primeira resposta 200 ({args.url})", [medir_primeira_resposta(args.porta, args.url, args.limite) for _ in range(args.repeticoes)])
+
+if __name__ == "__main__":
+    main()
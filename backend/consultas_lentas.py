@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+from dotenv import load_dotenv
+from database import definir_monitor_consulta_lenta, medicao_sql_atual
+from instrumentacao import rota_da_requisicao
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Consultas a partir deste tempo entram no log de consultas lentas (0 desativa)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+# Entradas mantidas em memória para GET /admin/slow-queries (por worker)
+SLOW_QUERY_BUFFER = int(os.getenv("SLOW_QUERY_BUFFER", 200))
+# Arquivo (JSON por linha, com rotação) que também recebe cada entrada; vazio = só memória
+SLOW_QUERY_LOG_FILE = os.getenv("SLOW_QUERY_LOG_FILE", "")
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", 5 * 1024 * 1024))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", 5))
+
+# Prefixo de EXPLAIN por dialeto (sem ANALYZE: não executa a consulta de novo)
+EXPLAIN_POR_DIALETO = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}
+
+_entradas = deque(maxlen=SLOW_QUERY_BUFFER)
+_lock = threading.Lock()
+
+_arquivo = logging.getLogger("consultas_lentas.arquivo")
+_arquivo.propagate = False
+if SLOW_QUERY_LOG_FILE:
+    os.makedirs(os.path.dirname(os.path.abspath(SLOW_QUERY_LOG_FILE)), exist_ok=True)
+    _arquivo.addHandler(RotatingFileHandler(
+        SLOW_QUERY_LOG_FILE, maxBytes=SLOW_QUERY_LOG_MAX_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8"
+    ))
+    _arquivo.setLevel(logging.INFO)
+
+def _redigir(valor):
+    """Mantém números, datas e nulos; troca textos e binários por um marcador com o tamanho"""
+    if isinstance(valor, (list, tuple)):
+        return [_redigir(v) for v in valor]
+    if isinstance(valor, dict):
+        return {chave: _redigir(v) for chave, v in valor.items()}
+    if valor is None or isinstance(valor, (bool, int, float)):
+        return valor
+    if isinstance(valor, (str, bytes)):
+        return f"<{type(valor).__name__}:{len(valor)}>"
+    return str(valor) if hasattr(valor, "isoformat") else f"<{type(valor).__name__}>"
+
+def _plano(conn, instrucao: str, parametros) -> list:
+    """Plano de execução da instrução, lido por um cursor próprio na mesma conexão"""
+    prefixo = EXPLAIN_POR_DIALETO.get(conn.dialect.name)
+    if prefixo is None or instrucao.lstrip()[:6].upper() not in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+        return []
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefixo + instrucao, parametros)
+        linhas = cursor.fetchall()
+    finally:
+        cursor.close()
+    # SQLite: (id, parent, notused, detail); PostgreSQL: uma coluna de texto
+    return [linha[-1] for linha in linhas]
+
+def _tabelas_varridas(dialeto: str, plano: list) -> list:
+    """Tabelas lidas por inteiro segundo o plano (SCAN sem índice no SQLite, Seq Scan no PostgreSQL)
+
+    No SQLite, subconsultas materializadas (MATERIALIZE/CO-ROUTINE) e listas de VALUES
+    (CONSTANT ROWS) também aparecem como SCAN, mas não são tabelas do banco.
+    """
+    tabelas = []
+    intermediarias = set()
+    for linha in plano:
+        linha = str(linha).strip()
+        if dialeto == "sqlite" and linha.startswith(("MATERIALIZE ", "CO-ROUTINE ")):
+            intermediarias.add(linha.split()[1])
+            continue
+        if dialeto == "sqlite" and linha.startswith("SCAN "):
+            resto = linha[len("SCAN "):].removeprefix("TABLE ")
+            if "USING" in resto or "VIRTUAL TABLE" in resto or "CONSTANT ROW" in resto:
+                continue
+            tabela = resto.split()[0]
+            if tabela in intermediarias:
+                continue
+        elif dialeto == "postgresql" and "Seq Scan on " in linha:
+            tabela = linha.split("Seq Scan on ", 1)[1].split()[0]
+        else:
+            continue
+        if tabela not in tabelas:
+            tabelas.append(tabela)
+    return tabelas
+
+def registrar_consulta_lenta(conn, cursor, instrucao, parametros, executemany, duracao):
+    """Monta a entrada da consulta lenta (com o plano) e a guarda no buffer e no arquivo"""
+    if executemany:
+        parametros = parametros[0] if parametros else ()
+    try:
+        plano = _plano(conn, instrucao, parametros)
+    except Exception as e:
+        plano = [f"EXPLAIN falhou: {e}"]
+
+    medicao = medicao_sql_atual()
+    scope = medicao.scope if medicao is not None else None
+    varridas = _tabelas_varridas(conn.dialect.name, plano)
+    entrada = {
+        "momento": datetime.utcnow().isoformat(),
+        "duracao_ms": round(duracao * 1000, 2),
+        "rota": f"{scope['method']} {rota_da_requisicao(scope)}" if scope else None,
+        "instrucao": " ".join(instrucao.split()),
+        "parametros": _redigir(parametros),
+        "executemany": executemany,
+        "plano": plano,
+        "varredura_completa": bool(varridas),
+        "tabelas_varridas": varridas,
+    }
+
+    with _lock:
+        _entradas.append(entrada)
+    if SLOW_QUERY_LOG_FILE:
+        _arquivo.info(json.dumps(entrada, ensure_ascii=False, default=str))
+    logger.warning("Consulta lenta (%.1f ms) em %s: %s", entrada["duracao_ms"], entrada["rota"], entrada["instrucao"][:200])
+
+def listar_consultas_lentas(limite: Optional[int] = None, apenas_varreduras: bool = False) -> list:
+    """Entradas do buffer, da mais recente para a mais antiga"""
+    with _lock:
+        entradas = list(reversed(_entradas))
+    if apenas_varreduras:
+        entradas = [e for e in entradas if e["varredura_completa"]]
+    return entradas[:limite] if limite else entradas
+
+def limpar_consultas_lentas():
+    with _lock:
+        _entradas.clear()
+
+if SLOW_QUERY_MS > 0:
+    definir_monitor_consulta_lenta(SLOW_QUERY_MS / 1000, registrar_consulta_lenta)
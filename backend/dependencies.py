@@ -1,38 +1,115 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+from typing import Optional
+from cache import user_cache
+from database import get_db, get_async_db
+from leitura import escolher_leitura
 from models import User
 from security import verify_token
 
 security = HTTPBearer()
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Obtém o usuário atual baseado no token JWT"""
-    token = credentials.credentials
-    payload = verify_token(token)
+USER_COLUMNS = [attr.key for attr in inspect(User).column_attrs]
+
+def carregar_usuario(db: Session, user_id: int) -> Optional[User]:
+    """Busca o usuário pelo id, usando o cache em memória antes de ir ao banco"""
+    valores = user_cache.get(user_id)
+    if valores is None:
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is None:
+            return None
+        valores = {coluna: getattr(user, coluna) for coluna in USER_COLUMNS}
+        user_cache.set(user_id, valores)
+        # Devolve a conexão ao pool: a rota roda depois, em outra thread do threadpool, e
+        # numa rajada de cache frio as conexões presas esgotariam o pool
+        db.close()
+
+    # Reconstrói o usuário e o associa à sessão sem SELECT, para que as
+    # rotas possam alterá-lo e fazer commit normalmente
+    user = User(**valores)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+async def carregar_usuario_async(db: AsyncSession, user_id: int) -> Optional[User]:
+    """Versão assíncrona de carregar_usuario, para rotas que só leem o usuário"""
+    valores = user_cache.get(user_id)
+    if valores is not None:
+        # Objeto solto (fora da sessão): suficiente para autorização e serialização
+        return User(**valores)
+    
+    user = await db.get(User, user_id)
+    if user is not None:
+        user_cache.set(user_id, {coluna: getattr(user, coluna) for coluna in USER_COLUMNS})
+    return user
+
+def _user_id_do_token(credentials: HTTPAuthorizationCredentials) -> int:
+    """Valida o token JWT e retorna o id do usuário (claim sub)"""
+    payload = verify_token(credentials.credentials)
     
-    user_id: int = payload.get("sub")
-    if user_id is None:
+    try:
+        return int(payload.get("sub"))
+    except (TypeError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    user = db.query(User).filter(User.id == user_id).first()
+
+def _usuario_ou_401(user: Optional[User]) -> User:
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuário não encontrado",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
     return user
 
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> User:
+    """Obtém o usuário atual baseado no token JWT"""
+    user_id = _user_id_do_token(credentials)
+    # Identifica o autor das escritas desta sessão (leia-suas-escritas em leitura.py)
+    db.info["user_id"] = user_id
+    return _usuario_ou_401(carregar_usuario(db, user_id))
+
+async def get_current_user_async(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Obtém o usuário atual (sessão assíncrona), para as rotas async de leitura"""
+    user_id = _user_id_do_token(credentials)
+    return _usuario_ou_401(await carregar_usuario_async(db, user_id))
+
+def get_read_db(response: Response, current_user: User = Depends(get_current_user)):
+    """Sessão para rotas GET: réplica/snapshot quando disponível e recente o bastante
+
+    Quem escreveu depois da cópia atual lê do banco principal. A origem dos dados
+    vai no cabeçalho X-Read-Source (e a idade da cópia em X-Read-Staleness).
+    """
+    fabrica, origem, idade = escolher_leitura(current_user.id)
+    response.headers["X-Read-Source"] = origem
+    if idade is not None:
+        response.headers["X-Read-Staleness"] = f"{idade:.1f}"
+    db = fabrica()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_read_db_async(response: Response, current_user: User = Depends(get_current_user_async)):
+    """Versão de get_read_db para as rotas de leitura async (sessão AsyncSession)"""
+    fabrica, origem, idade = escolher_leitura(current_user.id, assincrona=True)
+    response.headers["X-Read-Source"] = origem
+    if idade is not None:
+        response.headers["X-Read-Staleness"] = f"{idade:.1f}"
+    async with fabrica() as db:
+        yield db
+
 def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
     """Verifica se o usuário atual é admin"""
     if current_user.role != "admin":
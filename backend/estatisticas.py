@@ -0,0 +1,114 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import func, select, update, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import Aluno, Turma, User, Responsavel, Nota, Estatisticas, EstatisticasParcela, ESTATISTICAS_ID, COLUNAS_TOTAIS
+
+def reconciliar_contadores(db: Session) -> list:
+    """Corrige turmas.alunos_count a partir da tabela alunos e retorna as turmas que estavam divergentes"""
+    contagem_real = (
+        select(func.count(Aluno.id))
+        .where(Aluno.turma_id == Turma.id)
+        .correlate(Turma)
+        .scalar_subquery()
+    )
+    
+    divergentes = db.query(Turma.id, Turma.nome, Turma.alunos_count, contagem_real).filter(
+        Turma.alunos_count != contagem_real
+    ).all()
+    
+    if divergentes:
+        # Um único UPDATE: a contagem e a correção acontecem no mesmo comando
+        db.execute(
+            update(Turma)
+            .where(Turma.alunos_count != contagem_real)
+            .values(alunos_count=contagem_real)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    
+    return [
+        {"turma_id": turma_id, "nome": nome, "alunos_count": anterior, "alunos_reais": real}
+        for turma_id, nome, anterior, real in divergentes
+    ]
+
+def recalcular_estatisticas(db: Session) -> Estatisticas:
+    """Recalcula a base das estatísticas a partir das tabelas de origem e zera as parcelas"""
+    def total(modelo):
+        return select(func.count()).select_from(modelo).scalar_subquery()
+    
+    # Zera as parcelas antes de contar: no PostgreSQL, escritas que já somaram em
+    # alguma parcela terminam antes (e entram na contagem) e as seguintes esperam o commit
+    db.execute(update(EstatisticasParcela).values({coluna: 0 for coluna in COLUNAS_TOTAIS}))
+    
+    totais = db.query(
+        func.count(Aluno.id),
+        func.coalesce(func.sum(case((Aluno.status == "ativo", 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Aluno.status == "inativo", 1), else_=0)), 0),
+        total(Turma),
+        total(User),
+        total(Responsavel),
+        total(Nota),
+    ).one()
+    
+    agora = datetime.utcnow()
+    valores = dict(zip(COLUNAS_TOTAIS, totais))
+    
+    snapshot = db.get(Estatisticas, ESTATISTICAS_ID)
+    if snapshot is None:
+        snapshot = Estatisticas(id=ESTATISTICAS_ID)
+        db.add(snapshot)
+    for coluna, valor in valores.items():
+        setattr(snapshot, coluna, valor)
+    snapshot.atualizado_em = agora
+    snapshot.recalculado_em = agora
+    
+    try:
+        db.commit()
+    except IntegrityError:
+        # Outro worker criou a base ao mesmo tempo; a dele já está completa
+        db.rollback()
+        snapshot = db.get(Estatisticas, ESTATISTICAS_ID)
+    
+    return snapshot
+
+def consulta_estatisticas():
+    """Base das estatísticas com a soma das parcelas, em uma consulta"""
+    parcelas = select(
+        *[func.coalesce(func.sum(EstatisticasParcela.__table__.c[coluna]), 0).label(coluna) for coluna in COLUNAS_TOTAIS],
+        func.max(EstatisticasParcela.atualizado_em).label("atualizado_em"),
+    ).subquery()
+    base = Estatisticas.__table__
+    return select(
+        *[(base.c[coluna] + parcelas.c[coluna]).label(coluna) for coluna in COLUNAS_TOTAIS],
+        base.c.atualizado_em,
+        parcelas.c.atualizado_em.label("parcelas_atualizadas_em"),
+        base.c.recalculado_em,
+    ).select_from(base).join(parcelas, base.c.id == ESTATISTICAS_ID)
+
+def _totais(linha) -> Optional[dict]:
+    if linha is None:
+        return None
+    totais = dict(linha._mapping)
+    parcelas = totais.pop("parcelas_atualizadas_em")
+    if parcelas is not None and parcelas > totais["atualizado_em"]:
+        totais["atualizado_em"] = parcelas
+    return totais
+
+def ler_totais(db: Session) -> Optional[dict]:
+    """Totais atuais (base + parcelas), sem recálculo (None se a base ainda não existe)"""
+    return _totais(db.execute(consulta_estatisticas()).first())
+
+def obter_totais(db: Session) -> dict:
+    """Totais atuais (base + parcelas), recalculando a base na primeira leitura"""
+    totais = ler_totais(db)
+    if totais is None:
+        recalcular_estatisticas(db)
+        totais = ler_totais(db)
+    return totais
+
+async def ler_totais_async(db: AsyncSession) -> Optional[dict]:
+    """Versão assíncrona de ler_totais (None se a base ainda não existe)"""
+    return _totais((await db.execute(consulta_estatisticas())).first())
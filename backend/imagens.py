@@ -0,0 +1,337 @@
+import hashlib
+import os
+import tempfile
+import time
+from typing import AsyncIterator, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request, status
+from multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from miniaturas import DESTINOS
+
+load_dotenv()
+
+# Limites das fotos enviadas (alunos e perfil)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 2 * 1024 * 1024))
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", 25_000_000))
+
+# Início do arquivo mantido em memória para achar as dimensões (no JPEG, EXIF e perfil
+# ICC vêm antes delas); imagem sem dimensões nesse trecho é recusada
+CABECALHO_MAX_BYTES = 256 * 1024
+# Folga para o boundary e os cabeçalhos das partes do multipart
+FOLGA_MULTIPART = 16 * 1024
+DIRETORIO_UPLOADS = "uploads"
+DIRETORIO_TEMPORARIO = os.path.join(DIRETORIO_UPLOADS, ".tmp")
+# O NamedTemporaryFile cria o arquivo com 0600; antes de publicá-lo, aplica as permissões
+# de um arquivo comum (0666 menos a umask), para o servidor web conseguir servi-lo. A umask
+# só pode ser lida trocando-a, então é lida uma vez, na importação
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+PERMISSOES_UPLOAD = 0o666 & ~_UMASK
+
+# Fotos guardadas pelo hash do conteúdo (uploads/blobs/ab/abcd....jpg): a URL muda
+# junto com a foto, então o navegador pode guardá-la para sempre
+PASTA_BLOBS = "blobs"
+URL_UPLOADS = "/static"
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+# Pastas varridas pela coleta de fotos sem referência (alunos/ e users/ guardam as fotos antigas)
+PASTAS_FOTOS = (PASTA_BLOBS, "alunos", "users")
+# Arquivos mais novos que isso nunca são coletados: o upload ou a miniatura pode ainda não ter
+# chegado ao banco
+FOTOS_GC_CARENCIA = float(os.getenv("FOTOS_GC_CARENCIA", 3600))  # segundos
+
+EXTENSOES = {"jpeg": "jpg", "png": "png"}
+# SOF0..SOF15, exceto DHT (C4), JPG (C8) e DAC (CC), que usam a mesma faixa
+MARCADORES_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+class ImagemRecebida(NamedTuple):
+    caminho: str  # arquivo temporário; a rota o move para o destino final com os.replace
+    formato: str  # "jpeg" ou "png", pelos magic bytes (o content-type do cliente é ignorado)
+    extensao: str
+    largura: int
+    altura: int
+    tamanho: int
+    sha256: str
+
+def _imagem_invalida() -> HTTPException:
+    return HTTPException(status_code=400, detail="Arquivo deve ser uma imagem PNG ou JPEG válida")
+
+def _muito_grande() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"A imagem deve ter no máximo {UPLOAD_MAX_BYTES // (1024 * 1024)}MB"
+    )
+
+def detectar_formato(cabecalho: bytes) -> Optional[str]:
+    """Formato pela assinatura do arquivo (magic bytes)"""
+    if cabecalho.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if cabecalho.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    return None
+
+def ler_dimensoes(formato: str, cabecalho: bytes) -> Optional[Tuple[int, int]]:
+    """(largura, altura) lidas do cabeçalho, sem decodificar a imagem; None se ainda faltam bytes"""
+    if formato == "png":
+        # Assinatura (8 bytes) seguida do chunk IHDR: tamanho, tipo, largura, altura
+        if len(cabecalho) < 24:
+            return None
+        if cabecalho[12:16] != b"IHDR":
+            raise _imagem_invalida()
+        return int.from_bytes(cabecalho[16:20], "big"), int.from_bytes(cabecalho[20:24], "big")
+
+    # JPEG: pula os segmentos (APPn, DQT, DHT...) até o SOF, que traz as dimensões
+    posicao = 2
+    while True:
+        if posicao + 4 > len(cabecalho):
+            return None
+        if cabecalho[posicao] != 0xFF:
+            raise _imagem_invalida()
+        marcador = cabecalho[posicao + 1]
+        if marcador == 0xFF:  # bytes de preenchimento antes do marcador
+            posicao += 1
+            continue
+        if marcador in (0xD9, 0xDA):  # fim da imagem ou dados comprimidos antes do SOF
+            raise _imagem_invalida()
+        if marcador == 0x01 or 0xD0 <= marcador <= 0xD8:  # marcadores sem tamanho
+            posicao += 2
+            continue
+        if marcador in MARCADORES_SOF:
+            if posicao + 9 > len(cabecalho):
+                return None
+            altura = int.from_bytes(cabecalho[posicao + 5:posicao + 7], "big")
+            largura = int.from_bytes(cabecalho[posicao + 7:posicao + 9], "big")
+            return largura, altura
+        posicao += 2 + int.from_bytes(cabecalho[posicao + 2:posicao + 4], "big")
+
+class _LeitorImagem:
+    """Estado da leitura do multipart: grava o campo "file" e valida a imagem enquanto chega"""
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.eventos = []
+        self.cabecalhos = {}
+        self.nome_cabecalho = b""
+        self.valor_cabecalho = b""
+        self.gravando = False
+        self.encontrado = False
+        self.completo = False
+        self.tamanho = 0
+        self.hash = hashlib.sha256()
+        self.cabecalho = bytearray()
+        self.formato = None
+        self.dimensoes = None
+
+    def callbacks(self) -> dict:
+        eventos = self.eventos
+        return {
+            "on_part_begin": lambda: eventos.append(("inicio", b"")),
+            "on_header_field": lambda dados, i, f: eventos.append(("nome_cabecalho", dados[i:f])),
+            "on_header_value": lambda dados, i, f: eventos.append(("valor_cabecalho", dados[i:f])),
+            "on_header_end": lambda: eventos.append(("fim_cabecalho", b"")),
+            "on_headers_finished": lambda: eventos.append(("cabecalhos", b"")),
+            "on_part_data": lambda dados, i, f: eventos.append(("dados", dados[i:f])),
+            "on_part_end": lambda: eventos.append(("fim", b"")),
+        }
+
+    def processar(self):
+        for evento, dados in self.eventos:
+            if evento == "inicio":
+                self.cabecalhos = {}
+            elif evento == "nome_cabecalho":
+                self.nome_cabecalho += dados
+            elif evento == "valor_cabecalho":
+                self.valor_cabecalho += dados
+            elif evento == "fim_cabecalho":
+                self.cabecalhos[self.nome_cabecalho.lower()] = self.valor_cabecalho
+                self.nome_cabecalho = self.valor_cabecalho = b""
+            elif evento == "cabecalhos":
+                _, opcoes = parse_options_header(self.cabecalhos.get(b"content-disposition", b""))
+                # Só o primeiro campo "file" é gravado; os demais são descartados
+                self.gravando = opcoes.get(b"name") == b"file" and not self.encontrado
+                self.encontrado = self.encontrado or self.gravando
+            elif evento == "dados" and self.gravando:
+                self._gravar(dados)
+            elif evento == "fim":
+                # Parte do arquivo só conta se terminou (boundary de fechamento recebido)
+                self.completo = self.completo or self.gravando
+                self.gravando = False
+        self.eventos.clear()
+
+    def _gravar(self, dados: bytes):
+        self.tamanho += len(dados)
+        if self.tamanho > UPLOAD_MAX_BYTES:
+            raise _muito_grande()
+        if self.dimensoes is None:
+            self.cabecalho += dados[:CABECALHO_MAX_BYTES - len(self.cabecalho)]
+            self._validar_cabecalho()
+        self.hash.update(dados)
+        self.arquivo.write(dados)
+
+    def _validar_cabecalho(self):
+        if self.formato is None:
+            if len(self.cabecalho) < 8:
+                return
+            self.formato = detectar_formato(bytes(self.cabecalho[:8]))
+            if self.formato is None:
+                raise _imagem_invalida()
+        self.dimensoes = ler_dimensoes(self.formato, self.cabecalho)
+        if self.dimensoes is None:
+            if len(self.cabecalho) >= CABECALHO_MAX_BYTES:
+                raise _imagem_invalida()
+            return
+        largura, altura = self.dimensoes
+        if largura == 0 or altura == 0:
+            raise _imagem_invalida()
+        if largura * altura > UPLOAD_MAX_PIXELS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Imagem com {largura}x{altura} pixels: o máximo é {UPLOAD_MAX_PIXELS / 1e6:g} megapixels"
+            )
+        self.cabecalho = bytearray()
+
+async def receber_imagem(request: Request) -> AsyncIterator[ImagemRecebida]:
+    """Dependency: recebe o campo "file" do multipart em streaming, validando enquanto lê
+
+    A leitura é interrompida assim que o arquivo passa de UPLOAD_MAX_BYTES, não tem
+    assinatura de PNG/JPEG ou tem dimensões acima do permitido, e o pedido nem é lido
+    quando o Content-Length já passa do limite. O arquivo vai direto para um temporário
+    (memória constante), removido depois da resposta se a rota não o mover.
+    """
+    tipo, opcoes = parse_options_header(request.headers.get("content-type", ""))
+    if tipo != b"multipart/form-data" or not opcoes.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Envie a imagem como multipart/form-data no campo 'file'")
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > UPLOAD_MAX_BYTES + FOLGA_MULTIPART:
+        raise _muito_grande()
+
+    os.makedirs(DIRETORIO_TEMPORARIO, exist_ok=True)
+    arquivo = tempfile.NamedTemporaryFile(dir=DIRETORIO_TEMPORARIO, suffix=".upload", delete=False)
+    try:
+        with arquivo:
+            leitor = _LeitorImagem(arquivo)
+            parser = MultipartParser(opcoes[b"boundary"], leitor.callbacks())
+            recebidos = 0
+            async for pedaco in request.stream():
+                recebidos += len(pedaco)
+                # Sem Content-Length (chunked), o limite vale para o corpo inteiro
+                if recebidos > UPLOAD_MAX_BYTES + FOLGA_MULTIPART:
+                    raise _muito_grande()
+                parser.write(pedaco)
+                leitor.processar()
+            parser.finalize()
+            leitor.processar()
+
+        if not leitor.encontrado:
+            raise HTTPException(status_code=400, detail="Envie a imagem no campo 'file'")
+        if not leitor.completo:
+            raise HTTPException(status_code=400, detail="Upload incompleto")
+        if leitor.dimensoes is None:
+            raise _imagem_invalida()
+
+        largura, altura = leitor.dimensoes
+        yield ImagemRecebida(
+            arquivo.name, leitor.formato, EXTENSOES[leitor.formato], largura, altura, leitor.tamanho,
+            leitor.hash.hexdigest()
+        )
+    finally:
+        if os.path.exists(arquivo.name):
+            os.remove(arquivo.name)
+
+# Corpo documentado no OpenAPI das rotas que usam receber_imagem (o FastAPI não o vê nos parâmetros)
+CORPO_UPLOAD_IMAGEM = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+# === ARMAZENAMENTO POR CONTEÚDO ===
+
+def armazenar_imagem(imagem: ImagemRecebida) -> Tuple[str, str]:
+    """Guarda a imagem recebida pelo hash do conteúdo e retorna (caminho, URL)
+
+    Se a mesma imagem já está armazenada, o temporário é descartado e o arquivo
+    existente é reaproveitado (o mtime é renovado para a coleta não removê-lo antes
+    do commit que volta a referenciá-lo).
+    """
+    nome = f"{imagem.sha256}.{imagem.extensao}"
+    subpasta = f"{PASTA_BLOBS}/{imagem.sha256[:2]}"
+    diretorio = os.path.join(DIRETORIO_UPLOADS, *subpasta.split("/"))
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = os.path.join(diretorio, nome)
+    if os.path.exists(caminho):
+        os.utime(caminho)
+        os.remove(imagem.caminho)
+    else:
+        os.chmod(imagem.caminho, PERMISSOES_UPLOAD)
+        os.replace(imagem.caminho, caminho)
+    return caminho, f"{URL_UPLOADS}/{subpasta}/{nome}"
+
+class ArquivosEstaticos(StaticFiles):
+    """StaticFiles dos uploads: cache imutável e ETag pelo hash nos blobs; revalidação no resto"""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, method=scope["method"])
+        relativo = os.path.relpath(full_path, self.directory).split(os.sep)
+        if relativo[0] == PASTA_BLOBS:
+            # O nome já é o hash do conteúdo (com o tamanho, nas miniaturas)
+            response.headers["etag"] = f'"{os.path.splitext(relativo[-1])[0]}"'
+            response.headers["cache-control"] = CACHE_IMUTAVEL
+        else:
+            # Fotos antigas mudam sem mudar a URL: sempre revalidar pelo ETag
+            response.headers["cache-control"] = "no-cache"
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+def urls_referenciadas(db: Session) -> set:
+    """URLs de fotos e miniaturas ainda usadas por algum aluno ou usuário"""
+    urls = set()
+    for modelo, coluna_url, coluna_variantes in DESTINOS.values():
+        consulta = db.query(getattr(modelo, coluna_url), getattr(modelo, coluna_variantes)).filter(
+            getattr(modelo, coluna_url).isnot(None)
+        )
+        for url, variantes in consulta.yield_per(1000):
+            urls.add(url)
+            for formatos in (variantes or {}).values():
+                urls.update(formatos.values())
+    return urls
+
+def coletar_fotos_orfas(db: Session, carencia: float = FOTOS_GC_CARENCIA, simular: bool = False) -> dict:
+    """Remove as fotos e miniaturas que nenhum registro referencia (e temporários abandonados)"""
+    referenciadas = urls_referenciadas(db)
+    limite = time.time() - carencia
+    removidos = liberados = 0
+
+    pastas = [os.path.join(DIRETORIO_UPLOADS, pasta) for pasta in PASTAS_FOTOS] + [DIRETORIO_TEMPORARIO]
+    for pasta in pastas:
+        for raiz, _, arquivos in os.walk(pasta):
+            for nome in arquivos:
+                caminho = os.path.join(raiz, nome)
+                relativo = os.path.relpath(caminho, DIRETORIO_UPLOADS).replace(os.sep, "/")
+                if f"{URL_UPLOADS}/{relativo}" in referenciadas:
+                    continue
+                try:
+                    info = os.stat(caminho)
+                    if info.st_mtime > limite:
+                        continue
+                    if not simular:
+                        os.remove(caminho)
+                except FileNotFoundError:
+                    continue
+                removidos += 1
+                liberados += info.st_size
+
+    return {"referenciadas": len(referenciadas), "removidos": removidos, "bytes_liberados": liberados}
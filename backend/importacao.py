@@ -0,0 +1,199 @@
+import codecs
+import csv
+import io
+from collections import Counter
+from typing import BinaryIO, Iterator, Optional
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from models import Aluno, Turma, Responsavel, TurmaLotadaError, ajustar_alunos_count, ajustar_estatisticas
+from schemas import AlunoCreate, ResponsavelBase
+
+# Linhas validadas e gravadas por transação
+IMPORTACAO_CHUNK = 1000
+
+# Codificação assumida quando o arquivo não é UTF-8 válido: a do Excel em pt-BR
+# (superconjunto do Latin-1 para os acentos)
+CODIFICACAO_ALTERNATIVA = "cp1252"
+
+# Colunas do responsável no CSV: responsavel_nome, responsavel_parentesco, ...
+PREFIXO_RESPONSAVEL = "responsavel_"
+
+def _detectar_delimitador(cabecalho: str) -> str:
+    """Planilhas exportadas em pt-BR costumam usar ';' no lugar de ','"""
+    return ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+
+def detectar_codificacao(arquivo: BinaryIO) -> str:
+    """utf-8-sig se o arquivo inteiro é UTF-8 válido; senão CODIFICACAO_ALTERNATIVA
+
+    Lê o arquivo uma vez, em blocos (o upload já está em disco), e volta ao início.
+    """
+    decodificador = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while bloco := arquivo.read(1024 * 1024):
+            decodificador.decode(bloco)
+        decodificador.decode(b"", final=True)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return CODIFICACAO_ALTERNATIVA
+    finally:
+        arquivo.seek(0)
+
+def _mensagens(erro: ValidationError) -> list:
+    return [f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in erro.errors()]
+
+def _validar_linha(linha: dict):
+    """Valida uma linha do CSV com as mesmas regras de POST /alunos"""
+    campos_aluno = {}
+    campos_responsavel = {}
+    for coluna, valor in linha.items():
+        if coluna is None:
+            continue
+        coluna = coluna.strip()
+        valor = (valor or "").strip()
+        if not valor:
+            continue  # Campos vazios usam o padrão do schema
+        if coluna.startswith(PREFIXO_RESPONSAVEL):
+            campos_responsavel[coluna[len(PREFIXO_RESPONSAVEL):]] = valor
+        else:
+            campos_aluno[coluna] = valor
+
+    aluno = AlunoCreate(**campos_aluno)
+    responsavel = ResponsavelBase(**campos_responsavel) if campos_responsavel else None
+    return aluno, responsavel
+
+def _gravar_chunk(db: Session, validas: list, erros: list) -> int:
+    """Grava um bloco de linhas válidas em uma única transação e retorna quantos alunos entraram"""
+    # Vagas disponíveis nas turmas citadas no bloco (uma consulta)
+    turma_ids = {aluno.turma_id for _, aluno, _ in validas if aluno.turma_id}
+    vagas = {
+        turma_id: capacidade - alunos_count
+        for turma_id, capacidade, alunos_count in
+        db.query(Turma.id, Turma.capacidade, Turma.alunos_count).filter(Turma.id.in_(turma_ids))
+    } if turma_ids else {}
+
+    aceitas = []
+    reservas = Counter()
+    for numero, aluno, responsavel in validas:
+        if aluno.turma_id:
+            if aluno.turma_id not in vagas:
+                erros.append({"linha": numero, "erros": ["Turma não encontrada"]})
+                continue
+            if vagas[aluno.turma_id] <= 0:
+                erros.append({"linha": numero, "erros": ["Turma já está na capacidade máxima"]})
+                continue
+            vagas[aluno.turma_id] -= 1
+            reservas[aluno.turma_id] += 1
+        aceitas.append((numero, aluno, responsavel))
+
+    if not aceitas:
+        return 0
+
+    try:
+        conn = db.connection()
+        # Reserva as vagas de cada turma com um único UPDATE condicional
+        for turma_id, quantidade in reservas.items():
+            ajustar_alunos_count(conn, turma_id, quantidade)
+
+        ids = db.execute(
+            insert(Aluno).returning(Aluno.id, sort_by_parameter_order=True),
+            [aluno.dict() for _, aluno, _ in aceitas]
+        ).scalars().all()
+
+        responsaveis = [
+            {**responsavel.dict(), "aluno_id": aluno_id}
+            for aluno_id, (_, _, responsavel) in zip(ids, aceitas)
+            if responsavel is not None
+        ]
+        if responsaveis:
+            db.execute(insert(Responsavel), responsaveis)
+
+        # Inserções em lote não passam pelos eventos do ORM: ajusta o snapshot aqui
+        status = Counter(aluno.status for _, aluno, _ in aceitas)
+        ajustar_estatisticas(conn, {
+            "total_alunos": len(aceitas),
+            "alunos_ativos": status["ativo"],
+            "alunos_inativos": status["inativo"],
+            "total_responsaveis": len(responsaveis),
+        })
+        db.commit()
+    except TurmaLotadaError:
+        db.rollback()
+        for numero, _, _ in aceitas:
+            erros.append({"linha": numero, "erros": ["Turma lotou durante a importação; reenvie a linha"]})
+        return 0
+    except Exception as e:
+        db.rollback()
+        for numero, _, _ in aceitas:
+            erros.append({"linha": numero, "erros": [f"Erro ao gravar: {str(e)}"]})
+        return 0
+
+    return len(aceitas)
+
+def importar_alunos_csv(arquivo: BinaryIO, db: Session, codificacao: Optional[str] = None) -> Iterator[dict]:
+    """Importa alunos (e um responsável opcional por linha) de um CSV, em blocos
+
+    Gera um evento de progresso por bloco gravado e um resumo ao final. Apenas
+    um bloco fica em memória por vez, independente do tamanho do arquivo. Sem
+    `codificacao`, usa UTF-8 ou, se o arquivo não for UTF-8 válido, cp1252. Um
+    arquivo ilegível gera um evento de erro (a resposta já começou a ser enviada).
+    """
+    texto = io.TextIOWrapper(arquivo, encoding=codificacao or detectar_codificacao(arquivo), newline="")
+    processadas = importadas = total_erros = 0
+    validas = []
+    erros = []
+    leitor = None
+
+    def concluir_chunk():
+        nonlocal importadas, total_erros
+        importadas += _gravar_chunk(db, validas, erros)
+        total_erros += len(erros)
+        evento = {
+            "tipo": "progresso",
+            "processadas": processadas,
+            "importadas": importadas,
+            "erros": total_erros,
+            "linhas_com_erro": list(erros),
+        }
+        validas.clear()
+        erros.clear()
+        return evento
+
+    try:
+        cabecalho = texto.readline()
+        if not cabecalho.strip():
+            yield {"tipo": "erro", "detail": "Arquivo CSV vazio"}
+            return
+
+        delimitador = _detectar_delimitador(cabecalho)
+        colunas = next(csv.reader([cabecalho], delimiter=delimitador))
+        leitor = csv.DictReader(texto, fieldnames=colunas, delimiter=delimitador)
+
+        for linha in leitor:
+            processadas += 1
+            # Linha física no arquivo (o cabeçalho é a linha 1)
+            numero = leitor.line_num + 1
+            try:
+                aluno, responsavel = _validar_linha(linha)
+                validas.append((numero, aluno, responsavel))
+            except ValidationError as e:
+                erros.append({"linha": numero, "erros": _mensagens(e)})
+
+            if processadas % IMPORTACAO_CHUNK == 0:
+                yield concluir_chunk()
+    except (UnicodeDecodeError, csv.Error) as e:
+        # Os blocos anteriores já foram gravados; o bloco em andamento é descartado
+        linha = leitor.line_num + 2 if leitor is not None else 1
+        motivo = f"codificação inválida ({texto.encoding})" if isinstance(e, UnicodeDecodeError) else str(e)
+        yield {
+            "tipo": "erro",
+            "detail": f"Arquivo CSV ilegível perto da linha {linha}: {motivo}. Nada a partir do bloco atual foi importado",
+            "processadas": processadas,
+            "importadas": importadas,
+        }
+        return
+
+    if validas or erros:
+        yield concluir_chunk()
+
+    yield {"tipo": "resumo", "processadas": processadas, "importadas": importadas, "erros": total_erros}
@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import time
+from dotenv import load_dotenv
+from starlette.datastructures import MutableHeaders
+from database import MedicaoSQL, encerrar_medicao_sql, iniciar_medicao_sql
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# A mesma instrução repetida este número de vezes numa requisição é sinalizada como N+1
+SQL_NPLUS1_THRESHOLD = int(os.getenv("SQL_NPLUS1_THRESHOLD", 5))
+# Orçamento padrão de consultas para rotas sem @orcamento_consultas (0 = sem limite)
+SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", 0))
+# Modo estrito (testes): requisição que estoura o orçamento responde 500 em vez de só gerar aviso
+SQL_STRICT_BUDGET = os.getenv("SQL_STRICT_BUDGET", "false").lower() in ("1", "true", "yes")
+
+def orcamento_consultas(limite: int):
+    """Define quantas consultas SQL a rota pode executar por requisição"""
+    def decorador(funcao):
+        funcao.orcamento_consultas = limite
+        return funcao
+    return decorador
+
+_rotas_por_endpoint = {}
+
+def rota_da_requisicao(scope) -> str:
+    """Template da rota atendida (ex.: /alunos/{aluno_id}), não a URL concreta"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "nao_roteada"
+    rota = _rotas_por_endpoint.get(endpoint)
+    if rota is None:
+        for route in scope["app"].routes:
+            _rotas_por_endpoint[getattr(route, "endpoint", None) or route.app] = route.path
+        rota = _rotas_por_endpoint.get(endpoint, "nao_roteada")
+    return rota
+
+def _orcamento(scope) -> int:
+    return getattr(scope.get("endpoint"), "orcamento_consultas", SQL_QUERY_BUDGET)
+
+def _repetidas(medicao: MedicaoSQL) -> list:
+    return [(instrucao, vezes) for instrucao, vezes in medicao.por_instrucao.items() if vezes >= SQL_NPLUS1_THRESHOLD]
+
+class InstrumentacaoSQL:
+    """Middleware ASGI: mede as consultas de cada requisição e as reporta em Server-Timing e no log"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        medicao, token = iniciar_medicao_sql(scope)
+        inicio = time.perf_counter()
+        descartar = False
+
+        async def enviar(message):
+            nonlocal descartar
+            if message["type"] == "http.response.start":
+                orcamento = _orcamento(scope)
+                if SQL_STRICT_BUDGET and orcamento and medicao.consultas > orcamento:
+                    # Substitui a resposta da rota; o corpo original é descartado
+                    descartar = True
+                    corpo = json.dumps({
+                        "detail": f"Orçamento de consultas excedido em {rota_da_requisicao(scope)}: "
+                                  f"{medicao.consultas} > {orcamento}"
+                    }, ensure_ascii=False).encode("utf-8")
+                    await send({
+                        "type": "http.response.start",
+                        "status": 500,
+                        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode())],
+                    })
+                    await send({"type": "http.response.body", "body": corpo})
+                    return
+                total = (time.perf_counter() - inicio) * 1000
+                MutableHeaders(scope=message).append(
+                    "Server-Timing",
+                    f'db;dur={medicao.tempo * 1000:.2f};desc="{medicao.consultas} consultas", app;dur={total:.2f}'
+                )
+            elif descartar:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            encerrar_medicao_sql(token)
+            self._registrar(scope, medicao, time.perf_counter() - inicio)
+
+    def _registrar(self, scope, medicao: MedicaoSQL, duracao: float):
+        rota = f"{scope['method']} {rota_da_requisicao(scope)}"
+        for instrucao, vezes in _repetidas(medicao):
+            logger.warning("Possível N+1 em %s: %dx %s", rota, vezes, " ".join(instrucao.split())[:200])
+        orcamento = _orcamento(scope)
+        if orcamento and medicao.consultas > orcamento and not SQL_STRICT_BUDGET:
+            logger.warning("%s excedeu o orçamento de consultas: %d > %d", rota, medicao.consultas, orcamento)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "%s: %d consultas, %.2f ms no banco, %.2f ms no total",
+                rota, medicao.consultas, medicao.tempo * 1000, duracao * 1000
+            )
@@ -0,0 +1,201 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from cache import TTLCache, USER_CACHE_MAX_SIZE
+from database import (
+    DATABASE_URL, SQLITE_PRAGMAS, AsyncQueuePoolMedido, AsyncSessionLocal, QueuePoolMedido, SessionLocal,
+    engine, instrumentar_engine, opcoes_engine, url_assincrona
+)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Leituras (GET) podem ir para uma réplica (READ_DATABASE_URL) ou, no SQLite, para uma
+# cópia do banco renovada periodicamente com a API de backup (READ_SNAPSHOT=true)
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+READ_SNAPSHOT = os.getenv("READ_SNAPSHOT", "false").lower() in ("1", "true", "yes")
+READ_SNAPSHOT_INTERVAL = float(os.getenv("READ_SNAPSHOT_INTERVAL", 5))  # segundos entre cópias
+READ_SNAPSHOT_PATH = os.getenv("READ_SNAPSHOT_PATH")  # padrão: <banco>-leitura
+# Defasagem máxima aceita: cópia mais antiga que isso faz as leituras voltarem ao banco principal.
+# Com réplica, é também a janela em que quem acabou de escrever lê do principal.
+READ_MAX_STALENESS = float(os.getenv("READ_MAX_STALENESS", 30))  # segundos
+
+# Momento da última escrita de cada usuário (leia-suas-escritas; vale por worker)
+ultimas_escritas = TTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl=max(READ_MAX_STALENESS, READ_SNAPSHOT_INTERVAL) * 2)
+
+def _caminho_snapshot() -> Optional[str]:
+    url = make_url(DATABASE_URL)
+    if not READ_SNAPSHOT or url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return READ_SNAPSHOT_PATH or f"{url.database}-leitura"
+
+SNAPSHOT_PATH = _caminho_snapshot()
+
+def _aplicar_pragmas_leitura(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only = ON")
+    for pragma in ("mmap_size", "cache_size", "temp_store"):
+        cursor.execute(f"PRAGMA {pragma} = {SQLITE_PRAGMAS[pragma]}")
+    cursor.close()
+
+# Uma engine sync (rotas de leitura) e uma async (rotas de leitura em /async) por origem
+if READ_DATABASE_URL:
+    ORIGEM_LEITURA = "replica"
+    read_engine = create_engine(READ_DATABASE_URL, **opcoes_engine(READ_DATABASE_URL, QueuePoolMedido))
+    _url_leitura_async = url_assincrona(READ_DATABASE_URL)
+    read_engine_async = create_async_engine(_url_leitura_async, **opcoes_engine(_url_leitura_async, AsyncQueuePoolMedido))
+elif SNAPSHOT_PATH:
+    ORIGEM_LEITURA = "snapshot"
+    # Sem pool: cada sessão abre o arquivo atual, já que a cópia é trocada por os.replace
+    read_engine = create_engine(
+        f"sqlite:///{SNAPSHOT_PATH}", connect_args={"check_same_thread": False}, poolclass=NullPool
+    )
+    read_engine_async = create_async_engine(f"sqlite+aiosqlite:///{SNAPSHOT_PATH}", poolclass=NullPool)
+    event.listen(read_engine, "connect", _aplicar_pragmas_leitura)
+    event.listen(read_engine_async.sync_engine, "connect", _aplicar_pragmas_leitura)
+else:
+    ORIGEM_LEITURA = None
+    read_engine = None
+    read_engine_async = None
+
+if read_engine is not None:
+    instrumentar_engine(read_engine)
+    instrumentar_engine(read_engine_async.sync_engine)
+
+ReadSessionLocal = (
+    sessionmaker(read_engine, autoflush=False, expire_on_commit=False)
+    if read_engine is not None else None
+)
+ReadSessionLocalAsync = (
+    async_sessionmaker(read_engine_async, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    if read_engine_async is not None else None
+)
+
+# === SNAPSHOT DO SQLITE ===
+
+def idade_snapshot() -> Optional[float]:
+    """Segundos desde o início da cópia atual (None se ainda não existe)"""
+    try:
+        return max(time.time() - os.stat(SNAPSHOT_PATH).st_mtime, 0.0)
+    except (OSError, TypeError):
+        return None
+
+def atualizar_snapshot():
+    """Copia o banco principal para o arquivo de leitura com a API de backup do SQLite
+
+    A cópia é gravada em um arquivo temporário e trocada atomicamente; o mtime do
+    arquivo registra o início da cópia, para que todos os workers vejam a mesma idade.
+    """
+    inicio = time.time()
+    temporario = f"{SNAPSHOT_PATH}.{os.getpid()}.tmp"
+    origem = engine.raw_connection()
+    try:
+        destino = sqlite3.connect(temporario)
+        try:
+            origem.driver_connection.backup(destino)
+            # Cópia fica em modo rollback journal: dispensa -wal/-shm para quem só lê
+            destino.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            destino.close()
+        os.utime(temporario, (inicio, inicio))
+        os.replace(temporario, SNAPSHOT_PATH)
+    finally:
+        origem.close()
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+_parar_snapshot = threading.Event()
+_thread_snapshot: Optional[threading.Thread] = None
+
+def _renovar_snapshot():
+    while not _parar_snapshot.is_set():
+        idade = idade_snapshot()
+        # Outro worker pode ter renovado a cópia há pouco
+        if idade is None or idade >= READ_SNAPSHOT_INTERVAL:
+            try:
+                atualizar_snapshot()
+            except Exception:
+                logger.exception("Falha ao atualizar o snapshot de leitura")
+        _parar_snapshot.wait(READ_SNAPSHOT_INTERVAL)
+
+def iniciar_snapshot_leitura():
+    """Inicia a renovação periódica do snapshot (sem efeito se READ_SNAPSHOT estiver desligado)"""
+    global _thread_snapshot
+    if SNAPSHOT_PATH is None or _thread_snapshot is not None:
+        return
+    _parar_snapshot.clear()
+    _thread_snapshot = threading.Thread(target=_renovar_snapshot, name="snapshot-leitura", daemon=True)
+    _thread_snapshot.start()
+
+def parar_snapshot_leitura():
+    """Interrompe a renovação do snapshot e fecha as conexões de leitura"""
+    global _thread_snapshot
+    if _thread_snapshot is not None:
+        _parar_snapshot.set()
+        _thread_snapshot.join()
+        _thread_snapshot = None
+    if read_engine is not None:
+        read_engine.dispose()
+
+async def fechar_leitura_async():
+    """Fecha as conexões da engine de leitura assíncrona"""
+    if read_engine_async is not None:
+        await read_engine_async.dispose()
+
+# === ROTEAMENTO ===
+
+def registrar_escrita(user_id: int):
+    """Marca que o usuário acabou de escrever: as próximas leituras dele vão ao banco principal"""
+    ultimas_escritas.set(int(user_id), time.time())
+
+@event.listens_for(SessionLocal, "after_flush")
+def _marcar_flush(session, flush_context):
+    session.info["escreveu"] = True
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _marcar_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["escreveu"] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def _registrar_commit(session):
+    if session.info.pop("escreveu", False) and session.info.get("user_id") is not None:
+        registrar_escrita(session.info["user_id"])
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _descartar_escrita(session):
+    session.info.pop("escreveu", None)
+
+def escolher_leitura(user_id: Optional[int], assincrona: bool = False) -> Tuple[sessionmaker, str, Optional[float]]:
+    """Decide de onde o usuário lê: (fábrica de sessões, origem, idade dos dados em segundos)
+
+    Com assincrona=True, as fábricas devolvidas criam AsyncSession (rotas em /async).
+    """
+    primario, copia = (AsyncSessionLocal, ReadSessionLocalAsync) if assincrona else (SessionLocal, ReadSessionLocal)
+    if copia is None:
+        return primario, "primary", None
+
+    escrita = ultimas_escritas.get(user_id) if user_id is not None else None
+
+    if ORIGEM_LEITURA == "replica":
+        if escrita is not None and time.time() - escrita < READ_MAX_STALENESS:
+            return primario, "primary", None
+        return copia, "replica", None
+
+    idade = idade_snapshot()
+    if idade is None or idade > READ_MAX_STALENESS:
+        return primario, "primary", None
+    # Escreveu depois do início da cópia: a cópia ainda não tem a escrita dele
+    if escrita is not None and escrita >= time.time() - idade:
+        return primario, "primary", None
+    return copia, "snapshot", idade
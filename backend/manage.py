@@ -0,0 +1,85 @@
+"""Comandos de manutenção do banco de dados
+
+Uso:
+    python manage.py reconciliar-contadores
+    python manage.py recalcular-estatisticas
+    python manage.py migrar
+    python manage.py gerar-miniaturas
+    python manage.py limpar-fotos [--simular] [--carencia SEGUNDOS]
+"""
+import argparse
+from database import SCHEMA_VERSION, SessionLocal, init_db
+from estatisticas import reconciliar_contadores, recalcular_estatisticas
+from miniaturas import regenerar_miniaturas
+from imagens import FOTOS_GC_CARENCIA, coletar_fotos_orfas
+
+def cmd_reconciliar_contadores(args):
+    db = SessionLocal()
+    try:
+        divergentes = reconciliar_contadores(db)
+        for turma in divergentes:
+            print(f"{turma['nome']}: {turma['alunos_count']} -> {turma['alunos_reais']}")
+        print(f"Turmas corrigidas: {len(divergentes)}")
+    finally:
+        db.close()
+
+def cmd_recalcular_estatisticas(args):
+    db = SessionLocal()
+    try:
+        reconciliar_contadores(db)
+        snapshot = recalcular_estatisticas(db)
+        print(f"Estatísticas recalculadas: {snapshot.total_alunos} alunos, {snapshot.total_turmas} turmas")
+    finally:
+        db.close()
+
+def cmd_migrar(args):
+    # init_db já rodou em main(); com forcar=True refaz a verificação completa
+    init_db(forcar=True)
+    print(f"Schema verificado e gravado na versão {SCHEMA_VERSION}")
+
+def cmd_gerar_miniaturas(args):
+    db = SessionLocal()
+    try:
+        print(f"Fotos com miniaturas geradas: {regenerar_miniaturas(db)}")
+    finally:
+        db.close()
+
+def cmd_limpar_fotos(args):
+    db = SessionLocal()
+    try:
+        resultado = coletar_fotos_orfas(db, carencia=args.carencia, simular=args.simular)
+        acao = "seriam removidos" if args.simular else "removidos"
+        print(
+            f"Arquivos referenciados: {resultado['referenciadas']}; {acao}: {resultado['removidos']} "
+            f"({resultado['bytes_liberados'] / 1024 / 1024:.1f}MB)"
+        )
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Manutenção do banco do Sistema de Gestão Escolar")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+    
+    reconciliar = subparsers.add_parser("reconciliar-contadores", help="Recalcula o número de alunos de cada turma")
+    reconciliar.set_defaults(func=cmd_reconciliar_contadores)
+    
+    recalcular = subparsers.add_parser("recalcular-estatisticas", help="Recalcula o snapshot usado por /estatisticas")
+    recalcular.set_defaults(func=cmd_recalcular_estatisticas)
+    
+    migrar = subparsers.add_parser("migrar", help="Cria tabelas, colunas e índices que faltam, mesmo com a versão do schema em dia")
+    migrar.set_defaults(func=cmd_migrar)
+    
+    miniaturas = subparsers.add_parser("gerar-miniaturas", help="Gera as variantes das fotos enviadas antes das miniaturas existirem")
+    miniaturas.set_defaults(func=cmd_gerar_miniaturas)
+    
+    limpar = subparsers.add_parser("limpar-fotos", help="Remove fotos e miniaturas que nenhum aluno ou usuário referencia")
+    limpar.add_argument("--simular", action="store_true", help="Só informa o que seria removido")
+    limpar.add_argument("--carencia", type=float, default=FOTOS_GC_CARENCIA, help="Idade mínima (segundos) dos arquivos removidos")
+    limpar.set_defaults(func=cmd_limpar_fotos)
+    
+    args = parser.parse_args()
+    init_db()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import heapq
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, List, Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from models import Aluno, Turma, ajustar_alunos_count, ajustar_estatisticas
+
+# Limite de ids por cláusula IN (o SQLite aceita no máximo 32766 parâmetros)
+BLOCO_IDS = 900
+
+class MatriculaLoteError(Exception):
+    """Erro de validação de uma matrícula em lote, com o status HTTP correspondente"""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def _em_blocos(ids: list, tamanho: int = BLOCO_IDS) -> Iterable[list]:
+    for inicio in range(0, len(ids), tamanho):
+        yield ids[inicio:inicio + tamanho]
+
+def _carregar_turmas(db: Session, turma_ids: Iterable[int]) -> dict:
+    turma_ids = sorted(set(turma_ids))
+    turmas = {}
+    for bloco in _em_blocos(turma_ids):
+        for turma_id, capacidade, alunos_count in db.query(Turma.id, Turma.capacidade, Turma.alunos_count).filter(Turma.id.in_(bloco)):
+            turmas[turma_id] = {"capacidade": capacidade, "alunos_count": alunos_count}
+    faltando = [t for t in turma_ids if t not in turmas]
+    if faltando:
+        raise MatriculaLoteError(404, f"Turmas não encontradas: {', '.join(map(str, faltando))}")
+    return turmas
+
+def _carregar_alunos(db: Session, aluno_ids: List[int]) -> dict:
+    alunos = {}
+    for bloco in _em_blocos(sorted(set(aluno_ids))):
+        for aluno_id, turma_id, status in db.query(Aluno.id, Aluno.turma_id, Aluno.status).filter(Aluno.id.in_(bloco)):
+            alunos[aluno_id] = {"turma_id": turma_id, "status": status}
+    faltando = [a for a in aluno_ids if a not in alunos]
+    if faltando:
+        raise MatriculaLoteError(404, f"Alunos não encontrados: {', '.join(map(str, faltando))}")
+    return alunos
+
+def aplicar_matriculas(db: Session, pares: List[tuple]) -> dict:
+    """Matricula cada (aluno_id, turma_id) de uma vez, em uma única transação
+
+    Todas as matrículas entram ou nenhuma entra: se alguma turma passar da
+    capacidade, nada é gravado. Quem já está na turma de destino apenas é ativado.
+    """
+    aluno_ids = [aluno_id for aluno_id, _ in pares]
+    repetidos = sorted(a for a, n in Counter(aluno_ids).items() if n > 1)
+    if repetidos:
+        raise MatriculaLoteError(422, f"Alunos repetidos no lote: {', '.join(map(str, repetidos))}")
+
+    alunos = _carregar_alunos(db, aluno_ids)
+    turmas = _carregar_turmas(db, [turma_id for _, turma_id in pares])
+
+    # Saldo de alunos por turma (entradas - saídas) e alunos agrupados por destino
+    saldo = Counter()
+    por_destino = {}
+    for aluno_id, turma_id in pares:
+        origem = alunos[aluno_id]["turma_id"]
+        if origem != turma_id:
+            saldo[turma_id] += 1
+            if origem is not None:
+                saldo[origem] -= 1
+        por_destino.setdefault(turma_id, []).append(aluno_id)
+
+    lotadas = [
+        turma_id for turma_id, delta in saldo.items()
+        if delta > 0 and turmas[turma_id]["alunos_count"] + delta > turmas[turma_id]["capacidade"]
+    ]
+    if lotadas:
+        raise MatriculaLoteError(400, f"Turmas sem vagas suficientes: {', '.join(map(str, sorted(lotadas)))}")
+
+    reativados = sum(1 for aluno_id in aluno_ids if alunos[aluno_id]["status"] == "inativo")
+
+    conn = db.connection()
+    # Saídas primeiro: liberam vagas para quem troca entre turmas do mesmo lote
+    for turma_id, delta in sorted(saldo.items(), key=lambda item: item[1]):
+        if delta:
+            ajustar_alunos_count(conn, turma_id, delta)
+
+    agora = datetime.utcnow()
+    for turma_id, ids in por_destino.items():
+        for bloco in _em_blocos(ids):
+            db.execute(
+                update(Aluno)
+                .where(Aluno.id.in_(bloco))
+                .values(turma_id=turma_id, status="ativo", data_atualizacao=agora)
+                .execution_options(synchronize_session=False)
+            )
+
+    ajustar_estatisticas(conn, {"alunos_ativos": reativados, "alunos_inativos": -reativados})
+    db.commit()
+
+    return {
+        "matriculados": len(pares),
+        "turmas": [
+            {"turma_id": turma_id, "alunos_count": turmas[turma_id]["alunos_count"] + saldo[turma_id]}
+            for turma_id in sorted(por_destino)
+        ]
+    }
+
+def distribuir_alunos(db: Session, turma_ids: List[int], aluno_ids: Optional[List[int]] = None) -> dict:
+    """Distribui alunos entre as turmas, sempre na turma com mais vagas livres
+
+    Sem aluno_ids, distribui todos os alunos sem turma (em ordem de nome). Alunos
+    informados que já estão em uma das turmas entram na redistribuição com a própria vaga.
+    Quem não couber em nenhuma turma é devolvido em nao_alocados.
+    """
+    turmas = _carregar_turmas(db, turma_ids)
+
+    if aluno_ids is None:
+        aluno_ids = [
+            aluno_id for (aluno_id,) in
+            db.query(Aluno.id).filter(Aluno.turma_id.is_(None)).order_by(Aluno.nome, Aluno.id)
+        ]
+    else:
+        # Quem já está numa das turmas devolve a vaga antes da distribuição (senão ela conta
+        # como ocupada e o aluno ainda recebe outra). Esses alunos vêm primeiro: cada um
+        # devolveu uma vaga, então nenhum fica sem turma e a vaga não vai para outro
+        alunos = _carregar_alunos(db, aluno_ids)
+        ja_matriculados = {aluno_id for aluno_id, aluno in alunos.items() if aluno["turma_id"] in turmas}
+        for aluno_id in ja_matriculados:
+            turmas[alunos[aluno_id]["turma_id"]]["alunos_count"] -= 1
+        aluno_ids = sorted(aluno_ids, key=lambda aluno_id: aluno_id not in ja_matriculados)
+
+    # Heap de (-vagas livres, turma_id): a turma mais vazia sai primeiro
+    livres = [
+        (-(turma["capacidade"] - turma["alunos_count"]), turma_id)
+        for turma_id, turma in turmas.items()
+        if turma["capacidade"] > turma["alunos_count"]
+    ]
+    heapq.heapify(livres)
+
+    pares = []
+    nao_alocados = []
+    for aluno_id in aluno_ids:
+        if not livres:
+            nao_alocados.append(aluno_id)
+            continue
+        vagas, turma_id = heapq.heappop(livres)
+        pares.append((aluno_id, turma_id))
+        if vagas + 1 < 0:
+            heapq.heappush(livres, (vagas + 1, turma_id))
+
+    resultado = aplicar_matriculas(db, pares) if pares else {"matriculados": 0, "turmas": []}
+    resultado["nao_alocados"] = nao_alocados
+    return resultado
@@ -0,0 +1,146 @@
+import os
+import time
+from bisect import bisect_left
+from collections import Counter
+from dotenv import load_dotenv
+from sqlalchemy.pool import QueuePool
+from cache import user_cache
+from database import async_engine, async_pool_stats, engine, pool_stats
+from instrumentacao import rota_da_requisicao
+from security import hash_queue_stats
+
+load_dotenv()
+
+# Token opcional exigido em GET /metrics (Authorization: Bearer <token>); vazio = aberto
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Limites (em segundos) dos buckets do histograma de latência
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Histograma:
+    __slots__ = ("contagens", "soma", "total")
+
+    def __init__(self):
+        self.contagens = [0] * (len(BUCKETS_LATENCIA) + 1)  # último = +Inf
+        self.soma = 0.0
+        self.total = 0
+
+# Estado das métricas deste worker. Só é alterado no loop de eventos (middleware
+# ASGI), então não precisa de lock.
+_requisicoes = {}  # (método, rota, status) -> contagem
+_latencias = {}  # (método, rota) -> _Histograma
+# Requisições em andamento: id(scope) -> scope. O template da rota só existe depois do
+# roteamento (scope["endpoint"], preenchido dentro da chamada ao app), então a contagem
+# por rota é feita na coleta; as ainda não roteadas aparecem como nao_roteada.
+_em_andamento = {}
+
+class MetricasHTTP:
+    """Middleware ASGI: contagem, requisições em andamento e latência por template de rota"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        async def enviar(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        andamento = id(scope)
+        _em_andamento[andamento] = scope
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracao = time.perf_counter() - inicio
+            del _em_andamento[andamento]
+            chave = (scope["method"], rota_da_requisicao(scope))
+            histograma = _latencias.get(chave)
+            if histograma is None:
+                histograma = _latencias[chave] = _Histograma()
+            histograma.contagens[bisect_left(BUCKETS_LATENCIA, duracao)] += 1
+            histograma.soma += duracao
+            histograma.total += 1
+            chave_status = (*chave, status)
+            _requisicoes[chave_status] = _requisicoes.get(chave_status, 0) + 1
+
+def _rotulos(**rotulos) -> str:
+    def escapar(valor) -> str:
+        return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{nome}="{escapar(valor)}"' for nome, valor in rotulos.items()) + "}"
+
+def _metrica(linhas: list, nome: str, tipo: str, ajuda: str, amostras: list):
+    linhas.append(f"# HELP {nome} {ajuda}")
+    linhas.append(f"# TYPE {nome} {tipo}")
+    for sufixo, rotulos, valor in amostras:
+        linhas.append(f"{nome}{sufixo}{_rotulos(**rotulos) if rotulos else ''} {valor}")
+
+def _amostras_pool(pool, stats) -> dict:
+    valores = {
+        "checkouts": stats.checkouts,
+        "timeouts": stats.timeouts,
+        "espera": stats.espera_total,
+    }
+    if isinstance(pool, QueuePool):
+        valores.update(tamanho=pool.size(), em_uso=pool.checkedout(), overflow=max(pool.overflow(), 0))
+    return valores
+
+def gerar_metricas() -> str:
+    """Todas as métricas deste worker no formato de texto do Prometheus"""
+    linhas = []
+
+    _metrica(linhas, "http_requests_total", "counter", "Requisições HTTP atendidas", [
+        ("", {"method": metodo, "route": rota, "status": status}, total)
+        for (metodo, rota, status), total in sorted(_requisicoes.items())
+    ])
+    # list() copia os valores de uma vez (sob o GIL), sem concorrer com o loop de eventos
+    em_andamento = Counter((scope["method"], rota_da_requisicao(scope)) for scope in list(_em_andamento.values()))
+    _metrica(linhas, "http_requests_in_flight", "gauge", "Requisições HTTP em andamento por rota", [
+        ("", {"method": metodo, "route": rota}, total)
+        for (metodo, rota), total in sorted(em_andamento.items())
+    ])
+
+    amostras = []
+    for (metodo, rota), histograma in sorted(_latencias.items()):
+        acumulado = 0
+        for limite, contagem in zip((*BUCKETS_LATENCIA, "+Inf"), histograma.contagens):
+            acumulado += contagem
+            amostras.append(("_bucket", {"method": metodo, "route": rota, "le": limite}, acumulado))
+        amostras.append(("_sum", {"method": metodo, "route": rota}, round(histograma.soma, 6)))
+        amostras.append(("_count", {"method": metodo, "route": rota}, histograma.total))
+    _metrica(linhas, "http_request_duration_seconds", "histogram", "Latência das requisições HTTP por rota", amostras)
+
+    pools = {
+        "sync": _amostras_pool(engine.pool, pool_stats),
+        "async": _amostras_pool(async_engine.pool, async_pool_stats),
+    }
+    for chave, nome, tipo, ajuda in (
+        ("tamanho", "db_pool_size", "gauge", "Tamanho configurado do pool de conexões"),
+        ("em_uso", "db_pool_checked_out", "gauge", "Conexões do pool em uso"),
+        ("overflow", "db_pool_overflow", "gauge", "Conexões abertas além do tamanho do pool"),
+        ("checkouts", "db_pool_checkouts_total", "counter", "Conexões obtidas do pool"),
+        ("timeouts", "db_pool_checkout_timeouts_total", "counter", "Esperas por conexão que estouraram o timeout"),
+        ("espera", "db_pool_checkout_wait_seconds_total", "counter", "Tempo total esperando conexão livre no pool"),
+    ):
+        _metrica(linhas, nome, tipo, ajuda, [
+            ("", {"engine": engine_nome}, round(valores[chave], 6) if chave == "espera" else valores[chave])
+            for engine_nome, valores in pools.items() if chave in valores
+        ])
+
+    cache = user_cache.stats()
+    _metrica(linhas, "user_cache_size", "gauge", "Usuários no cache em memória", [("", None, cache["tamanho"])])
+    _metrica(linhas, "user_cache_hits_total", "counter", "Acertos do cache de usuários", [("", None, cache["hits"])])
+    _metrica(linhas, "user_cache_misses_total", "counter", "Erros do cache de usuários", [("", None, cache["misses"])])
+
+    hash_senhas = hash_queue_stats()
+    _metrica(linhas, "bcrypt_workers", "gauge", "Processos do pool do bcrypt", [("", None, hash_senhas["workers"])])
+    _metrica(linhas, "bcrypt_queue_capacity", "gauge", "Operações de bcrypt admitidas ao mesmo tempo", [("", None, hash_senhas["capacidade"])])
+    _metrica(linhas, "bcrypt_queue_in_use", "gauge", "Operações de bcrypt em execução ou na fila", [("", None, hash_senhas["em_uso"])])
+
+    return "\n".join(linhas) + "\n"
@@ -0,0 +1,184 @@
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from dotenv import load_dotenv
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from cache import invalidar_usuario
+from database import SessionLocal, retry_on_lock
+from models import Aluno, User
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Lado máximo (px) de cada variante gerada a partir da foto enviada
+THUMB_SIZES = sorted({int(t) for t in os.getenv("THUMB_SIZES", "64,160,400").split(",") if t.strip()}, reverse=True)
+THUMB_FORMATS = [f.strip().lower() for f in os.getenv("THUMB_FORMATS", "webp,jpeg").split(",") if f.strip()]
+THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", 80))
+# Processos dedicados às miniaturas: o redimensionamento não ocupa o worker da API
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", min(2, os.cpu_count() or 1)))
+
+EXTENSOES = {"webp": "webp", "jpeg": "jpg"}
+
+# Registro que recebe as variantes: (modelo, coluna com a URL da foto, coluna das variantes)
+DESTINOS = {
+    "aluno": (Aluno, "foto_url", "foto_variantes"),
+    "usuario": (User, "profile_photo", "profile_photo_variantes"),
+}
+
+_executor = None
+# Grava as variantes no banco: os callbacks do pool de processos rodam na thread que o
+# gerencia, que não deve esperar por banco (nem por retry_on_lock)
+_gravacoes = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor, _gravacoes
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=THUMB_WORKERS)
+            _gravacoes = ThreadPoolExecutor(max_workers=1, thread_name_prefix="miniaturas")
+        return _executor
+
+def shutdown_miniaturas():
+    """Encerra o pool de miniaturas, terminando as que já foram agendadas (e suas gravações)"""
+    global _executor, _gravacoes
+    with _executor_lock:
+        if _executor is not None:
+            # Depois deste shutdown todos os callbacks já rodaram e agendaram suas gravações
+            _executor.shutdown(wait=True)
+            _gravacoes.shutdown(wait=True)
+            _executor = None
+            _gravacoes = None
+
+def nome_variante(prefixo: str, lado: int, formato: str) -> str:
+    return f"{prefixo}_{lado}.{EXTENSOES[formato]}"
+
+def variantes_prontas(url: str, caminho: str):
+    """URLs das variantes se todas já existem em disco (mesma foto enviada antes); senão None"""
+    diretorio, arquivo = os.path.split(caminho)
+    prefixo = os.path.splitext(arquivo)[0]
+    arquivos = {lado: {formato: nome_variante(prefixo, lado, formato) for formato in THUMB_FORMATS} for lado in THUMB_SIZES}
+    caminhos = [os.path.join(diretorio, nome) for formatos in arquivos.values() for nome in formatos.values()]
+    if not all(os.path.exists(c) for c in caminhos):
+        return None
+    # Renova o mtime, como em armazenar_imagem, para a coleta não removê-las antes do commit
+    for c in caminhos:
+        os.utime(c)
+    return urls_variantes(url, arquivos)
+
+def preparar_imagem(original, lado: int):
+    """Imagem pronta para reduzir até `lado` px: EXIF aplicado e modo RGB/RGBA
+
+    No JPEG, decodifica já reduzido (escala 1/2, 1/4, 1/8) quando o original é bem maior.
+    """
+    from PIL import ImageOps
+
+    original.draft("RGB", (lado, lado))
+    imagem = ImageOps.exif_transpose(original)
+    if imagem.mode not in ("RGB", "RGBA"):
+        transparente = "A" in imagem.getbands() or "transparency" in imagem.info
+        imagem = imagem.convert("RGBA" if transparente else "RGB")
+    return imagem
+
+def salvar_imagem(imagem, formato: str, caminho: str):
+    """Grava no formato pedido (webp ou jpeg) via temporário, sem expor arquivo pela metade"""
+    from PIL import Image
+
+    diretorio, nome = os.path.split(caminho)
+    temporario = os.path.join(diretorio, f".{nome}.{os.getpid()}.{threading.get_ident()}.tmp")
+    if formato == "jpeg":
+        if imagem.mode == "RGBA":
+            # JPEG não tem transparência: aplica a imagem sobre fundo branco
+            fundo = Image.new("RGB", imagem.size, (255, 255, 255))
+            fundo.paste(imagem, mask=imagem.getchannel("A"))
+            imagem = fundo
+        imagem.save(temporario, format="JPEG", quality=THUMB_QUALITY, optimize=True, progressive=True)
+    else:
+        imagem.save(temporario, format="WEBP", quality=THUMB_QUALITY, method=4)
+    os.replace(temporario, caminho)
+
+def gerar_variantes(caminho: str) -> dict:
+    """Gera as variantes da imagem ao lado do original: {lado: {formato: nome do arquivo}}
+
+    Executada nos processos do pool. Cada tamanho parte do anterior (maior), o
+    que é bem mais barato que reduzir o original várias vezes.
+    """
+    from PIL import Image
+
+    diretorio, arquivo = os.path.split(caminho)
+    prefixo = os.path.splitext(arquivo)[0]
+    variantes = {}
+    with Image.open(caminho) as original:
+        imagem = preparar_imagem(original, THUMB_SIZES[0])
+        for lado in THUMB_SIZES:
+            imagem.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+            variantes[lado] = {}
+            for formato in THUMB_FORMATS:
+                nome = nome_variante(prefixo, lado, formato)
+                salvar_imagem(imagem, formato, os.path.join(diretorio, nome))
+                variantes[lado][formato] = nome
+    return variantes
+
+@retry_on_lock
+def gravar_variantes(destino: str, registro_id: int, url: str, variantes: dict, db: Session):
+    """Grava as variantes no registro, desde que a foto dele ainda seja a que foi processada"""
+    modelo, coluna_url, coluna_variantes = DESTINOS[destino]
+    resultado = db.execute(
+        update(modelo)
+        .where(modelo.id == registro_id, getattr(modelo, coluna_url) == url)
+        .values({coluna_variantes: variantes})
+    )
+    db.commit()
+    if destino == "usuario":
+        invalidar_usuario(registro_id)
+    return resultado.rowcount > 0
+
+def urls_variantes(url: str, arquivos: dict) -> dict:
+    """Troca os nomes de arquivo pelas URLs públicas (mesmo diretório da foto original)"""
+    base = url.rsplit("/", 1)[0]
+    return {str(lado): {formato: f"{base}/{nome}" for formato, nome in formatos.items()} for lado, formatos in arquivos.items()}
+
+def _gravar(destino: str, registro_id: int, url: str, variantes: dict):
+    db = SessionLocal()
+    try:
+        if not gravar_variantes(destino, registro_id, url, variantes, db=db):
+            logger.info("Foto de %s %s mudou antes das miniaturas ficarem prontas", destino, registro_id)
+    except Exception:
+        logger.exception("Falha ao gravar as miniaturas de %s %s", destino, registro_id)
+    finally:
+        db.close()
+
+def _concluir(destino: str, registro_id: int, url: str, caminho: str, future):
+    """Callback do pool de processos: só repassa a gravação para a thread de gravações"""
+    try:
+        variantes = urls_variantes(url, future.result())
+    except Exception:
+        logger.exception("Falha ao gerar as miniaturas de %s", caminho)
+        return
+    _gravacoes.submit(_gravar, destino, registro_id, url, variantes)
+
+def agendar_miniaturas(destino: str, registro_id: int, url: str, caminho: str):
+    """Gera as variantes da foto em segundo plano e as grava no registro quando prontas"""
+    future = _get_executor().submit(gerar_variantes, caminho)
+    future.add_done_callback(partial(_concluir, destino, registro_id, url, caminho))
+
+def regenerar_miniaturas(db: Session) -> int:
+    """Gera, no próprio processo, as variantes das fotos que ainda não têm; retorna quantas gerou"""
+    geradas = 0
+    for destino, (modelo, coluna_url, coluna_variantes) in DESTINOS.items():
+        pendentes = db.query(modelo.id, getattr(modelo, coluna_url)).filter(
+            getattr(modelo, coluna_url).isnot(None), getattr(modelo, coluna_variantes).is_(None)
+        ).all()
+        for registro_id, url in pendentes:
+            caminho = os.path.join("uploads", url.removeprefix("/static/"))
+            try:
+                variantes = urls_variantes(url, gerar_variantes(caminho))
+            except Exception as e:
+                logger.warning("Miniaturas de %s %s não geradas (%s): %s", destino, registro_id, caminho, e)
+                continue
+            geradas += gravar_variantes(destino, registro_id, url, variantes, db=db)
+    return geradas
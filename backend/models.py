@@ -1,5 +1,9 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Boolean, Float, DateTime, Text
-from sqlalchemy.orm import relationship
+import os
+import random
+from collections import Counter
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, Boolean, Float, DateTime, Text, JSON, Index, event, inspect, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, object_session, relationship
 from database import Base
 from datetime import datetime, date
 
@@ -17,6 +21,8 @@ class User(Base):
     timezone = Column(String(50), nullable=True, default="America/Sao_Paulo")
     notifications_email = Column(Boolean, nullable=False, default=True)
     profile_photo = Column(String(255), nullable=True)
+    # {"64": {"webp": url, "jpeg": url}, ...}, preenchido quando as miniaturas ficam prontas
+    profile_photo_variantes = Column(JSON, nullable=True)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -29,6 +35,8 @@ class Turma(Base):
     id = Column(Integer, primary_key=True, index=True)
     nome = Column(String(100), nullable=False)
     capacidade = Column(Integer, nullable=False)
+    # Contador desnormalizado, mantido pelos eventos de Aluno abaixo
+    alunos_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationship com alunos
     alunos = relationship("Aluno", back_populates="turma")
@@ -57,6 +65,7 @@ class Aluno(Base):
     endereco_estado = Column(String(50), nullable=True)
     endereco_cep = Column(String(10), nullable=True)
     foto_url = Column(String(255), nullable=True)
+    foto_variantes = Column(JSON, nullable=True)  # mesmo formato de User.profile_photo_variantes
     observacoes = Column(Text, nullable=True)
     data_criacao = Column(DateTime, nullable=False, default=datetime.utcnow)
     data_atualizacao = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -66,6 +75,14 @@ class Aluno(Base):
     responsaveis = relationship("Responsavel", back_populates="aluno", cascade="all, delete-orphan")
     notas = relationship("Nota", back_populates="aluno", cascade="all, delete-orphan")
     
+    # A listagem ordena por (nome, id); os filtros de turma e status usam o prefixo
+    # do índice e leem a página já ordenada, sem tabela temporária
+    __table_args__ = (
+        Index("ix_alunos_nome_id", "nome", "id"),
+        Index("ix_alunos_turma_id_nome_id", "turma_id", "nome", "id"),
+        Index("ix_alunos_status_nome_id", "status", "nome", "id"),
+    )
+    
     def __repr__(self):
         return f"<Aluno(id={self.id}, nome='{self.nome}', status='{self.status}')>"
 
@@ -73,7 +90,7 @@ class Responsavel(Base):
     __tablename__ = "responsaveis"
     
     id = Column(Integer, primary_key=True, index=True)
-    aluno_id = Column(Integer, ForeignKey("alunos.id"), nullable=False)
+    aluno_id = Column(Integer, ForeignKey("alunos.id"), nullable=False, index=True)
     nome = Column(String(80), nullable=False)
     parentesco = Column(String(40), nullable=False)  # Pai, Mãe, Responsável, Tutor
     telefone = Column(String(20), nullable=True)
@@ -99,5 +116,177 @@ class Nota(Base):
     # Relationship
     aluno = relationship("Aluno", back_populates="notas")
     
+    # Uma nota por aluno/disciplina/etapa (alvo do ON CONFLICT do lançamento em lote).
+    # Também atende as buscas por aluno_id e a listagem ordenada por disciplina/etapa.
+    __table_args__ = (
+        Index("uq_notas_aluno_disciplina_etapa", "aluno_id", "disciplina", "etapa", unique=True),
+    )
+    
+    def __repr__(self):
+        return f"<Nota(id={self.id}, aluno_id={self.aluno_id}, disciplina='{self.disciplina}', etapa='{self.etapa}', nota={self.nota})>"
+
+class Estatisticas(Base):
+    """Base das estatísticas do painel, gravada só pelo recálculo (linha única)
+
+    Os totais atuais são esta linha mais a soma de EstatisticasParcela.
+    """
+    __tablename__ = "estatisticas"
+    
+    id = Column(Integer, primary_key=True)
+    total_alunos = Column(Integer, nullable=False, default=0)
+    alunos_ativos = Column(Integer, nullable=False, default=0)
+    alunos_inativos = Column(Integer, nullable=False, default=0)
+    total_turmas = Column(Integer, nullable=False, default=0)
+    total_usuarios = Column(Integer, nullable=False, default=0)
+    total_responsaveis = Column(Integer, nullable=False, default=0)
+    total_notas = Column(Integer, nullable=False, default=0)
+    atualizado_em = Column(DateTime, nullable=False, default=datetime.utcnow)
+    recalculado_em = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
     def __repr__(self):
-        return f"<Nota(id={self.id}, aluno_id={self.aluno_id}, disciplina='{self.disciplina}', etapa='{self.etapa}', nota={self.nota})>"
\ No newline at end of file
+        return f"<Estatisticas(total_alunos={self.total_alunos}, atualizado_em={self.atualizado_em})>"
+
+ESTATISTICAS_ID = 1
+
+# Colunas somadas entre a base e as parcelas
+COLUNAS_TOTAIS = (
+    "total_alunos", "alunos_ativos", "alunos_inativos", "total_turmas",
+    "total_usuarios", "total_responsaveis", "total_notas",
+)
+
+class EstatisticasParcela(Base):
+    """Deltas das escritas desde o último recálculo, espalhados em ESTATISTICAS_PARCELAS linhas
+
+    Cada transação soma seus deltas em uma parcela sorteada, então escritas
+    concorrentes raramente disputam o lock da mesma linha.
+    """
+    __tablename__ = "estatisticas_parcelas"
+    
+    parcela = Column(Integer, primary_key=True, autoincrement=False)
+    total_alunos = Column(Integer, nullable=False, default=0)
+    alunos_ativos = Column(Integer, nullable=False, default=0)
+    alunos_inativos = Column(Integer, nullable=False, default=0)
+    total_turmas = Column(Integer, nullable=False, default=0)
+    total_usuarios = Column(Integer, nullable=False, default=0)
+    total_responsaveis = Column(Integer, nullable=False, default=0)
+    total_notas = Column(Integer, nullable=False, default=0)
+    atualizado_em = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+ESTATISTICAS_PARCELAS = int(os.getenv("ESTATISTICAS_PARCELAS", 16))
+
+# ===== CONTADORES INCREMENTAIS =====
+# Os ajustes rodam na mesma transação do flush que os originou, então
+# turmas.alunos_count e as estatísticas nunca ficam visíveis fora de
+# sincronia com as tabelas de origem. alunos_count é por turma (lock só da
+# linha da turma); os totais das estatísticas são acumulados durante o flush
+# e gravados uma vez, em uma parcela sorteada, no after_flush.
+
+COLUNAS_STATUS = {"ativo": "alunos_ativos", "inativo": "alunos_inativos"}
+
+class TurmaLotadaError(Exception):
+    """Levantada no flush quando não há mais vaga na turma de destino do aluno"""
+    def __init__(self, turma_id):
+        super().__init__(f"Turma {turma_id} já está na capacidade máxima")
+        self.turma_id = turma_id
+
+def ajustar_alunos_count(connection, turma_id, delta):
+    """Soma delta ao contador da turma; incrementos só passam se houver vagas suficientes"""
+    if turma_id is None:
+        return
+    tabela = Turma.__table__
+    stmt = (
+        update(tabela)
+        .where(tabela.c.id == turma_id)
+        .values(alunos_count=tabela.c.alunos_count + delta)
+    )
+    if delta > 0:
+        # Reserva de vaga: o UPDATE condicional é atômico na linha da turma,
+        # então matrículas concorrentes nunca ultrapassam a capacidade
+        stmt = stmt.where(tabela.c.alunos_count + delta <= tabela.c.capacidade)
+    resultado = connection.execute(stmt)
+    if delta > 0 and resultado.rowcount == 0:
+        raise TurmaLotadaError(turma_id)
+
+def ajustar_estatisticas(connection, deltas):
+    """Soma os deltas a uma parcela sorteada (também usado pelas rotas de escrita em lote)"""
+    valores = {coluna: delta for coluna, delta in deltas.items() if delta}
+    if not valores:
+        return
+    tabela = EstatisticasParcela.__table__
+    dialeto = postgresql if connection.dialect.name == "postgresql" else sqlite
+    agora = datetime.utcnow()
+    # Upsert: a parcela é criada no primeiro uso, sem passo de migração
+    stmt = dialeto.insert(tabela).values(parcela=random.randrange(ESTATISTICAS_PARCELAS), atualizado_em=agora, **valores)
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=[tabela.c.parcela],
+        set_={**{coluna: tabela.c[coluna] + stmt.excluded[coluna] for coluna in valores}, "atualizado_em": agora},
+    ))
+
+CHAVE_DELTAS = "deltas_estatisticas"
+
+def _acumular_estatisticas(connection, target, deltas):
+    """Guarda os deltas do objeto na sessão até o fim do flush (um UPDATE por flush, não por linha)"""
+    session = object_session(target)
+    if session is None:
+        # Sem sessão não há after_flush para gravar o acumulado: aplica na hora
+        ajustar_estatisticas(connection, deltas)
+        return
+    session.info.setdefault(CHAVE_DELTAS, Counter()).update(deltas)
+
+@event.listens_for(Session, "after_flush")
+def _gravar_estatisticas(session, flush_context):
+    deltas = session.info.pop(CHAVE_DELTAS, None)
+    if deltas:
+        ajustar_estatisticas(session.connection(), deltas)
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_estatisticas(session):
+    # Flush que falhou no meio: os deltas acumulados não foram gravados
+    session.info.pop(CHAVE_DELTAS, None)
+
+def _deltas_status(status, delta):
+    coluna = COLUNAS_STATUS.get(status)
+    return {coluna: delta} if coluna else {}
+
+@event.listens_for(Aluno, "after_insert")
+def _aluno_inserido(mapper, connection, target):
+    ajustar_alunos_count(connection, target.turma_id, 1)
+    _acumular_estatisticas(connection, target, {"total_alunos": 1, **_deltas_status(target.status, 1)})
+
+@event.listens_for(Aluno, "after_update")
+def _aluno_atualizado(mapper, connection, target):
+    estado = inspect(target).attrs
+    
+    historico_turma = estado.turma_id.history
+    if historico_turma.has_changes():
+        for turma_anterior in historico_turma.deleted:
+            ajustar_alunos_count(connection, turma_anterior, -1)
+        ajustar_alunos_count(connection, target.turma_id, 1)
+    
+    historico_status = estado.status.history
+    if historico_status.has_changes():
+        deltas = _deltas_status(target.status, 1)
+        for status_anterior in historico_status.deleted:
+            for coluna, delta in _deltas_status(status_anterior, -1).items():
+                deltas[coluna] = deltas.get(coluna, 0) + delta
+        _acumular_estatisticas(connection, target, deltas)
+
+@event.listens_for(Aluno, "after_delete")
+def _aluno_excluido(mapper, connection, target):
+    ajustar_alunos_count(connection, target.turma_id, -1)
+    _acumular_estatisticas(connection, target, {"total_alunos": -1, **_deltas_status(target.status, -1)})
+
+def _registrar_total(modelo, coluna):
+    """Mantém a coluna de total do snapshot em dia com inserções e exclusões do modelo"""
+    @event.listens_for(modelo, "after_insert")
+    def _inserido(mapper, connection, target):
+        _acumular_estatisticas(connection, target, {coluna: 1})
+    
+    @event.listens_for(modelo, "after_delete")
+    def _excluido(mapper, connection, target):
+        _acumular_estatisticas(connection, target, {coluna: -1})
+
+_registrar_total(Turma, "total_turmas")
+_registrar_total(User, "total_usuarios")
+_registrar_total(Responsavel, "total_responsaveis")
+_registrar_total(Nota, "total_notas")
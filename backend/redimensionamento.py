@@ -0,0 +1,147 @@
+import hmac
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import NamedTuple, Optional
+from dotenv import load_dotenv
+from imagens import DIRETORIO_UPLOADS, PASTA_BLOBS, URL_UPLOADS
+from miniaturas import EXTENSOES, preparar_imagem, salvar_imagem
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Larguras servidas por /img; a pedida é arredondada para a próxima da lista (limita as
+# combinações guardadas no cache)
+IMG_LARGURAS = sorted({int(t) for t in os.getenv("IMG_LARGURAS", "32,48,64,96,128,160,240,320,400").split(",") if t.strip()})
+IMG_FORMATOS = ("webp", "jpeg")
+# Cache em disco das imagens redimensionadas, fora de uploads/ (não é servido por /static)
+IMG_CACHE_DIR = os.getenv("IMG_CACHE_DIR", "cache_imagens")
+IMG_CACHE_MAX_BYTES = int(os.getenv("IMG_CACHE_MAX_BYTES", 100 * 1024 * 1024))
+# Ao estourar o limite, remove as menos usadas até ficar nesta fração dele
+FRACAO_APOS_LIMPEZA = 0.9
+# Intervalo mínimo entre atualizações do mtime (marca de uso do LRU) de um mesmo arquivo
+INTERVALO_TOQUE = 60  # segundos
+
+class ImagemRedimensionada(NamedTuple):
+    caminho: str
+    etag: str
+
+_lock = threading.Lock()
+_tamanho_cache = None  # bytes em disco segundo este worker; None = ainda não medido
+
+def largura_servida(largura: int) -> int:
+    """Menor largura de IMG_LARGURAS que atende a pedida (ou a maior, se nenhuma atende)"""
+    return IMG_LARGURAS[min(bisect_left(IMG_LARGURAS, largura), len(IMG_LARGURAS) - 1)]
+
+def caminho_da_url(url: str) -> str:
+    return os.path.join(DIRETORIO_UPLOADS, *url.removeprefix(URL_UPLOADS + "/").split("/"))
+
+def versao_da_foto(url: str) -> Optional[str]:
+    """Versão da foto: o hash do conteúdo, que está no nome do blob; None para fotos antigas"""
+    if not url.startswith(f"{URL_UPLOADS}/{PASTA_BLOBS}/"):
+        return None
+    return url.rsplit("/", 1)[1].split(".", 1)[0]
+
+def _origem(url: str, variantes: Optional[dict], largura: int) -> str:
+    """Arquivo de onde reduzir: a menor miniatura com folga (lado >= 2x a largura), senão o original
+
+    A folga cobre fotos em retrato, cuja miniatura é mais estreita que o lado, e melhora o
+    resultado da redução.
+    """
+    for lado in sorted((variantes or {}), key=int):
+        formatos = variantes[lado]
+        if int(lado) < 2 * largura:
+            continue
+        url_variante = formatos.get("jpeg") or formatos.get("webp")
+        if url_variante and os.path.exists(caminho_da_url(url_variante)):
+            return caminho_da_url(url_variante)
+        break
+    return caminho_da_url(url)
+
+def _reduzir(origem: str, largura: int, formato: str, destino: str):
+    from PIL import Image
+
+    with Image.open(origem) as original:
+        imagem = preparar_imagem(original, largura)
+        if imagem.width > largura:
+            altura = max(1, round(imagem.height * largura / imagem.width))
+            imagem = imagem.resize((largura, altura), Image.Resampling.LANCZOS)
+        salvar_imagem(imagem, formato, destino)
+
+def _medir_cache() -> list:
+    """(mtime, tamanho, caminho) dos arquivos do cache, do uso mais antigo ao mais recente"""
+    arquivos = []
+    for raiz, _, nomes in os.walk(IMG_CACHE_DIR):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            try:
+                info = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            arquivos.append((info.st_mtime, info.st_size, caminho))
+    arquivos.sort()
+    return arquivos
+
+def _registrar_gravacao(tamanho: int):
+    """Soma o arquivo novo ao tamanho do cache e, passando do limite, remove os menos usados
+
+    O mtime de cada arquivo marca o último uso, então a limpeza relê o diretório e vale
+    para o que todos os workers gravaram.
+    """
+    global _tamanho_cache
+    with _lock:
+        if _tamanho_cache is None:
+            _tamanho_cache = sum(t for _, t, _ in _medir_cache())
+        else:
+            _tamanho_cache += tamanho
+        if _tamanho_cache <= IMG_CACHE_MAX_BYTES:
+            return
+        arquivos = _medir_cache()
+        total = sum(t for _, t, _ in arquivos)
+        removidos = 0
+        for _, tamanho_arquivo, caminho in arquivos:
+            if total <= IMG_CACHE_MAX_BYTES * FRACAO_APOS_LIMPEZA:
+                break
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            total -= tamanho_arquivo
+            removidos += 1
+        _tamanho_cache = total
+    logger.info("Cache de imagens: %d arquivos removidos, %d bytes em uso", removidos, total)
+
+def localizar_redimensionada(url: str, largura: int, formato: str, versao_pedida: str) -> Optional[ImagemRedimensionada]:
+    """Arquivo de cache e ETag da foto em `largura` px e `formato`, sem gerá-la
+
+    None se a foto não está nos blobs ou se `versao_pedida` não é a versão atual dela: como nas URLs
+    dos blobs, só quem recebeu o hash da foto (pela API autenticada) consegue baixá-la,
+    e não basta percorrer os ids dos alunos.
+    """
+    versao = versao_da_foto(url)
+    if versao is None or not hmac.compare_digest(versao.encode(), versao_pedida.encode()):
+        return None
+    chave = f"{versao}_{largura}.{EXTENSOES[formato]}"
+    return ImagemRedimensionada(os.path.join(IMG_CACHE_DIR, versao[:2], chave), f'"{chave}"')
+
+def garantir_redimensionada(imagem: ImagemRedimensionada, url: str, variantes: Optional[dict], largura: int, formato: str) -> bool:
+    """Gera o arquivo de cache se ainda não existe; False se não há de onde gerá-lo"""
+    try:
+        info = os.stat(imagem.caminho)
+        # Marca o uso para o LRU (no máximo uma escrita por minuto por arquivo)
+        if time.time() - info.st_mtime > INTERVALO_TOQUE:
+            os.utime(imagem.caminho)
+        return True
+    except FileNotFoundError:
+        pass
+
+    origem = _origem(url, variantes, largura)
+    if not os.path.exists(origem):
+        return False
+    os.makedirs(os.path.dirname(imagem.caminho), exist_ok=True)
+    _reduzir(origem, largura, formato, imagem.caminho)
+    _registrar_gravacao(os.path.getsize(imagem.caminho))
+    return True
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, validator
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import date, datetime
 import re
 
@@ -81,6 +81,7 @@ class UserOut(BaseModel):
     timezone: Optional[str]
     notifications_email: bool
     profile_photo: Optional[str]
+    profile_photo_variantes: Optional[Dict[str, Dict[str, str]]] = None
     created_at: datetime
     
     class Config:
@@ -205,6 +206,32 @@ class NotaOut(NotaBase):
     class Config:
         from_attributes = True
 
+class NotaLoteItem(NotaBase):
+    aluno_id: int
+
+class NotaLoteRequest(BaseModel):
+    notas: List[NotaLoteItem]
+    
+    @validator('notas')
+    def validate_notas(cls, v):
+        if not v:
+            raise ValueError('Informe pelo menos uma nota')
+        if len(v) > 2000:
+            raise ValueError('O lote deve ter no máximo 2000 notas')
+        chaves = set()
+        for item in v:
+            chave = (item.aluno_id, item.disciplina, item.etapa)
+            if chave in chaves:
+                raise ValueError(f'Nota repetida no lote: aluno {item.aluno_id}, {item.disciplina}, {item.etapa}')
+            chaves.add(chave)
+        return v
+
+class NotaLoteResponse(BaseModel):
+    turma_id: int
+    total: int
+    inseridas: int
+    atualizadas: int
+
 # === ALUNO SCHEMAS ===
 
 class AlunoBase(BaseModel):
@@ -323,6 +350,7 @@ class AlunoResponse(AlunoBase):
     turma_nome: Optional[str] = None
     idade: int
     foto_url: Optional[str] = None
+    foto_variantes: Optional[Dict[str, Dict[str, str]]] = None
     data_criacao: datetime
     data_atualizacao: datetime
     
@@ -336,12 +364,35 @@ class AlunoDetalhado(AlunoResponse):
     class Config:
         from_attributes = True
 
+class AlunoPagina(BaseModel):
+    items: List[AlunoResponse] = []
+    next_cursor: Optional[str] = None
+
 # === MATRÍCULA SCHEMA ===
 
 class MatriculaRequest(BaseModel):
     aluno_id: int
     turma_id: int
 
+class MatriculaLoteRequest(BaseModel):
+    matriculas: List[MatriculaRequest]
+    
+    @validator('matriculas')
+    def validate_matriculas(cls, v):
+        if not v:
+            raise ValueError('Informe pelo menos uma matrícula')
+        return v
+
+class DistribuicaoRequest(BaseModel):
+    turma_ids: List[int]
+    aluno_ids: Optional[List[int]] = None  # Padrão: todos os alunos sem turma
+    
+    @validator('turma_ids')
+    def validate_turma_ids(cls, v):
+        if not v:
+            raise ValueError('Informe pelo menos uma turma')
+        return v
+
 # === TOKEN SCHEMAS ===
 
 class Token(BaseModel):
@@ -0,0 +1,108 @@
+from dotenv import load_dotenv
+from sqlalchemy import column, func, literal_column, select, table, text, Integer, Float
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from typing import Optional
+import os
+import re
+
+load_dotenv()
+
+# Índice FTS5 sobre alunos.nome (tabela de conteúdo externo: guarda só o índice)
+# unicode61 com remove_diacritics faz "Araujo" encontrar "Araújo"
+FTS_TABLE = "alunos_fts"
+_fts = table(FTS_TABLE, column("rowid", Integer), column("rank", Float))
+
+# Buscas que casam com mais alunos que isso são listadas por id, sem relevância: o bm25
+# é calculado linha a linha (~4 µs cada), e ordenar dezenas de milhares de "Silva" por
+# ele custa dezenas de ms para uma ordem que pouco diz
+SEARCH_MAX_RANKED = int(os.getenv("SEARCH_MAX_RANKED", 500))
+
+FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        nome,
+        content='alunos',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS alunos_fts_ai AFTER INSERT ON alunos BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, nome) VALUES (new.id, new.nome);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS alunos_fts_ad AFTER DELETE ON alunos BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, nome) VALUES ('delete', old.id, old.nome);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS alunos_fts_au AFTER UPDATE OF nome ON alunos BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, nome) VALUES ('delete', old.id, old.nome);
+        INSERT INTO {FTS_TABLE}(rowid, nome) VALUES (new.id, new.nome);
+    END""",
+]
+
+_fts_habilitado = False
+
+def init_search_index(engine):
+    """Cria o índice FTS5 e os triggers de sincronização (apenas SQLite)"""
+    global _fts_habilitado
+    if engine.dialect.name != "sqlite":
+        return
+
+    try:
+        with engine.begin() as conn:
+            existe = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"),
+                {"nome": FTS_TABLE}
+            ).first()
+            for ddl in FTS_DDL:
+                conn.execute(text(ddl))
+            # Banco já populado: indexa os alunos existentes uma única vez
+            if not existe:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    except OperationalError:
+        # SQLite compilado sem FTS5: a busca volta a usar ILIKE
+        return
+
+    _fts_habilitado = True
+
+def detectar_indice_busca(conn):
+    """Habilita a busca FTS5 se o índice já existe no banco (partida sem DDL)"""
+    global _fts_habilitado
+    if conn.dialect.name != "sqlite":
+        return
+    _fts_habilitado = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"),
+        {"nome": FTS_TABLE}
+    ).first() is not None
+
+def fts_habilitado() -> bool:
+    """Indica se o índice FTS5 está disponível para as consultas"""
+    return _fts_habilitado
+
+def montar_consulta_fts(termo: str) -> Optional[str]:
+    """Converte o texto digitado em uma consulta FTS5 de prefixos (todas as palavras)"""
+    palavras = re.findall(r"\w+", termo)
+    if not palavras:
+        return None
+    return " ".join(f'"{palavra}"*' for palavra in palavras)
+
+def _casa_com(consulta_fts: str):
+    return text(f"{FTS_TABLE} MATCH :consulta").bindparams(consulta=consulta_fts)
+
+def busca_comum(db: Session, consulta_fts: str) -> bool:
+    """Indica se a busca casa com mais de SEARCH_MAX_RANKED alunos
+
+    Conta só até o limite, lendo os ids do índice (sem bm25): ~1 ms mesmo para os
+    sobrenomes mais comuns.
+    """
+    candidatos = select(_fts.c.rowid).where(_casa_com(consulta_fts)).limit(SEARCH_MAX_RANKED + 1).subquery()
+    return db.scalar(select(func.count()).select_from(candidatos)) > SEARCH_MAX_RANKED
+
+def consulta_busca(consulta_fts: str, por_relevancia: bool = True):
+    """SELECT dos ids que casam com a busca e sua relevância (menor = melhor)
+
+    Devolvido sem virar subconsulta para que ordenação, cursor e LIMIT sejam aplicados
+    na própria consulta ao índice: só a página chega às junções com alunos e turmas.
+    Com por_relevancia=False (buscas comuns, ver busca_comum) a relevância é a constante
+    0.0: a ordem fica só pelo id, na ordem do próprio índice, e o cursor mantém o formato.
+    """
+    relevancia = _fts.c.rank if por_relevancia else literal_column("0.0", Float)
+    return select(_fts.c.rowid.label("id"), relevancia.label("relevancia")).where(_casa_com(consulta_fts))
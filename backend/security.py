@@ -1,9 +1,12 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import HTTPException, status
+import asyncio
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,15 +17,144 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 480))  # 8 horas
 
 # Configuração do hash de senha
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes com custo diferente de BCRYPT_ROUNDS são refeitos no próximo login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+_pwd_context = None
+
+def _contexto_senha():
+    """CryptContext do passlib, importado só no primeiro uso (nos processos do pool do bcrypt)"""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _pwd_context
+
+# Pool de processos dedicado ao bcrypt: tira o custo de CPU do threadpool
+# das rotas e limita quantas operações podem esperar ao mesmo tempo
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", min(4, os.cpu_count() or 1)))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", 16))
+HASH_TIMEOUT = float(os.getenv("HASH_TIMEOUT", 10))
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", 2))
+
+_hash_executor = None
+_hash_executor_lock = threading.Lock()
+_hash_capacidade = HASH_WORKERS + HASH_QUEUE_SIZE
+_hash_em_uso = 0
+_hash_em_uso_lock = threading.Lock()
+
+def _get_hash_executor() -> ProcessPoolExecutor:
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            _hash_executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        return _hash_executor
+
+def shutdown_hash_pool():
+    """Encerra o pool de processos do bcrypt (chamado no shutdown da aplicação)"""
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is not None:
+            _hash_executor.shutdown(wait=False, cancel_futures=True)
+            _hash_executor = None
+
+def _servidor_ocupado() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Servidor ocupado processando autenticações. Tente novamente em instantes.",
+        headers={"Retry-After": str(HASH_RETRY_AFTER)},
+    )
+
+def _liberar_vaga(_future=None):
+    global _hash_em_uso
+    with _hash_em_uso_lock:
+        _hash_em_uso -= 1
+
+def _submeter_hash(funcao, *args) -> Future:
+    """Agenda a função no pool do bcrypt, falhando rápido com 503 se a fila estiver cheia
+
+    A vaga só é devolvida quando o future termina (ou é cancelado): um job que estourou o
+    HASH_TIMEOUT continua ocupando um processo e, portanto, a capacidade.
+    """
+    global _hash_em_uso
+    with _hash_em_uso_lock:
+        if _hash_em_uso >= _hash_capacidade:
+            raise _servidor_ocupado()
+        _hash_em_uso += 1
+    try:
+        future = _get_hash_executor().submit(funcao, *args)
+    except BrokenProcessPool:
+        _liberar_vaga()
+        # Um worker morreu: descarta o pool para que a próxima chamada crie outro
+        shutdown_hash_pool()
+        raise _servidor_ocupado()
+    future.add_done_callback(_liberar_vaga)
+    return future
+
+def _executar_hash(funcao, *args):
+    """Executa a função no pool do bcrypt, esperando na thread atual (scripts e CLI)"""
+    future = _submeter_hash(funcao, *args)
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeoutError:
+        future.cancel()
+        raise _servidor_ocupado()
+    except BrokenProcessPool:
+        shutdown_hash_pool()
+        raise _servidor_ocupado()
+
+async def _executar_hash_async(funcao, *args):
+    """Executa a função no pool do bcrypt sem ocupar uma thread enquanto espera (rotas async)"""
+    future = _submeter_hash(funcao, *args)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), HASH_TIMEOUT)
+    except asyncio.TimeoutError:
+        # O cancelamento chega ao future do pool; se já estiver rodando, segue até o fim
+        raise _servidor_ocupado()
+    except BrokenProcessPool:
+        shutdown_hash_pool()
+        raise _servidor_ocupado()
+
+def hash_queue_stats() -> dict:
+    """Ocupação atual do pool do bcrypt"""
+    return {
+        "workers": HASH_WORKERS,
+        "capacidade": _hash_capacidade,
+        "em_uso": _hash_em_uso,
+    }
+
+# Funções executadas nos processos do pool (precisam ser de nível de módulo)
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return _contexto_senha().verify(plain_password, hashed_password)
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return _contexto_senha().verify_and_update(plain_password, hashed_password)
+
+def _hash(password: str) -> str:
+    return _contexto_senha().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica se a senha plana corresponde ao hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return _executar_hash(_verify, plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifica a senha e, se o hash estiver com custo desatualizado, retorna um novo hash"""
+    return _executar_hash(_verify_and_update, plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Gera hash da senha"""
-    return pwd_context.hash(password)
+    return _executar_hash(_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Versão assíncrona de verify_password, para as rotas async"""
+    return await _executar_hash_async(_verify, plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Versão assíncrona de verify_and_update_password, para as rotas async"""
+    return await _executar_hash_async(_verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Versão assíncrona de get_password_hash, para as rotas async"""
+    return await _executar_hash_async(_hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Cria token JWT"""
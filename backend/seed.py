@@ -1,355 +1,275 @@
-from sqlalchemy.orm import Session
-from datetime import date, datetime
+"""Popula o banco com dados sintéticos, reprodutíveis pela semente
+
+Uso:
+    python seed.py                     # 5 turmas e 20 alunos de exemplo
+    python seed.py --alunos 200000 --turmas 2000 --notas-por-aluno 40 --seed 42
+
+A mesma semente gera sempre os mesmos dados (independente de --lote). Os alunos,
+responsáveis e notas entram com INSERTs em lote, em transações de --lote alunos;
+por isso os contadores das turmas e o snapshot de estatísticas são recalculados
+ao final, já que os eventos do ORM não rodam. Os novos registros são somados aos
+que já existem no banco.
+"""
+import argparse
+import math
 import random
+import time
+import unicodedata
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, insert, text
+from sqlalchemy.orm import Session
 from database import SessionLocal, init_db
 from models import Turma, Aluno, User, Responsavel, Nota
 from security import get_password_hash
+from estatisticas import reconciliar_contadores, recalcular_estatisticas
+
+PRIMEIROS_NOMES = [
+    "Ana", "Bruno", "Carlos", "Diana", "Eduardo", "Fernanda", "Gabriel", "Helena", "Igor", "Juliana",
+    "Leonardo", "Mariana", "Nicolas", "Olívia", "Pedro", "Rafaela", "Samuel", "Tatiana", "Vitor", "Yasmin",
+    "Alice", "Arthur", "Beatriz", "Bernardo", "Cecília", "Davi", "Elisa", "Enzo", "Giovanna", "Heitor",
+    "Isabela", "João", "Júlia", "Laura", "Lorenzo", "Lucas", "Luíza", "Manuela", "Matheus", "Miguel",
+    "Natália", "Otávio", "Sofia", "Théo", "Valentina", "Vinícius", "Letícia", "Gustavo", "Lívia", "Caio",
+]
+SOBRENOMES = [
+    "Silva", "Santos", "Oliveira", "Costa", "Lima", "Sousa", "Pereira", "Martins", "Rodrigues", "Alves",
+    "Ferreira", "Gomes", "Barbosa", "Ribeiro", "Carvalho", "Dias", "Nascimento", "Moura", "Araújo", "Cardoso",
+    "Almeida", "Rocha", "Mendes", "Freitas", "Teixeira", "Correia", "Castro", "Pinto", "Monteiro", "Conceição",
+]
+NOMES_RESPONSAVEIS = {
+    "Pai": ["João", "José", "Carlos", "Roberto", "Antônio", "Fernando", "Ricardo", "Marcos", "Paulo", "Daniel"],
+    "Mãe": ["Maria", "Ana", "Fernanda", "Lúcia", "Clara", "Patrícia", "Sílvia", "Isabel", "Cláudia", "Beatriz"],
+    "Avô": ["Sebastião", "Francisco", "Raimundo", "Geraldo", "Manoel"],
+    "Avó": ["Terezinha", "Aparecida", "Rosa", "Francisca", "Luzia"],
+    "Tutor": ["Rafael", "Renata", "Márcio", "Simone", "André"],
+}
+ENDERECOS = [
+    ("Rua das Flores", "Centro", "São Paulo", "SP", "01234"),
+    ("Av. Brasil", "Vila Nova", "São Paulo", "SP", "01235"),
+    ("Rua da Paz", "Jardim América", "Campinas", "SP", "13010"),
+    ("Av. Paulista", "Bela Vista", "São Paulo", "SP", "01310"),
+    ("Rua Augusta", "Consolação", "São Paulo", "SP", "01305"),
+    ("Rua XV de Novembro", "Centro", "Curitiba", "PR", "80020"),
+    ("Av. Afonso Pena", "Funcionários", "Belo Horizonte", "MG", "30130"),
+    ("Rua da Aurora", "Boa Vista", "Recife", "PE", "50050"),
+]
+DISCIPLINAS = [
+    "Matemática", "Português", "Ciências", "História", "Geografia", "Inglês", "Educação Física",
+    "Artes", "Física", "Química", "Biologia", "Filosofia", "Sociologia",
+]
+# Etapa e data de lançamento da nota
+ETAPAS = {
+    "1B": datetime(2025, 4, 15, 10), "2B": datetime(2025, 6, 30, 10), "3B": datetime(2025, 9, 30, 10),
+    "4B": datetime(2025, 12, 10, 10), "FINAL": datetime(2025, 12, 20, 10),
+}
+# Datas fixas (não date.today()) para a mesma semente gerar o mesmo banco em qualquer dia
+DATA_REFERENCIA = date(2025, 2, 1)
+CRIADO_EM = datetime(2025, 2, 1, 8)
+
+PROPORCAO_ATIVOS = 0.9
+PROPORCAO_COM_TURMA = 0.85
 
 def criar_usuarios(db: Session):
-    """Cria usuários de exemplo"""
+    """Cria os usuários de exemplo (uma vez só)"""
     usuarios_data = [
-        {
-            "username": "admin",
-            "email": "admin@escola.com",
-            "password": "Admin123!",
-            "display_name": "Administrador",
-            "role": "admin"
-        },
-        {
-            "username": "usuario",
-            "email": "usuario@escola.com", 
-            "password": "User123!",
-            "display_name": "Usuário Padrão",
-            "role": "user"
-        },
-        {
-            "username": "thales",
-            "email": "thales@escola.com",
-            "password": "Thales123!",
-            "display_name": "Thales de Tarsis",
-            "role": "admin"
-        }
+        {"username": "admin", "email": "admin@escola.com", "password": "Admin123!", "display_name": "Administrador", "role": "admin"},
+        {"username": "usuario", "email": "usuario@escola.com", "password": "User123!", "display_name": "Usuário Padrão", "role": "user"},
+        {"username": "thales", "email": "thales@escola.com", "password": "Thales123!", "display_name": "Thales de Tarsis", "role": "admin"},
     ]
-    
-    usuarios_criados = []
+
+    existentes = {nome for (nome,) in db.query(User.username).filter(User.username.in_([u["username"] for u in usuarios_data]))}
     for user_info in usuarios_data:
-        # Verificar se já existe
-        existing = db.query(User).filter(User.username == user_info["username"]).first()
-        if not existing:
-            user = User(
-                username=user_info["username"],
-                email=user_info["email"],
-                password_hash=get_password_hash(user_info["password"]),
-                display_name=user_info["display_name"],
-                role=user_info["role"]
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-            usuarios_criados.append(user)
-            print(f"Usuário criado: {user.username} ({user.role})")
-        else:
-            usuarios_criados.append(existing)
-            print(f"Usuário já existe: {existing.username}")
-    
-    return usuarios_criados
+        if user_info["username"] in existentes:
+            print(f"Usuário já existe: {user_info['username']}")
+            continue
+        senha = user_info.pop("password")
+        db.add(User(**user_info, password_hash=get_password_hash(senha)))
+        print(f"Usuário criado: {user_info['username']} ({user_info['role']})")
+    db.commit()
 
-def criar_turmas(db: Session):
-    """Cria turmas de exemplo"""
-    turmas_data = [
-        {"nome": "1º Ano A", "capacidade": 25},
-        {"nome": "2º Ano B", "capacidade": 30},
-        {"nome": "3º Ano C", "capacidade": 28},
-        {"nome": "4º Ano A", "capacidade": 32},
-        {"nome": "5º Ano B", "capacidade": 26},
-    ]
-    
-    turmas_criadas = []
-    for turma_info in turmas_data:
-        # Verificar se já existe
-        existing = db.query(Turma).filter(Turma.nome == turma_info["nome"]).first()
-        if not existing:
-            turma = Turma(**turma_info)
-            db.add(turma)
-            db.commit()
-            db.refresh(turma)
-            turmas_criadas.append(turma)
-            print(f"Turma criada: {turma.nome}")
-        else:
-            turmas_criadas.append(existing)
-            print(f"Turma já existe: {existing.nome}")
-    
-    return turmas_criadas
+def _proximo_id(db: Session, modelo) -> int:
+    return (db.query(func.max(modelo.id)).scalar() or 0) + 1
 
-def criar_alunos(db: Session, turmas):
-    """Cria alunos de exemplo"""
-    nomes = [
-        "Ana Silva", "Bruno Santos", "Carlos Oliveira", "Diana Costa", "Eduardo Lima",
-        "Fernanda Sousa", "Gabriel Pereira", "Helena Martins", "Igor Rodrigues", "Juliana Alves",
-        "Leonardo Ferreira", "Mariana Gomes", "Nicolas Barbosa", "Olivia Ribeiro", "Pedro Carvalho",
-        "Rafaela Dias", "Samuel Nascimento", "Tatiana Moura", "Vitor Araújo", "Yasmin Cardoso"
-    ]
-    
-    emails = [
-        "ana.silva@escola.com", "bruno.santos@escola.com", "carlos.oliveira@escola.com",
-        "diana.costa@escola.com", "eduardo.lima@escola.com", "fernanda.sousa@escola.com",
-        "gabriel.pereira@escola.com", "helena.martins@escola.com", "igor.rodrigues@escola.com",
-        "juliana.alves@escola.com", "leonardo.ferreira@escola.com", "mariana.gomes@escola.com",
-        "nicolas.barbosa@escola.com", "olivia.ribeiro@escola.com", "pedro.carvalho@escola.com",
-        "rafaela.dias@escola.com", "samuel.nascimento@escola.com", "tatiana.moura@escola.com",
-        "vitor.araujo@escola.com", "yasmin.cardoso@escola.com"
-    ]
-    
-    telefones = [
-        "(11) 9 9999-0001", "(11) 9 9999-0002", "(11) 9 9999-0003", "(11) 9 9999-0004", "(11) 9 9999-0005",
-        "(11) 9 9999-0006", "(11) 9 9999-0007", "(11) 9 9999-0008", "(11) 9 9999-0009", "(11) 9 9999-0010",
-        "(11) 9 9999-0011", "(11) 9 9999-0012", "(11) 9 9999-0013", "(11) 9 9999-0014", "(11) 9 9999-0015",
-        "(11) 9 9999-0016", "(11) 9 9999-0017", "(11) 9 9999-0018", "(11) 9 9999-0019", "(11) 9 9999-0020"
-    ]
-    
-    enderecos = [
-        {"rua": "Rua das Flores", "bairro": "Centro", "cidade": "São Paulo", "estado": "SP", "cep": "01234-567"},
-        {"rua": "Av. Brasil", "bairro": "Vila Nova", "cidade": "São Paulo", "estado": "SP", "cep": "01234-568"},
-        {"rua": "Rua da Paz", "bairro": "Jardim América", "cidade": "São Paulo", "estado": "SP", "cep": "01234-569"},
-        {"rua": "Av. Paulista", "bairro": "Bela Vista", "cidade": "São Paulo", "estado": "SP", "cep": "01234-570"},
-        {"rua": "Rua Augusta", "bairro": "Consolação", "cidade": "São Paulo", "estado": "SP", "cep": "01234-571"}
-    ]
-    
-    # Gerar datas de nascimento (idades entre 6 e 18 anos)
-    hoje = date.today()
-    alunos_criados = []
-    
-    for i, nome in enumerate(nomes):
-        # Verificar se já existe
-        existing = db.query(Aluno).filter(Aluno.nome == nome).first()
-        if existing:
-            print(f"Aluno já existe: {nome}")
-            alunos_criados.append(existing)
-            continue
-        
-        # Gerar idade aleatória entre 6 e 18 anos
-        idade = random.randint(6, 18)
-        ano_nascimento = hoje.year - idade
-        mes_nascimento = random.randint(1, 12)
-        dia_nascimento = random.randint(1, 28)  # Para evitar problemas com fevereiro
-        
-        data_nascimento = date(ano_nascimento, mes_nascimento, dia_nascimento)
-        
-        # Determinar status (90% ativo, 10% inativo)
-        status = "ativo" if random.random() < 0.9 else "inativo"
-        
-        # Atribuir turma (80% dos alunos têm turma, 20% não têm)
-        turma_id = None
-        if random.random() < 0.8 and turmas:
-            turma = random.choice(turmas)
-            # Verificar se a turma não está cheia
-            alunos_na_turma = db.query(Aluno).filter(Aluno.turma_id == turma.id).count()
-            if alunos_na_turma < turma.capacidade:
-                turma_id = turma.id
-        
-        # Email opcional (70% dos alunos têm email)
-        email = emails[i] if i < len(emails) and random.random() < 0.7 else None
-        
-        # Telefone opcional (80% dos alunos têm telefone)
-        telefone = telefones[i] if i < len(telefones) and random.random() < 0.8 else None
-        telefone_emergencia = telefones[(i + 10) % len(telefones)] if telefone and random.random() < 0.5 else None
-        
-        # Endereço
-        endereco = random.choice(enderecos)
-        numero = str(random.randint(10, 999))
-        
-        aluno = Aluno(
-            nome=nome,
-            data_nascimento=data_nascimento,
-            email=email,
-            status=status,
-            turma_id=turma_id,
-            telefone=telefone,
-            telefone_emergencia=telefone_emergencia,
-            endereco_rua=endereco["rua"],
-            endereco_numero=numero,
-            endereco_bairro=endereco["bairro"],
-            endereco_cidade=endereco["cidade"],
-            endereco_estado=endereco["estado"],
-            endereco_cep=endereco["cep"]
-        )
-        
-        db.add(aluno)
-        db.commit()
-        db.refresh(aluno)
-        alunos_criados.append(aluno)
-        
-        turma_nome = aluno.turma.nome if aluno.turma else "Sem turma"
-        print(f"Aluno criado: {aluno.nome} - {aluno.status} - {turma_nome}")
-    
-    return alunos_criados
+def gerar_turmas(rng: random.Random, quantidade: int, alunos_com_turma: int, primeiro_id: int) -> list:
+    """Turmas com capacidade para os alunos que serão matriculados (e alguma sobra)"""
+    media = max(math.ceil(alunos_com_turma / quantidade), 1) if quantidade else 0
+    turmas = []
+    for i in range(quantidade):
+        nome = f"{i % 9 + 1}º Ano {chr(ord('A') + i // 9 % 26)}"
+        if i >= 9 * 26:
+            nome += f" - {i // (9 * 26) + 1}"
+        capacidade = max(media + rng.randint(media // 10, media // 4 + 2), 20)
+        turmas.append({"id": primeiro_id + i, "nome": nome, "capacidade": capacidade, "alunos_count": 0})
+    return turmas
 
-def criar_responsaveis(db: Session, alunos):
-    """Cria responsáveis de exemplo"""
-    parentescos = ["Pai", "Mãe", "Responsável", "Tutor", "Avô", "Avó"]
-    nomes_responsaveis = [
-        "João Silva", "Maria Santos", "José Oliveira", "Ana Costa", "Carlos Lima",
-        "Fernanda Sousa", "Roberto Pereira", "Lucia Martins", "Antonio Rodrigues", "Clara Alves",
-        "Fernando Ferreira", "Patricia Gomes", "Ricardo Barbosa", "Silvia Ribeiro", "Marcos Carvalho",
-        "Isabel Dias", "Paulo Nascimento", "Claudia Moura", "Daniel Araújo", "Beatriz Cardoso"
-    ]
-    
-    responsaveis_criados = []
-    
-    for aluno in alunos:
-        # Criar 1-2 responsáveis por aluno
-        num_responsaveis = random.randint(1, 2)
-        
-        for _ in range(num_responsaveis):
-            nome = random.choice(nomes_responsaveis)
-            parentesco = random.choice(parentescos)
-            
-            # Evitar responsáveis duplicados para o mesmo aluno
-            existing = db.query(Responsavel).filter(
-                Responsavel.aluno_id == aluno.id,
-                Responsavel.nome == nome
-            ).first()
-            
-            if existing:
-                continue
-            
-            # Telefone (90% têm telefone)
-            telefone = f"(11) 9 {random.randint(1000, 9999)}-{random.randint(1000, 9999)}" if random.random() < 0.9 else None
-            
-            # Email (60% têm email)
-            email = f"{nome.lower().replace(' ', '.')}@email.com" if random.random() < 0.6 else None
-            
-            # CPF (70% têm CPF)
-            documento = f"{random.randint(100, 999)}.{random.randint(100, 999)}.{random.randint(100, 999)}-{random.randint(10, 99)}" if random.random() < 0.7 else None
-            
-            responsavel = Responsavel(
-                aluno_id=aluno.id,
-                nome=nome,
-                parentesco=parentesco,
-                telefone=telefone,
-                email=email,
-                documento=documento
-            )
-            
-            db.add(responsavel)
-            responsaveis_criados.append(responsavel)
-    
-    db.commit()
-    print(f"Responsáveis criados: {len(responsaveis_criados)}")
-    return responsaveis_criados
+def _email(usuario: str, dominio: str) -> str:
+    """E-mail sem acentos nem espaços (os schemas só aceitam ASCII na parte local)"""
+    usuario = unicodedata.normalize("NFKD", usuario.lower()).encode("ascii", "ignore").decode()
+    return f"{usuario.replace(' ', '.')}@{dominio}"
+
+def _telefone(rng: random.Random) -> str:
+    return f"({rng.randint(11, 99)}) 9 {rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}"
 
-def criar_notas(db: Session, alunos):
-    """Cria notas de exemplo"""
-    disciplinas = ["Matemática", "Português", "Ciências", "História", "Geografia", "Inglês", "Educação Física"]
-    etapas = ["1B", "2B", "3B", "4B"]
-    
-    notas_criadas = []
-    
-    for aluno in alunos:
-        # Alunos ativos têm mais notas
-        if aluno.status == "ativo":
-            num_disciplinas = random.randint(3, 5)  # 3-5 disciplinas
-        else:
-            num_disciplinas = random.randint(1, 3)  # 1-3 disciplinas
-        
-        disciplinas_aluno = random.sample(disciplinas, num_disciplinas)
-        
-        for disciplina in disciplinas_aluno:
-            # Cada disciplina pode ter 1-3 etapas
-            num_etapas = random.randint(1, 3)
-            etapas_disciplina = random.sample(etapas, num_etapas)
-            
-            for etapa in etapas_disciplina:
-                # Verificar se já existe
-                existing = db.query(Nota).filter(
-                    Nota.aluno_id == aluno.id,
-                    Nota.disciplina == disciplina,
-                    Nota.etapa == etapa
-                ).first()
-                
-                if existing:
-                    continue
-                
-                # Gerar nota (média 7.0, com variação)
-                nota_base = random.uniform(4.0, 10.0)
-                # Arredondar para 1 casa decimal
-                nota = round(nota_base, 1)
-                
-                nota_obj = Nota(
-                    aluno_id=aluno.id,
-                    disciplina=disciplina,
-                    etapa=etapa,
-                    nota=nota
-                )
-                
-                db.add(nota_obj)
-                notas_criadas.append(nota_obj)
-    
+def gerar_aluno(rng: random.Random, aluno_id: int, turmas: list, vagas: list, notas_por_aluno: int) -> tuple:
+    """Linhas de um aluno, seus responsáveis e suas notas"""
+    primeiro = rng.choice(PRIMEIROS_NOMES)
+    sobrenome_mae, sobrenome_pai = rng.choice(SOBRENOMES), rng.choice(SOBRENOMES)
+    nome = f"{primeiro} {sobrenome_mae} {sobrenome_pai}"
+
+    turma_id = None
+    if turmas and rng.random() < PROPORCAO_COM_TURMA:
+        # Turma sorteada; se lotada, a próxima com vaga
+        indice = rng.randrange(len(turmas))
+        for deslocamento in range(len(turmas)):
+            candidata = (indice + deslocamento) % len(turmas)
+            if vagas[candidata] > 0:
+                vagas[candidata] -= 1
+                turma_id = turmas[candidata]["id"]
+                break
+
+    rua, bairro, cidade, estado, cep = rng.choice(ENDERECOS)
+    telefone = _telefone(rng) if rng.random() < 0.8 else None
+    aluno = {
+        "id": aluno_id,
+        "nome": nome,
+        "data_nascimento": DATA_REFERENCIA - timedelta(days=rng.randint(6 * 365, 18 * 365)),
+        "email": _email(f"{primeiro}.{sobrenome_pai}{aluno_id}", "escola.com") if rng.random() < 0.7 else None,
+        "status": "ativo" if rng.random() < PROPORCAO_ATIVOS else "inativo",
+        "turma_id": turma_id,
+        "telefone": telefone,
+        "telefone_emergencia": _telefone(rng) if telefone and rng.random() < 0.5 else None,
+        "endereco_rua": rua,
+        "endereco_numero": str(rng.randint(10, 999)),
+        "endereco_complemento": None,
+        "endereco_bairro": bairro,
+        "endereco_cidade": cidade,
+        "endereco_estado": estado,
+        "endereco_cep": f"{cep}-{rng.randint(0, 999):03d}",
+        "data_criacao": CRIADO_EM,
+        "data_atualizacao": CRIADO_EM,
+    }
+
+    responsaveis = []
+    for parentesco in (("Mãe", "Pai") if rng.random() < 0.6 else (rng.choice(list(NOMES_RESPONSAVEIS)),)):
+        nome_responsavel = f"{rng.choice(NOMES_RESPONSAVEIS[parentesco])} {sobrenome_pai if parentesco == 'Pai' else sobrenome_mae}"
+        responsaveis.append({
+            "aluno_id": aluno_id,
+            "nome": nome_responsavel,
+            "parentesco": parentesco,
+            "telefone": _telefone(rng) if rng.random() < 0.9 else None,
+            "email": _email(nome_responsavel, "email.com") if rng.random() < 0.6 else None,
+            "documento": f"{rng.randint(100, 999)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}-{rng.randint(10, 99)}" if rng.random() < 0.7 else None,
+        })
+
+    # Todas as etapas de cada disciplina cursada, até completar notas_por_aluno
+    notas = []
+    desempenho = rng.gauss(7.0, 1.2)
+    disciplinas = rng.sample(DISCIPLINAS, math.ceil(notas_por_aluno / len(ETAPAS)))
+    for disciplina in disciplinas:
+        for etapa, data_registro in ETAPAS.items():
+            if len(notas) == notas_por_aluno:
+                break
+            notas.append({
+                "aluno_id": aluno_id,
+                "disciplina": disciplina,
+                "etapa": etapa,
+                "nota": round(min(max(rng.gauss(desempenho, 1.0), 0.0), 10.0), 1),
+                "data_registro": data_registro,
+            })
+
+    return aluno, responsaveis, notas
+
+def _ajustar_sequencias(db: Session):
+    """PostgreSQL: os ids foram informados no INSERT, então as sequências precisam ser avançadas"""
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for modelo in (Turma, Aluno, Responsavel, Nota):
+        tabela = modelo.__tablename__
+        db.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{tabela}', 'id'), (SELECT COALESCE(MAX(id), 1) FROM {tabela}))"
+        ))
     db.commit()
-    print(f"Notas criadas: {len(notas_criadas)}")
-    return notas_criadas
 
-def seed_database():
-    """Função principal para popular o banco de dados"""
-    print("Iniciando seed do banco de dados...")
-    
-    # Inicializar banco
+def seed_database(alunos: int, turmas: int, notas_por_aluno: int, semente: int, lote: int):
+    """Gera usuários, turmas, alunos, responsáveis e notas e recalcula os contadores"""
     init_db()
-    
-    # Criar sessão
     db = SessionLocal()
-    
+    rng = random.Random(semente)
+    linhas = 0
+
     try:
-        # Criar usuários
-        print("\n=== CRIANDO USUÁRIOS ===")
-        usuarios = criar_usuarios(db)
-        
-        # Criar turmas
-        print("\n=== CRIANDO TURMAS ===")
-        turmas = criar_turmas(db)
-        
-        # Criar alunos
-        print("\n=== CRIANDO ALUNOS ===")
-        alunos = criar_alunos(db, turmas)
-        
-        # Criar responsáveis
-        print("\n=== CRIANDO RESPONSÁVEIS ===")
-        responsaveis = criar_responsaveis(db, alunos)
-        
-        # Criar notas
-        print("\n=== CRIANDO NOTAS ===")
-        notas = criar_notas(db, alunos)
-        
-        print("\n=== SEED CONCLUÍDO ===")
-        print(f"Total de usuários: {db.query(User).count()}")
-        print(f"Total de turmas: {db.query(Turma).count()}")
-        print(f"Total de alunos: {db.query(Aluno).count()}")
-        print(f"Alunos ativos: {db.query(Aluno).filter(Aluno.status == 'ativo').count()}")
-        print(f"Alunos inativos: {db.query(Aluno).filter(Aluno.status == 'inativo').count()}")
-        print(f"Total de responsáveis: {db.query(Responsavel).count()}")
-        print(f"Total de notas: {db.query(Nota).count()}")
-        
-        # Estatísticas por turma
-        print("\n=== ESTATÍSTICAS POR TURMA ===")
-        for turma in turmas:
-            alunos_count = db.query(Aluno).filter(Aluno.turma_id == turma.id).count()
-            ocupacao = (alunos_count / turma.capacidade) * 100 if turma.capacidade > 0 else 0
-            print(f"{turma.nome}: {alunos_count}/{turma.capacidade} alunos ({ocupacao:.1f}% ocupação)")
-        
-        # Estatísticas de notas
-        print("\n=== ESTATÍSTICAS DE NOTAS ===")
-        for disciplina in ["Matemática", "Português", "Ciências"]:
-            media = db.query(Nota).filter(Nota.disciplina == disciplina).count()
-            if media > 0:
-                notas_disciplina = db.query(Nota.nota).filter(Nota.disciplina == disciplina).all()
-                media_notas = sum([n[0] for n in notas_disciplina]) / len(notas_disciplina)
-                print(f"{disciplina}: {media} notas, média {media_notas:.1f}")
-            
+        print("=== USUÁRIOS ===")
+        criar_usuarios(db)
+        inicio = time.perf_counter()
+
+        print(f"\n=== TURMAS ({turmas}) ===")
+        dados_turmas = gerar_turmas(rng, turmas, round(alunos * PROPORCAO_COM_TURMA), _proximo_id(db, Turma))
+        if dados_turmas:
+            db.execute(insert(Turma.__table__), dados_turmas)
+            db.commit()
+        linhas += len(dados_turmas)
+        vagas = [turma["capacidade"] for turma in dados_turmas]
+
+        print(f"\n=== ALUNOS ({alunos}), RESPONSÁVEIS E NOTAS ({notas_por_aluno} por aluno) ===")
+        proximo_aluno = _proximo_id(db, Aluno)
+        for inicio_lote in range(0, alunos, lote):
+            dados_alunos, dados_responsaveis, dados_notas = [], [], []
+            for i in range(inicio_lote, min(inicio_lote + lote, alunos)):
+                aluno, responsaveis, notas = gerar_aluno(rng, proximo_aluno + i, dados_turmas, vagas, notas_por_aluno)
+                dados_alunos.append(aluno)
+                dados_responsaveis.extend(responsaveis)
+                dados_notas.extend(notas)
+
+            # Um lote por transação, em INSERTs do Core (sem o bulk do ORM); os ids já vêm
+            # definidos, então não precisa de RETURNING
+            db.execute(insert(Aluno.__table__), dados_alunos)
+            db.execute(insert(Responsavel.__table__), dados_responsaveis)
+            if dados_notas:
+                db.execute(insert(Nota.__table__), dados_notas)
+            db.commit()
+
+            linhas += len(dados_alunos) + len(dados_responsaveis) + len(dados_notas)
+            decorrido = time.perf_counter() - inicio
+            print(f"{inicio_lote + len(dados_alunos)}/{alunos} alunos, {linhas} linhas, {linhas / decorrido * 60:,.0f} linhas/min")
+
+        _ajustar_sequencias(db)
+
+        # Inserções em lote não passam pelos eventos do ORM
+        print("\n=== CONTADORES E ESTATÍSTICAS ===")
+        reconciliar_contadores(db)
+        snapshot = recalcular_estatisticas(db)
+        db.execute(text("ANALYZE"))
+        db.commit()
+
+        decorrido = time.perf_counter() - inicio
+        print(f"{linhas} linhas em {decorrido:.1f}s ({linhas / decorrido * 60:,.0f} linhas/min)")
+        print(f"Total de usuários: {snapshot.total_usuarios}")
+        print(f"Total de turmas: {snapshot.total_turmas}")
+        print(f"Total de alunos: {snapshot.total_alunos} ({snapshot.alunos_ativos} ativos, {snapshot.alunos_inativos} inativos)")
+        print(f"Total de responsáveis: {snapshot.total_responsaveis}")
+        print(f"Total de notas: {snapshot.total_notas}")
     except Exception as e:
         print(f"Erro durante o seed: {e}")
         db.rollback()
+        raise
     finally:
         db.close()
 
+def main():
+    parser = argparse.ArgumentParser(description="Popula o banco do Sistema de Gestão Escolar com dados sintéticos")
+    parser.add_argument("--alunos", type=int, default=20, help="Alunos a gerar (padrão: 20)")
+    parser.add_argument("--turmas", type=int, default=5, help="Turmas a gerar (padrão: 5)")
+    parser.add_argument("--notas-por-aluno", type=int, default=10, help="Notas por aluno (padrão: 10)")
+    parser.add_argument("--seed", type=int, default=42, help="Semente do gerador (padrão: 42)")
+    parser.add_argument("--lote", type=int, default=5000, help="Alunos por transação (padrão: 5000)")
+    args = parser.parse_args()
+
+    maximo_notas = len(DISCIPLINAS) * len(ETAPAS)
+    if not 0 <= args.notas_por_aluno <= maximo_notas:
+        parser.error(f"--notas-por-aluno deve estar entre 0 e {maximo_notas} ({len(DISCIPLINAS)} disciplinas x {len(ETAPAS)} etapas)")
+    if args.alunos < 0 or args.turmas < 0 or args.lote < 1:
+        parser.error("--alunos e --turmas não podem ser negativos e --lote deve ser positivo")
+
+    seed_database(args.alunos, args.turmas, args.notas_por_aluno, args.seed, args.lote)
+
 if __name__ == "__main__":
-    seed_database()
\ No newline at end of file
+    main()
@@ -0,0 +1,63 @@
+"""Ambiente dos testes: banco SQLite temporário, semeado com seed.py, e a API em um TestClient
+
+As variáveis de ambiente são definidas antes de importar os módulos do backend, que as
+leem na importação (o .env, se existir, não sobrescreve o que já está definido).
+"""
+import os
+import sys
+import tempfile
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+DIRETORIO_TESTES = tempfile.mkdtemp(prefix="escola-testes-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DIRETORIO_TESTES, 'app.db')}"
+os.environ["ASYNC_DATABASE_URL"] = ""
+os.environ["READ_DATABASE_URL"] = ""
+os.environ["READ_SNAPSHOT"] = "false"
+os.environ["SQL_STRICT_BUDGET"] = "true"
+os.environ["SLOW_QUERY_MS"] = "0"
+
+# Volume do banco semeado: o bastante para o planejador do SQLite (após ANALYZE) preferir
+# os índices, pequeno o bastante para o seed levar poucos segundos
+ALUNOS_SEED = 3000
+TURMAS_SEED = 60
+NOTAS_POR_ALUNO_SEED = 4
+# O seed cria só 3 usuários; com tão poucos o planejador prefere ler a tabela inteira
+USUARIOS_SEED = 300
+
+@pytest.fixture(scope="session")
+def banco():
+    """Banco semeado uma vez para toda a sessão de testes"""
+    # Uploads, cache de imagens e demais caminhos relativos ficam no diretório temporário
+    os.chdir(DIRETORIO_TESTES)
+    from sqlalchemy import insert, text
+    from database import engine
+    from models import User
+    from seed import seed_database
+
+    seed_database(ALUNOS_SEED, TURMAS_SEED, NOTAS_POR_ALUNO_SEED, semente=42, lote=1000)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {"username": f"usuario{i}", "email": f"usuario{i}@escola.com", "password_hash": "-", "role": "user"}
+            for i in range(USUARIOS_SEED)
+        ])
+        conn.execute(text("ANALYZE"))
+    # Conexões abertas durante o seed guardam as estatísticas antigas
+    engine.dispose()
+
+@pytest.fixture(scope="session")
+def cliente(banco):
+    from fastapi.testclient import TestClient
+    from app import app
+
+    with TestClient(app) as cliente:
+        yield cliente
+
+@pytest.fixture(scope="session")
+def admin(cliente):
+    """Cabeçalhos de autenticação do admin criado pelo seed"""
+    resposta = cliente.post("/auth/login", json={"username_or_email": "admin", "password": "Admin123!"})
+    assert resposta.status_code == 200, resposta.text
+    return {"Authorization": f"Bearer {resposta.json()['access_token']}"}
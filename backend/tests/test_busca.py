@@ -0,0 +1,33 @@
+"""Busca FTS5 em GET /alunos: por relevância até SEARCH_MAX_RANKED candidatos, por id acima disso"""
+import pytest
+import search
+
+def _paginas(cliente, admin, url, paginas=3) -> list:
+    itens, cursor = [], None
+    for _ in range(paginas):
+        pagina = cliente.get(url + (f"&cursor={cursor}" if cursor else ""), headers=admin).json()
+        itens += pagina["items"]
+        cursor = pagina["next_cursor"]
+        if cursor is None:
+            break
+    return itens
+
+def test_busca_rara_ordena_por_relevancia(cliente, admin):
+    itens = _paginas(cliente, admin, "/alunos?search=silva&limit=20")
+    # "Silva" repetido no nome pesa mais no bm25: esses vêm primeiro
+    repetidos = [i for i, aluno in enumerate(itens) if aluno["nome"].lower().count("silva") > 1]
+    assert repetidos and repetidos == list(range(len(repetidos)))
+    assert all("silva" in aluno["nome"].lower() for aluno in itens)
+
+def test_busca_comum_ordena_por_id(cliente, admin, monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_MAX_RANKED", 10)
+    itens = _paginas(cliente, admin, "/alunos?search=silva&limit=20")
+    ids = [aluno["id"] for aluno in itens]
+    assert len(ids) == 60 and ids == sorted(ids) and len(set(ids)) == len(ids)
+    assert all("silva" in aluno["nome"].lower() for aluno in itens)
+
+@pytest.mark.parametrize("limite", [10, 100000], ids=["comum", "rara"])
+def test_busca_com_filtro(cliente, admin, monkeypatch, limite):
+    monkeypatch.setattr(search, "SEARCH_MAX_RANKED", limite)
+    itens = _paginas(cliente, admin, "/alunos?search=silva&limit=20&status=inativo")
+    assert itens and all(aluno["status"] == "inativo" and "silva" in aluno["nome"].lower() for aluno in itens)
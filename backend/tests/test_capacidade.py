@@ -0,0 +1,85 @@
+"""Reserva de vagas sob concorrência: a turma nunca passa da capacidade
+
+Dispara as requisições ao mesmo tempo (todas as threads esperam na mesma barreira) contra
+uma turma já quase cheia: centenas de pedidos disputam as últimas VAGAS vagas. A reserva é o
+UPDATE condicional em turmas.alunos_count.
+"""
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from database import SessionLocal
+from models import Aluno, Turma
+
+CAPACIDADE = 30
+VAGAS = 3  # livres quando as requisições chegam; as demais já estão ocupadas
+TENTATIVAS = 400
+
+_sequencia = itertools.count(1)
+
+def _criar_turma() -> int:
+    """Turma com CAPACIDADE - VAGAS alunos já matriculados"""
+    n = next(_sequencia)
+    db = SessionLocal()
+    try:
+        turma = Turma(nome=f"Turma Concorrência {n}", capacidade=CAPACIDADE)
+        db.add(turma)
+        db.flush()
+        db.add_all([
+            Aluno(nome=f"Matriculado {n}-{i:02d}", data_nascimento=date(2012, 5, 10), turma_id=turma.id)
+            for i in range(CAPACIDADE - VAGAS)
+        ])
+        db.commit()
+        assert turma.alunos_count == CAPACIDADE - VAGAS
+        return turma.id
+    finally:
+        db.close()
+
+def _disparar(cliente, requisicoes: list) -> list:
+    """Envia todas as requisições em paralelo, uma por thread; devolve as respostas"""
+    barreira = threading.Barrier(len(requisicoes))
+
+    def enviar(requisicao):
+        metodo, url, corpo, cabecalhos = requisicao
+        barreira.wait()
+        return cliente.request(metodo, url, json=corpo, headers=cabecalhos)
+
+    with ThreadPoolExecutor(max_workers=len(requisicoes)) as executor:
+        return list(executor.map(enviar, requisicoes))
+
+def _conferir(respostas: list, turma_id: int, sucesso: int):
+    codigos = [resposta.status_code for resposta in respostas]
+    assert codigos.count(sucesso) == VAGAS, codigos
+    recusadas = [resposta for resposta in respostas if resposta.status_code != sucesso]
+    assert all(resposta.status_code == 400 for resposta in recusadas), [r.text for r in recusadas if r.status_code != 400]
+    assert all("capacidade" in resposta.json()["detail"] for resposta in recusadas)
+
+    db = SessionLocal()
+    try:
+        assert db.query(Aluno).filter(Aluno.turma_id == turma_id).count() == CAPACIDADE
+        assert db.get(Turma, turma_id).alunos_count == CAPACIDADE
+    finally:
+        db.close()
+
+def test_criar_alunos_concorrentes_respeita_capacidade(cliente, admin):
+    turma_id = _criar_turma()
+    requisicoes = [
+        ("POST", "/alunos", {"nome": f"Concorrente {i:03d}", "data_nascimento": "2012-05-10", "turma_id": turma_id}, admin)
+        for i in range(TENTATIVAS)
+    ]
+
+    _conferir(_disparar(cliente, requisicoes), turma_id, sucesso=201)
+
+def test_matriculas_concorrentes_respeitam_capacidade(cliente, admin):
+    turma_id = _criar_turma()
+    db = SessionLocal()
+    try:
+        alunos = [Aluno(nome=f"Sem Turma {i:03d}", data_nascimento=date(2012, 5, 10)) for i in range(TENTATIVAS)]
+        db.add_all(alunos)
+        db.commit()
+        aluno_ids = [aluno.id for aluno in alunos]
+    finally:
+        db.close()
+    requisicoes = [("POST", "/matriculas", {"aluno_id": aluno_id, "turma_id": turma_id}, admin) for aluno_id in aluno_ids]
+
+    _conferir(_disparar(cliente, requisicoes), turma_id, sucesso=200)
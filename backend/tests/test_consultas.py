@@ -0,0 +1,93 @@
+"""Número de consultas SQL por requisição: fixo, independente do tamanho da página e dos filhos
+
+A contagem vem do cabeçalho Server-Timing (desc="N consultas"), a mesma medição do
+orçamento por rota. Um N+1 reaparecendo (ou um lazy load novo) muda o número e o teste falha.
+"""
+import itertools
+import re
+from datetime import date
+import pytest
+from database import SessionLocal
+from models import Aluno, Nota, Responsavel, Turma
+
+_sequencia = itertools.count(1)
+
+# Consultas esperadas por rota, com o usuário já no cache de usuários
+CONSULTAS = {
+    "listar": 1,                  # página com turma em JOIN
+    "buscar": 2,                  # contagem limitada dos candidatos da busca, página
+    "detalhar": 3,                # aluno com turma, notas e responsáveis (selectin)
+    "criar": 5,                   # turma, INSERT, reserva da vaga, estatísticas, releitura
+    "criar_sem_turma": 3,         # INSERT, estatísticas, releitura
+    "atualizar": 4,               # aluno, turma, UPDATE, releitura
+    "atualizar_troca_turma": 6,   # mais a liberação da vaga antiga e a reserva da nova
+}
+
+def _consultas(resposta) -> int:
+    assert resposta.status_code < 300, resposta.text
+    return int(re.search(r'desc="(\d+) consultas"', resposta.headers["Server-Timing"]).group(1))
+
+@pytest.fixture
+def dados(cliente, admin):
+    """Duas turmas; um aluno com várias notas e responsáveis e outro sem nenhum"""
+    n = next(_sequencia)
+    db = SessionLocal()
+    try:
+        turmas = [Turma(nome=f"Turma Consultas {n}{letra}", capacidade=40) for letra in "AB"]
+        db.add_all(turmas)
+        db.flush()
+        com_filhos = Aluno(nome=f"Aluno Consultas {n}", data_nascimento=date(2012, 5, 10), turma_id=turmas[0].id)
+        sem_filhos = Aluno(nome=f"Aluno Sozinho {n}", data_nascimento=date(2012, 5, 10), turma_id=turmas[0].id)
+        db.add_all([com_filhos, sem_filhos])
+        db.flush()
+        db.add_all([Responsavel(aluno_id=com_filhos.id, nome=f"Responsável {p}", parentesco=p) for p in ("Mãe", "Pai")])
+        db.add_all([
+            Nota(aluno_id=com_filhos.id, disciplina=disciplina, etapa=etapa, nota=7.0)
+            for disciplina in ("Matemática", "Português") for etapa in ("1B", "2B", "3B")
+        ])
+        db.commit()
+        ids = {"turma": turmas[0].id, "outra_turma": turmas[1].id, "com_filhos": com_filhos.id, "sem_filhos": sem_filhos.id}
+    finally:
+        db.close()
+
+    # Carrega o usuário no cache, como numa sessão em uso
+    cliente.get("/auth/me", headers=admin)
+    return ids
+
+@pytest.mark.parametrize("url", [
+    "/alunos?limit=5",
+    "/alunos?limit=50",
+    "/alunos?limit=50&status=ativo",
+])
+def test_listar_alunos(cliente, admin, dados, url):
+    assert _consultas(cliente.get(url, headers=admin)) == CONSULTAS["listar"]
+
+@pytest.mark.parametrize("url", ["/alunos?limit=5&search=silva", "/alunos?limit=50&search=silva"])
+def test_buscar_alunos(cliente, admin, dados, url):
+    assert _consultas(cliente.get(url, headers=admin)) == CONSULTAS["buscar"]
+
+def test_listar_alunos_da_turma(cliente, admin, dados):
+    resposta = cliente.get(f"/alunos?limit=50&turma_id={dados['turma']}", headers=admin)
+    assert _consultas(resposta) == CONSULTAS["listar"]
+
+@pytest.mark.parametrize("aluno", ["com_filhos", "sem_filhos"])
+def test_detalhar_aluno(cliente, admin, dados, aluno):
+    resposta = cliente.get(f"/alunos/{dados[aluno]}", headers=admin)
+    assert _consultas(resposta) == CONSULTAS["detalhar"]
+
+def test_criar_aluno(cliente, admin, dados):
+    corpo = {"nome": "Aluno Novo", "data_nascimento": "2012-05-10", "turma_id": dados["turma"]}
+    assert _consultas(cliente.post("/alunos", json=corpo, headers=admin)) == CONSULTAS["criar"]
+
+def test_criar_aluno_sem_turma(cliente, admin, dados):
+    corpo = {"nome": "Aluno Novo", "data_nascimento": "2012-05-10"}
+    assert _consultas(cliente.post("/alunos", json=corpo, headers=admin)) == CONSULTAS["criar_sem_turma"]
+
+@pytest.mark.parametrize("troca_turma", [False, True], ids=["mesma_turma", "troca_turma"])
+def test_atualizar_aluno(cliente, admin, dados, troca_turma):
+    corpo = {
+        "nome": "Aluno Alterado", "data_nascimento": "2012-05-10", "status": "ativo",
+        "turma_id": dados["outra_turma"] if troca_turma else dados["turma"],
+    }
+    resposta = cliente.put(f"/alunos/{dados['com_filhos']}", json=corpo, headers=admin)
+    assert _consultas(resposta) == CONSULTAS["atualizar_troca_turma" if troca_turma else "atualizar"]
@@ -0,0 +1,19 @@
+"""Contadores incrementais das estatísticas fora do ciclo normal de flush da sessão"""
+from datetime import date
+from sqlalchemy import func, select
+from database import engine
+from models import Aluno, EstatisticasParcela, _aluno_inserido
+
+def _soma(conn, coluna) -> int:
+    return conn.scalar(select(func.coalesce(func.sum(EstatisticasParcela.__table__.c[coluna]), 0)))
+
+def test_listener_sem_sessao_aplica_deltas_na_hora(banco):
+    """Objeto sem sessão (listener chamado direto): os deltas vão para uma parcela na mesma conexão"""
+    aluno = Aluno(nome="Aluno Sem Sessão", data_nascimento=date(2012, 5, 10), status="ativo")
+    with engine.connect() as conn:
+        with conn.begin() as transacao:
+            antes = {coluna: _soma(conn, coluna) for coluna in ("total_alunos", "alunos_ativos")}
+            _aluno_inserido(Aluno.__mapper__, conn, aluno)
+            assert _soma(conn, "total_alunos") == antes["total_alunos"] + 1
+            assert _soma(conn, "alunos_ativos") == antes["alunos_ativos"] + 1
+            transacao.rollback()
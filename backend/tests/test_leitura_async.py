@@ -0,0 +1,33 @@
+"""Rotas de leitura async (/async): mesmas respostas e mesmo número de consultas das rotas sync"""
+import re
+import pytest
+
+ROTAS = [
+    "/auth/me",
+    "/alunos?limit=25",
+    "/alunos?limit=25&status=inativo",
+    "/alunos?search=silva&limit=25",
+    "/alunos/1",
+    "/alunos/999999999",
+    "/turmas",
+    "/estatisticas",
+]
+
+def _consultas(resposta) -> int:
+    return int(re.search(r'desc="(\d+) consultas"', resposta.headers["Server-Timing"]).group(1))
+
+@pytest.mark.parametrize("url", ROTAS)
+def test_rota_async_igual_a_sync(cliente, admin, url):
+    cliente.get("/auth/me", headers=admin)  # usuário no cache nas duas chamadas
+    sync = cliente.get(url, headers=admin)
+    assincrona = cliente.get(f"/async{url}", headers=admin)
+    assert assincrona.status_code == sync.status_code
+    assert assincrona.json() == sync.json()
+    assert _consultas(assincrona) == _consultas(sync)
+
+def test_stream_async_igual_a_sync(cliente, admin):
+    url = "/alunos?stream=true&limit=50&status=ativo"
+    sync = cliente.get(url, headers=admin)
+    assincrona = cliente.get(f"/async{url}", headers=admin)
+    assert assincrona.headers["content-type"] == sync.headers["content-type"]
+    assert assincrona.text == sync.text
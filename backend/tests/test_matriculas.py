@@ -0,0 +1,62 @@
+"""Distribuição de alunos entre turmas (POST /matriculas/distribuir)"""
+import itertools
+from datetime import date
+from database import SessionLocal
+from models import Aluno, Turma
+
+_sequencia = itertools.count(1)
+
+def _criar(capacidades: list, alunos_por_turma: list, sem_turma: int) -> tuple:
+    """Turmas com as capacidades e ocupações dadas, mais alunos sem turma; devolve os ids"""
+    n = next(_sequencia)
+    db = SessionLocal()
+    try:
+        turmas = [Turma(nome=f"Turma Distribuição {n}-{i}", capacidade=c) for i, c in enumerate(capacidades)]
+        db.add_all(turmas)
+        db.flush()
+        matriculados = [
+            [Aluno(nome=f"Matriculado {n}-{t}-{i}", data_nascimento=date(2012, 5, 10), turma_id=turma.id) for i in range(quantos)]
+            for t, (turma, quantos) in enumerate(zip(turmas, alunos_por_turma))
+        ]
+        livres = [Aluno(nome=f"Livre {n}-{i}", data_nascimento=date(2012, 5, 10)) for i in range(sem_turma)]
+        db.add_all([aluno for grupo in matriculados for aluno in grupo] + livres)
+        db.commit()
+        return [t.id for t in turmas], [[a.id for a in grupo] for grupo in matriculados], [a.id for a in livres]
+    finally:
+        db.close()
+
+def _ocupacao(turma_ids: list) -> dict:
+    db = SessionLocal()
+    try:
+        return {
+            turma_id: (db.get(Turma, turma_id).alunos_count, db.query(Aluno).filter(Aluno.turma_id == turma_id).count())
+            for turma_id in turma_ids
+        }
+    finally:
+        db.close()
+
+def test_aluno_ja_na_turma_devolve_a_vaga(cliente, admin):
+    # Turma de 2 vagas com 1 aluno: ele fica e ainda sobra a vaga para um dos livres
+    turma_ids, (matriculados,), livres = _criar([2], [1], 2)
+    corpo = {"turma_ids": turma_ids, "aluno_ids": matriculados + livres}
+    resposta = cliente.post("/matriculas/distribuir", json=corpo, headers=admin)
+    assert resposta.status_code == 200, resposta.text
+    assert resposta.json()["nao_alocados"] == [livres[1]]
+    assert _ocupacao(turma_ids) == {turma_ids[0]: (2, 2)}
+
+def test_aluno_ja_na_turma_nao_perde_a_vaga(cliente, admin):
+    # Turma cheia; o livre vem antes na lista, mas a única vaga continua com quem já a ocupa
+    turma_ids, (matriculados,), livres = _criar([1], [1], 1)
+    corpo = {"turma_ids": turma_ids, "aluno_ids": livres + matriculados}
+    resposta = cliente.post("/matriculas/distribuir", json=corpo, headers=admin)
+    assert resposta.status_code == 200, resposta.text
+    assert resposta.json()["nao_alocados"] == livres
+    assert _ocupacao(turma_ids) == {turma_ids[0]: (1, 1)}
+
+def test_redistribui_entre_turmas(cliente, admin):
+    # Uma turma cheia e outra vazia: a redistribuição dos mesmos alunos equilibra as duas
+    turma_ids, (cheia, _), _ = _criar([4, 4], [4, 0], 0)
+    resposta = cliente.post("/matriculas/distribuir", json={"turma_ids": turma_ids, "aluno_ids": cheia}, headers=admin)
+    assert resposta.status_code == 200, resposta.text
+    assert resposta.json()["nao_alocados"] == []
+    assert _ocupacao(turma_ids) == {turma_ids[0]: (2, 2), turma_ids[1]: (2, 2)}
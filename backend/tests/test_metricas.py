@@ -0,0 +1,10 @@
+"""GET /metrics: requisições em andamento rotuladas pelo template da rota"""
+import re
+
+def test_em_andamento_por_rota(cliente, admin):
+    cliente.get("/alunos/1", headers=admin)
+    texto = cliente.get("/metrics").text
+    em_andamento = dict(re.findall(r'^http_requests_in_flight\{method="GET",route="([^"]+)"\} (\d+)$', texto, re.M))
+    # A própria coleta está em andamento; a requisição anterior já terminou
+    assert em_andamento == {"/metrics": "1"}
+    assert 'http_request_duration_seconds_count{method="GET",route="/alunos/{aluno_id}"}' in texto
@@ -0,0 +1,127 @@
+"""Regressão dos planos de consulta: nenhuma instrução das rotas lê uma tabela inteira
+
+Cada rota é chamada contra o banco semeado; as instruções que ela executa (nas engines
+síncrona e assíncrona) passam por EXPLAIN QUERY PLAN, com os mesmos parâmetros, e o teste
+falha em qualquer SCAN sem índice (mesma regra do log de consultas lentas).
+"""
+import itertools
+from datetime import date
+import pytest
+from sqlalchemy import event
+from database import SessionLocal, async_engine, engine
+from consultas_lentas import _plano, _tabelas_varridas
+from models import Aluno, Nota, Responsavel, Turma
+
+_sequencia = itertools.count(1)
+
+# (nome, método, URL, corpo); URL e corpo são montados com os ids criados pela fixture `dados`
+ROTAS = [
+    ("listar", "GET", "/alunos", None),
+    ("listar_pagina", "GET", "/alunos?limit=25", None),
+    ("listar_cursor", "GET", "/alunos?limit=25&cursor={cursor}", None),
+    ("listar_turma", "GET", "/alunos?limit=25&turma_id={turma_seed}", None),
+    ("listar_status", "GET", "/alunos?limit=25&status=inativo", None),
+    ("listar_turma_status", "GET", "/alunos?limit=25&turma_id={turma_seed}&status=ativo", None),
+    ("listar_stream", "GET", "/alunos?stream=true&limit=50&status=ativo", None),
+    ("buscar", "GET", "/alunos?search=silva&limit=25", None),
+    ("buscar_turma", "GET", "/alunos?search=silva&limit=25&turma_id={turma_seed}", None),
+    ("buscar_cursor", "GET", "/alunos?search=silva&limit=25&cursor={cursor_busca}", None),
+    ("detalhar", "GET", "/alunos/{aluno}", None),
+    ("criar", "POST", "/alunos", lambda d: {"nome": "Aluno Criado", "data_nascimento": "2012-05-10", "turma_id": d["turma"]}),
+    ("atualizar", "PUT", "/alunos/{aluno}", lambda d: {"nome": "Aluno Alterado", "data_nascimento": "2012-05-10", "turma_id": d["turma"], "status": "inativo"}),
+    ("excluir", "DELETE", "/alunos/{aluno}", None),
+    ("listar_notas", "GET", "/alunos/{aluno}/notas", None),
+    ("criar_nota", "POST", "/alunos/{aluno}/notas", lambda d: {"aluno_id": d["aluno"], "disciplina": "História", "etapa": "2B", "nota": 8.5}),
+    ("atualizar_nota", "PUT", "/notas/{nota}", lambda d: {"disciplina": "Matemática", "etapa": "1B", "nota": 9.0}),
+    ("excluir_nota", "DELETE", "/notas/{nota}", None),
+    ("lancar_notas_lote", "POST", "/turmas/{turma}/notas/lote", lambda d: {"notas": [
+        {"aluno_id": d["aluno"], "disciplina": "Matemática", "etapa": "1B", "nota": 6.0},
+        {"aluno_id": d["aluno"], "disciplina": "Artes", "etapa": "FINAL", "nota": 10.0},
+    ]}),
+    ("criar_responsavel", "POST", "/alunos/{aluno}/responsaveis", lambda d: {"aluno_id": d["aluno"], "nome": "Maria Planos", "parentesco": "Mãe"}),
+    ("atualizar_responsavel", "PUT", "/responsaveis/{responsavel}", lambda d: {"nome": "João Planos", "parentesco": "Pai"}),
+    ("excluir_responsavel", "DELETE", "/responsaveis/{responsavel}", None),
+    ("listar_turmas", "GET", "/turmas", None),
+    ("criar_turma", "POST", "/turmas", lambda d: {"nome": f"Turma Criada {next(_sequencia)}", "capacidade": 30}),
+    ("matricular", "POST", "/matriculas", lambda d: {"aluno_id": d["sem_turma"], "turma_id": d["turma"]}),
+    ("matricular_lote", "POST", "/matriculas/lote", lambda d: {"matriculas": [{"aluno_id": d["sem_turma"], "turma_id": d["turma"]}]}),
+    ("distribuir", "POST", "/matriculas/distribuir", lambda d: {"turma_ids": [d["turma"]], "aluno_ids": [d["sem_turma"]]}),
+    ("estatisticas", "GET", "/estatisticas", None),
+    ("recalcular_estatisticas", "POST", "/admin/estatisticas/recalcular", None),
+    ("me", "GET", "/auth/me", None),
+    ("login", "POST", "/auth/login", lambda d: {"username_or_email": "admin", "password": "Admin123!"}),
+]
+
+# Leituras que, por definição, percorrem a tabela toda; qualquer outra varredura é regressão
+VARREDURAS_ESPERADAS = {
+    ("listar_turmas", "turmas"): "GET /turmas devolve todas as turmas",
+    ("estatisticas", "turmas"): "a ocupação de todas as turmas faz parte da resposta",
+    ("estatisticas", "estatisticas"): "linha única",
+    ("estatisticas", "estatisticas_parcelas"): "ESTATISTICAS_PARCELAS linhas, somadas na leitura",
+    ("recalcular_estatisticas", "turmas"): "o recálculo conta e lista todas as turmas",
+    ("recalcular_estatisticas", "estatisticas"): "linha única",
+    ("recalcular_estatisticas", "estatisticas_parcelas"): "o recálculo zera todas as parcelas",
+}
+
+@pytest.fixture
+def dados(cliente, admin):
+    """Turma própria com um aluno (com nota e responsável) e um aluno sem turma, mais ids do seed"""
+    n = next(_sequencia)
+    db = SessionLocal()
+    try:
+        turma = Turma(nome=f"Turma Planos {n}", capacidade=40)
+        db.add(turma)
+        db.flush()
+        aluno = Aluno(nome=f"Aluno Planos {n}", data_nascimento=date(2012, 5, 10), turma_id=turma.id)
+        sem_turma = Aluno(nome=f"Aluno Sem Turma {n}", data_nascimento=date(2012, 5, 10))
+        db.add_all([aluno, sem_turma])
+        db.flush()
+        responsavel = Responsavel(aluno_id=aluno.id, nome="Responsável Planos", parentesco="Mãe")
+        nota = Nota(aluno_id=aluno.id, disciplina="Matemática", etapa="1B", nota=7.0)
+        db.add_all([responsavel, nota])
+        db.commit()
+        turma_seed = db.query(Turma.id).filter(Turma.alunos_count > 0).order_by(Turma.id).first()[0]
+        ids = {
+            "turma": turma.id, "aluno": aluno.id, "sem_turma": sem_turma.id,
+            "responsavel": responsavel.id, "nota": nota.id, "turma_seed": turma_seed,
+        }
+    finally:
+        db.close()
+
+    ids["cursor"] = cliente.get("/alunos?limit=25", headers=admin).json()["next_cursor"]
+    ids["cursor_busca"] = cliente.get("/alunos?search=silva&limit=25", headers=admin).json()["next_cursor"]
+    return ids
+
+@pytest.fixture
+def instrucoes(dados):
+    """Instruções executadas durante o teste, nas duas engines (depois de montados os dados)"""
+    capturadas = []
+
+    def capturar(conn, cursor, instrucao, parametros, contexto, executemany):
+        if executemany:
+            parametros = parametros[0] if parametros else ()
+        capturadas.append((instrucao, parametros))
+
+    alvos = [engine, async_engine.sync_engine]
+    for alvo in alvos:
+        event.listen(alvo, "before_cursor_execute", capturar)
+    yield capturadas
+    for alvo in alvos:
+        event.remove(alvo, "before_cursor_execute", capturar)
+
+@pytest.mark.parametrize("nome, metodo, url, corpo", ROTAS, ids=[rota[0] for rota in ROTAS])
+def test_rota_usa_indices(cliente, admin, dados, instrucoes, nome, metodo, url, corpo):
+    resposta = cliente.request(
+        metodo, url.format(**dados), headers=admin, json=corpo(dados) if corpo else None
+    )
+    assert resposta.status_code < 300, resposta.text
+
+    varreduras = []
+    with engine.connect() as conn:
+        for instrucao, parametros in list(instrucoes):
+            plano = _plano(conn, instrucao, parametros)
+            for tabela in _tabelas_varridas(conn.dialect.name, plano):
+                if (nome, tabela) not in VARREDURAS_ESPERADAS:
+                    varreduras.append(f"{tabela}: {' '.join(instrucao.split())[:300]}\n    {plano}")
+
+    assert not varreduras, "Varredura completa de tabela:\n" + "\n".join(varreduras)
@@ -189,6 +189,22 @@ const getInitials = (name) => {
     return name.split(' ').map(n => n[0]).join('').toUpperCase().slice(0, 2);
 };
 
+// Miniatura WebP do tamanho pedido, quando já gerada; senão a foto original
+const getFotoUrl = (url, variantes, lado) => {
+    const variante = variantes && variantes[String(lado)];
+    return `${API_BASE_URL}${(variante && variante.webp) || url}`;
+};
+
+// Foto do aluno redimensionada pelo servidor (/img), que exige o hash da foto em v;
+// fotos antigas (fora de /static/blobs) ficam com a miniatura de 64px
+const getAvatarAlunoUrl = (aluno, largura) => {
+    if (!aluno.foto_url.startsWith('/static/blobs/')) {
+        return getFotoUrl(aluno.foto_url, aluno.foto_variantes, 64);
+    }
+    const versao = aluno.foto_url.split('/').pop().split('.')[0];
+    return `${API_BASE_URL}/img/alunos/${aluno.id}?w=${largura}&fmt=webp&v=${versao}`;
+};
+
 // === TOAST SYSTEM ===
 const showToast = (message, type = 'info', duration = 5000) => {
     const toastContainer = document.getElementById('toastContainer');
@@ -375,7 +391,7 @@ const updateUserInterface = () => {
     const avatarFallback = userInitials.parentElement;
 
     if (user.profile_photo) {
-        userAvatarImg.src = `${API_BASE_URL}${user.profile_photo}`;
+        userAvatarImg.src = getFotoUrl(user.profile_photo, user.profile_photo_variantes, 64);
         userAvatarImg.style.display = 'block';
         avatarFallback.style.display = 'none';
     } else {
@@ -533,7 +549,7 @@ const openPerfilModal = async () => {
     const photoPlaceholder = photoInitials.parentElement;
 
     if (user.profile_photo) {
-        currentPhoto.src = `${API_BASE_URL}${user.profile_photo}`;
+        currentPhoto.src = getFotoUrl(user.profile_photo, user.profile_photo_variantes, 160);
         currentPhoto.style.display = 'block';
         photoPlaceholder.style.display = 'none';
     } else {
@@ -648,6 +664,7 @@ const setupPerfilHandlers = () => {
             
             // Atualizar usuário atual
             currentState.currentUser.profile_photo = response.photo_url;
+            currentState.currentUser.profile_photo_variantes = null;
             localStorage.setItem('userMeta', JSON.stringify(currentState.currentUser));
             
             updateUserInterface();
@@ -741,6 +758,11 @@ const renderAlunos = () => {
             </button>
             
             <div class="aluno-header">
+                <div class="aluno-avatar">
+                    ${aluno.foto_url ? `
+                    <img src="${getAvatarAlunoUrl(aluno, 48)}" srcset="${getAvatarAlunoUrl(aluno, 96)} 2x" width="48" height="48" loading="lazy" alt="">
+                    ` : `<span class="avatar-fallback">${getInitials(aluno.nome)}</span>`}
+                </div>
                 <h3 class="aluno-nome">${aluno.nome}</h3>
                 <span class="aluno-status ${aluno.status}">${aluno.status}</span>
             </div>
@@ -851,7 +873,7 @@ const openDetalhesModal = async (alunoId) => {
         const photoPlaceholder = document.getElementById('alunoPhotoInitials').parentElement;
         
         if (aluno.foto_url) {
-            currentPhoto.src = `${API_BASE_URL}${aluno.foto_url}`;
+            currentPhoto.src = getFotoUrl(aluno.foto_url, aluno.foto_variantes, 400);
             currentPhoto.style.display = 'block';
             photoPlaceholder.style.display = 'none';
         } else {
@@ -1157,6 +1179,7 @@ const setupFotoAlunoHandler = () => {
             
             // Atualizar dados do aluno
             currentState.currentAlunoDetalhes.foto_url = response.foto_url;
+            currentState.currentAlunoDetalhes.foto_variantes = null;
             
             e.target.reset();
             showToast('Foto atualizada com sucesso!', 'success');